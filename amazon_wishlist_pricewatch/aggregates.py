@@ -0,0 +1,219 @@
+"""Rolling price aggregates of each item, for alert rules over a window of
+days such as "lowest price in 30 days" (see `alerts.py`).
+
+Rather than the history of every price observed, `PriceStats` keeps for each
+ASIN the time and price it was last seen at, and the lowest price, sum of
+prices and count of observations in each bucket of `BUCKET_DAYS` days, for
+up to `MAX_WINDOW_DAYS` days. Recording an observation updates the newest
+bucket, or starts one and drops any that have fallen out of the longest
+window, so takes constant time however long an item has been watched.
+
+The aggregates of a window are combined from the buckets it covers, so a
+window starts on a bucket boundary: a 30 day window covers the current
+bucket and as many earlier ones as make up 30 days, so spans between 27 and
+30 days of observations.
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from my_types import MinorUnits
+    from prices import OUT_OF_STOCK
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .my_types import MinorUnits
+    from .prices import OUT_OF_STOCK
+
+# Width of each bucket of observations.
+BUCKET_DAYS = 3
+# Longest window aggregates are kept for.
+MAX_WINDOW_DAYS = 90
+_BUCKET_SECONDS = BUCKET_DAYS * 24 * 60 * 60
+_MAX_BUCKETS = MAX_WINDOW_DAYS // BUCKET_DAYS
+
+
+class Window(NamedTuple):
+    """Aggregates of the prices of an item observed in a window of days.
+
+    Attributes:
+        low: Lowest price observed in the window, in minor units.
+        mean: Mean of the prices observed in the window, in minor units.
+        count: Number of prices observed in the window. Out of stock
+            observations aren't counted.
+        last_seen: Time the item was last observed, as seconds since the
+            epoch. May be before the window.
+        last_price: Price the item was last observed at, in minor units.
+    """
+
+    low: MinorUnits
+    mean: float
+    count: int
+    last_seen: float
+    last_price: MinorUnits
+
+
+class WindowColumns(NamedTuple):
+    """Aggregates of a window of days for a column of items, aligned with
+    the columns of prices evaluated by `alerts.RuleSet`.
+
+    Attributes:
+        lows: Lowest price of each item in the window, or 0 if none observed.
+        means: Mean price of each item in the window, or 0 if none observed.
+        last_prices: Price each item was last observed at, or
+            `prices.OUT_OF_STOCK` if never observed.
+    """
+
+    lows: List[MinorUnits]
+    means: List[float]
+    last_prices: List[MinorUnits]
+
+
+def bucket_of(when: float) -> int:
+    """Return the index of the bucket time ``when`` falls in."""
+    return int(when // _BUCKET_SECONDS)
+
+
+def window_buckets(days: int) -> int:
+    """Return the number of buckets a window of ``days`` covers."""
+    return max(1, min(math.ceil(days / BUCKET_DAYS), _MAX_BUCKETS))
+
+
+class PriceStats:
+    """Rolling price aggregates of each item, by ASIN.
+
+    Args:
+        stats_path: Optional; Path of the json file the aggregates are saved
+            to. Defaults to `price_stats.json` on the same path as this source
+            file.
+
+    Attributes:
+        stats_path: Path of the json file the aggregates are saved to.
+        items: `[last_seen, last_price, buckets]` of each item, keyed by ASIN,
+            where each bucket is `[index, low, total, count]`, oldest first.
+    """
+
+    def __init__(self, stats_path: Optional[Union[str, Path]] = None):
+        """Init PriceStats, loading `stats_path` if it exists."""
+        if stats_path is None:
+            stats_path = Path(Path(__file__).parent, "price_stats.json")
+        self.stats_path = Path(stats_path).resolve()
+        try:
+            with open(self.stats_path, "r") as stats_json:
+                self.items: Dict[str, List] = json.load(stats_json)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.items = {}
+        self._changed = False
+
+    def observe(self, asin: str, price: MinorUnits, now: float) -> None:
+        """Record that item ``asin`` was seen at ``price`` at time ``now``.
+
+        Out of stock observations only update when the item was last seen.
+        """
+        self._changed = True
+        record = self.items.get(asin)
+        if record is None:
+            record = self.items[asin] = [now, price, []]
+        else:
+            record[0] = now
+            record[1] = price
+        if price == OUT_OF_STOCK:
+            return
+        buckets = record[2]
+        current = bucket_of(now)
+        if buckets and buckets[-1][0] == current:
+            bucket = buckets[-1]
+            bucket[1] = min(bucket[1], price)
+            bucket[2] += price
+            bucket[3] += 1
+        else:
+            buckets.append([current, price, price, 1])
+            # At most one bucket is added per observation, so at most one
+            # is dropped on average.
+            while buckets[0][0] <= current - _MAX_BUCKETS:
+                del buckets[0]
+
+    def observe_many(
+        self, observations: Iterable[Tuple[str, MinorUnits]], now: float
+    ) -> None:
+        """``observe`` each `(asin, price)` of ``observations`` at ``now``."""
+        for asin, price in observations:
+            self.observe(asin, price, now)
+
+    def window(self, asin: str, days: int, now: float) -> Optional[Window]:
+        """Return the aggregates of item ``asin`` over the window of ``days``
+        up to ``now``, or `None` if it has never been observed.
+        """
+        record = self.items.get(asin)
+        if record is None:
+            return None
+        first = bucket_of(now) - window_buckets(days) + 1
+        low = 0
+        total = 0
+        count = 0
+        for index, bucket_low, bucket_total, bucket_count in reversed(record[2]):
+            if index < first:
+                break
+            low = bucket_low if count == 0 else min(low, bucket_low)
+            total += bucket_total
+            count += bucket_count
+        return Window(
+            low=MinorUnits(low),
+            mean=total / count if count else 0.0,
+            count=count,
+            last_seen=record[0],
+            last_price=MinorUnits(record[1]),
+        )
+
+    def columns(self, asins: Sequence[str], days: int, now: float) -> WindowColumns:
+        """Return the aggregates of each of ``asins`` over the window of
+        ``days`` up to ``now``, as aligned columns.
+        """
+        columns = WindowColumns([], [], [])
+        for asin in asins:
+            window = self.window(asin, days, now)
+            if window is None:
+                columns.lows.append(MinorUnits(0))
+                columns.means.append(0.0)
+                columns.last_prices.append(OUT_OF_STOCK)
+            else:
+                columns.lows.append(window.low)
+                columns.means.append(window.mean)
+                columns.last_prices.append(window.last_price)
+        return columns
+
+    def save(self, now: Optional[float] = None) -> None:
+        """Save the aggregates to `stats_path`.
+
+        Items not seen for longer than `MAX_WINDOW_DAYS` are dropped, so items
+        no longer on a wishlist don't accumulate. Written to a temporary file
+        first, so a crash never leaves a partly written file. Skipped if
+        nothing has been observed since last loaded or saved.
+
+        Args:
+            now: Optional; Time to expire items against. Defaults to now.
+        """
+        if not self._changed:
+            return
+        import tempfile
+        import time
+
+        if now is None:
+            now = time.time()
+        oldest = now - MAX_WINDOW_DAYS * 24 * 60 * 60
+        self.items = {
+            asin: record for asin, record in self.items.items() if record[0] >= oldest
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.stats_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as stats_json:
+                json.dump(self.items, stats_json)
+            os.replace(temp_path, self.stats_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._changed = False
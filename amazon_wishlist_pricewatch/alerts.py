@@ -0,0 +1,352 @@
+"""Rules deciding which price changes are alerted on.
+
+By default an alert is sent when an item's price falls below the lowest
+price seen for it on previous runs. An optional `alerts` section of
+`config.json` replaces this with a list of rules, each of which may be
+limited to some items (by ASIN) or wishlists (by URL or ID):
+
+    "alerts": {
+      "rules": [
+        {"type": "target_price", "price": "25.00", "asins": ["B000000001"]},
+        {"type": "percent_drop", "percent": 20},
+        {"type": "back_in_stock"},
+        {"type": "window_low", "days": 30},
+        {"type": "below_average", "percent": 15, "days": 90},
+        {"type": "min_drop", "amount": "5.00",
+         "wishlists": ["https://www.amazon.co.uk/hz/wishlist/ls/F1RSTL1ST"]}
+      ]
+    }
+
+Rules are compiled once into a `RuleSet`, which evaluates all of them over
+the aligned columns of old (lowest seen) and new prices in a single batch,
+with NumPy if it is installed, otherwise in pure Python. Each item alerts on
+the first rule, in the order listed, that fires for it.
+
+Prices are compared in integer minor units (see `prices.py`). Every rule
+but the window rules only fires for an item whose price has fallen below its
+lowest seen price, so an item is alerted on at most once for each new low.
+
+The window rules compare the price against the item's rolling aggregates
+over a number of `days` (see `aggregates.py`): `window_low` fires for the
+lowest price in that many days, and `below_average` for a price at least
+`percent` below the average over them. They only fire for an item whose
+price has fallen since it was last seen, so aren't alerted on again each
+run the price stays low.
+"""
+
+import re
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from aggregates import MAX_WINDOW_DAYS, WindowColumns
+    from my_types import MinorUnits
+    from prices import OUT_OF_STOCK, to_minor_units
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .aggregates import MAX_WINDOW_DAYS, WindowColumns
+    from .my_types import MinorUnits
+    from .prices import OUT_OF_STOCK, to_minor_units
+
+# Rule types, and the config key holding each one's threshold, if any.
+RULE_TYPES: Dict[str, Optional[str]] = {
+    "new_low": None,
+    "percent_drop": "percent",
+    "target_price": "price",
+    "min_drop": "amount",
+    "back_in_stock": None,
+    "window_low": None,
+    "below_average": "percent",
+}
+# Window of days each window rule covers when not given.
+DEFAULT_DAYS = {"window_low": 30, "below_average": 90}
+# Rule used when `config.json` has no `alerts` section.
+DEFAULT_RULES = [{"type": "new_low"}]
+
+_WISHLIST_ID_RE = re.compile(r"/ls/([^/?#]+)")
+_ITEM_WISHLIST_ID_RE = re.compile(r"[?&](?:amp;)?colid=([^&#]+)")
+
+
+class Rule(NamedTuple):
+    """A compiled alert rule.
+
+    Attributes:
+        name: Name of the rule, reported with each item it fires for.
+        type: One of `RULE_TYPES`.
+        threshold: The rule's percentage, or price or amount in minor units.
+            0 for rules without a threshold.
+        asins: ASINs the rule is limited to, or `None` for all items.
+        wishlists: IDs of the wishlists the rule is limited to, or `None` for
+            all wishlists.
+        days: Window of days a window rule covers. 0 for other rules.
+    """
+
+    name: str
+    type: str
+    threshold: float
+    asins: Optional[FrozenSet[str]]
+    wishlists: Optional[FrozenSet[str]]
+    days: int = 0
+
+    def fires(
+        self,
+        old: MinorUnits,
+        new: MinorUnits,
+        window: Optional[Tuple[MinorUnits, float, MinorUnits]] = None,
+    ) -> bool:
+        """Return whether the rule fires for an item whose lowest seen price
+        was ``old`` and whose price is now ``new``.
+
+        ``window`` is the `(low, mean, last price)` of the item over the
+        rule's `days`, as in `aggregates.WindowColumns`. Needed by window
+        rules.
+        """
+        if self.days:
+            low, mean, last_price = window  # type: ignore
+            if new >= last_price:
+                return False
+            if self.type == "window_low":
+                return new < low
+            return mean > 0 and new * 100 <= mean * (100 - self.threshold)
+        if new >= old:
+            return False
+        if self.type == "new_low":
+            return True
+        if self.type == "back_in_stock":
+            return old == OUT_OF_STOCK
+        if self.type == "target_price":
+            return new <= self.threshold < old
+        if old == OUT_OF_STOCK:
+            # No previous price to measure a drop from.
+            return False
+        if self.type == "min_drop":
+            return old - new >= self.threshold
+        return new * 100 <= old * (100 - self.threshold)
+
+    def mask(self, numpy, old, new, window=None):
+        """``fires`` over NumPy arrays of ``old`` and ``new`` prices, and
+        ``window`` as a tuple of arrays.
+        """
+        if self.days:
+            low, mean, last_price = window
+            fires = new < last_price
+            if self.type == "window_low":
+                fires &= new < low
+            else:
+                fires &= (mean > 0) & (new * 100.0 <= mean * (100.0 - self.threshold))
+            return fires
+        fires = new < old
+        if self.type == "back_in_stock":
+            fires &= old == OUT_OF_STOCK
+        elif self.type == "target_price":
+            fires &= (new <= self.threshold) & (old > self.threshold)
+        elif self.type != "new_low":
+            fires &= old != OUT_OF_STOCK
+            if self.type == "min_drop":
+                fires &= old - new >= self.threshold
+            else:
+                # As floats, so old * 100 can't overflow on large prices.
+                fires &= new * 100.0 <= old * (100.0 - self.threshold)
+        return fires
+
+    def applies_to(self, asin: str, wishlist: Optional[str]) -> bool:
+        """Return whether the rule covers item ``asin`` from ``wishlist``."""
+        return (self.asins is None or asin in self.asins) and (
+            self.wishlists is None or wishlist in self.wishlists
+        )
+
+
+def wishlist_id(url: str) -> str:
+    """Return the ID of the wishlist at ``url``, or ``url`` if it is an ID."""
+    match = _WISHLIST_ID_RE.search(url)
+    return match.group(1) if match else url
+
+
+def item_wishlist_id(item_url: str) -> Optional[str]:
+    """Return the ID of the wishlist an item's URL was found on, from its
+    `colid` query parameter, or `None`.
+    """
+    match = _ITEM_WISHLIST_ID_RE.search(item_url)
+    return match.group(1) if match else None
+
+
+def compile_rule(rule_config: Dict, position: int = 0) -> Rule:
+    """Compile one rule from the `alerts` section of `config.json`.
+
+    Args:
+        rule_config: The rule, e.g. `{"type": "percent_drop", "percent": 20}`.
+        position: Index of the rule in the list, used to name unnamed rules.
+
+    Raises:
+        ValueError: The rule's type is unknown or its threshold is invalid.
+    """
+    rule_type = rule_config.get("type", "new_low")
+    if rule_type not in RULE_TYPES:
+        raise ValueError(
+            f"Unknown alert rule type {rule_type!r}."
+            f" Expected one of {', '.join(RULE_TYPES)}."
+        )
+    threshold_key = RULE_TYPES[rule_type]
+    threshold: float = 0
+    if threshold_key is not None:
+        if threshold_key not in rule_config:
+            raise ValueError(f"Alert rule {rule_type!r} needs a {threshold_key!r}.")
+        if threshold_key == "percent":
+            threshold = float(rule_config[threshold_key])
+            if not 0 < threshold <= 100:
+                raise ValueError(
+                    f"Alert rule percent must be above 0 and at most 100,"
+                    f" not {threshold}."
+                )
+        else:
+            threshold = to_minor_units(rule_config[threshold_key])
+    days = 0
+    if rule_type in DEFAULT_DAYS:
+        days = int(rule_config.get("days", DEFAULT_DAYS[rule_type]))
+        if not 0 < days <= MAX_WINDOW_DAYS:
+            raise ValueError(
+                f"Alert rule days must be above 0 and at most {MAX_WINDOW_DAYS},"
+                f" not {days}."
+            )
+    asins = rule_config.get("asins")
+    wishlists = rule_config.get("wishlists")
+    return Rule(
+        name=rule_config.get("name", f"{rule_type}:{position}"),
+        type=rule_type,
+        threshold=threshold,
+        asins=frozenset(asins) if asins is not None else None,
+        wishlists=(
+            frozenset(wishlist_id(url) for url in wishlists)
+            if wishlists is not None
+            else None
+        ),
+        days=days,
+    )
+
+
+class RuleSet:
+    """Alert rules compiled from `config.json`, evaluated in batch.
+
+    Args:
+        rule_configs: Optional; The `rules` list of the `alerts` section of
+            `config.json`. Defaults to `DEFAULT_RULES`.
+
+    Attributes:
+        rules: The compiled `Rule` objects, in order of precedence.
+        by_wishlist: Whether any rule is limited to some wishlists, so the
+            URL of each item is needed to evaluate them.
+        window_days: The windows of days covered by window rules, whose
+            aggregates are needed to evaluate them.
+
+    Raises:
+        ValueError: A rule is invalid (see ``compile_rule``).
+    """
+
+    def __init__(self, rule_configs: Optional[List[Dict]] = None):
+        """Compiles the rules."""
+        if rule_configs is None:
+            rule_configs = DEFAULT_RULES
+        self.rules = [
+            compile_rule(rule_config, i) for i, rule_config in enumerate(rule_configs)
+        ]
+        self.by_wishlist = any(rule.wishlists is not None for rule in self.rules)
+        self.window_days = tuple(sorted({rule.days for rule in self.rules} - {0}))
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "RuleSet":
+        """Compile the rules of the loaded ``config``."""
+        return cls(config.get("alerts", {}).get("rules"))
+
+    def evaluate(
+        self,
+        asins: Sequence[str],
+        old: Sequence[MinorUnits],
+        new: Sequence[MinorUnits],
+        urls: Optional[Sequence[str]] = None,
+        windows: Optional[Dict[int, WindowColumns]] = None,
+    ) -> List[Tuple[int, str]]:
+        """Find the items any rule fires for.
+
+        Args:
+            asins: ASIN of each item.
+            old: Lowest seen price of each item, in minor units.
+            new: Current price of each item, in minor units.
+            urls: Optional; URL of each item. Needed if ``by_wishlist``.
+            windows: Optional; Aggregates of each item over each of
+                `window_days`, keyed by days. Needed if there are any.
+
+        Returns:
+            A list of `(index, rule name)` tuples, in index order, for each
+            item a rule fires for, naming the first rule to fire for it.
+
+        Raises:
+            ValueError: ``urls`` or ``windows`` are needed but not given.
+        """
+        if urls is None and self.by_wishlist:
+            raise ValueError("Item URLs are needed by rules limited to wishlists.")
+        windows = windows or {}
+        if any(days not in windows for days in self.window_days):
+            raise ValueError("Price aggregates are needed by window rules.")
+        wishlists: Sequence[Optional[str]] = (
+            [item_wishlist_id(url) for url in urls]
+            if self.by_wishlist and urls is not None
+            else [None] * len(asins)
+        )
+        try:
+            import numpy  # type: ignore
+        except ImportError:
+            return self._evaluate_python(asins, wishlists, old, new, windows)
+        return self._evaluate_numpy(numpy, asins, wishlists, old, new, windows)
+
+    def _evaluate_python(
+        self, asins, wishlists, old, new, windows
+    ) -> List[Tuple[int, str]]:
+        fired = []
+        for i, (o, n) in enumerate(zip(old, new)):
+            if n >= o and not self.window_days:
+                # No rule fires unless the price has fallen.
+                continue
+            for rule in self.rules:
+                window = None
+                if rule.days:
+                    columns = windows[rule.days]
+                    window = (columns.lows[i], columns.means[i], columns.last_prices[i])
+                if rule.applies_to(asins[i], wishlists[i]) and rule.fires(o, n, window):
+                    fired.append((i, rule.name))
+                    break
+        return fired
+
+    def _evaluate_numpy(
+        self, numpy, asins, wishlists, old, new, windows
+    ) -> List[Tuple[int, str]]:
+        old_array = numpy.fromiter(old, dtype=numpy.int64, count=len(old))
+        new_array = numpy.fromiter(new, dtype=numpy.int64, count=len(new))
+        window_arrays = {
+            days: (
+                numpy.fromiter(columns.lows, dtype=numpy.int64, count=len(old)),
+                numpy.fromiter(columns.means, dtype=numpy.float64, count=len(old)),
+                numpy.fromiter(columns.last_prices, dtype=numpy.int64, count=len(old)),
+            )
+            for days, columns in windows.items()
+            if days in self.window_days
+        }
+        # Index of the first rule to fire for each item, or -1. Filled from the
+        # last rule to the first, so earlier rules take precedence.
+        first = numpy.full(len(old_array), -1, dtype=numpy.int64)
+        for position in range(len(self.rules) - 1, -1, -1):
+            rule = self.rules[position]
+            fires = rule.mask(numpy, old_array, new_array, window_arrays.get(rule.days))
+            if rule.asins is not None or rule.wishlists is not None:
+                fires &= numpy.fromiter(
+                    (
+                        rule.applies_to(asin, wishlist)
+                        for asin, wishlist in zip(asins, wishlists)
+                    ),
+                    dtype=bool,
+                    count=len(asins),
+                )
+            first[fires] = position
+        return [
+            (i, self.rules[first[i]].name)
+            for i in numpy.flatnonzero(first >= 0).tolist()
+        ]
@@ -0,0 +1,106 @@
+"""Run passes of the program on an interval in a single long-running process.
+
+Run with ``pricewatch --daemon`` as an alternative to scheduling `pricewatch`
+with cron / Task Scheduler. The interpreter, imports, config, web session
+and previous run's wishlist all stay in memory between passes.
+"""
+
+import random
+import signal
+import threading
+import time
+from typing import Callable
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from logger import logger
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .logger import logger
+
+DEFAULT_INTERVAL_MINUTES = 60.0
+DEFAULT_JITTER = 0.1
+
+
+class Daemon:
+    """Call ``run_pass`` repeatedly until stopped.
+
+    Passes start ``interval`` seconds apart, varied randomly by up to
+    ``jitter`` of the interval either way so requests to Amazon don't fall
+    at exactly the same time each run. A pass taking longer than that is
+    followed straight away by the next. A pass which raises an exception is
+    logged and the next pass is run as normal.
+
+    SIGTERM and SIGINT stop the daemon once any pass in progress finishes. A
+    second signal is handled as normal, e.g. to stop immediately.
+
+    Args:
+        run_pass: Callable running one full pass of the program.
+        interval: Seconds between the start of each pass.
+        jitter: Optional; Fraction of ``interval`` to randomly vary it by.
+
+    Attributes:
+        run_pass: Callable running one full pass of the program.
+        interval: Seconds between the start of each pass.
+        jitter: Fraction of ``interval`` to randomly vary it by.
+        stopping: Set when the daemon has been asked to stop.
+    """
+
+    def __init__(
+        self,
+        run_pass: Callable[[], None],
+        interval: float,
+        jitter: float = DEFAULT_JITTER,
+    ):
+        """Init the Daemon."""
+        if interval <= 0:
+            raise ValueError("interval must be greater than 0.")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be at least 0 and less than 1.")
+        self.run_pass = run_pass
+        self.interval = interval
+        self.jitter = jitter
+        self.stopping = threading.Event()
+
+    def next_delay(self) -> float:
+        """Return the jittered number of seconds until the next pass."""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def stop(self, signum=None, frame=None) -> None:
+        """Stop the daemon once any pass in progress finishes.
+
+        Can be used as a signal handler, in which case the default handler for
+        the signal is restored.
+        """
+        if signum is not None:
+            logger.info(
+                f"Received {signal.Signals(signum).name}. Stopping after this pass."
+            )
+            signal.signal(signum, signal.SIG_DFL)
+        self.stopping.set()
+
+    def run(self) -> None:
+        """Run passes until stopped. Blocks until then."""
+        if threading.current_thread() is threading.main_thread():
+            previous_handlers = {
+                signum: signal.signal(signum, self.stop)
+                for signum in (signal.SIGTERM, signal.SIGINT)
+            }
+        else:
+            previous_handlers = {}
+        try:
+            while not self.stopping.is_set():
+                started = time.monotonic()
+                try:
+                    self.run_pass()
+                except Exception:
+                    logger.exception("Pass failed. Trying again next pass.")
+                if not self.stopping.is_set():
+                    # Measured from the start of the pass just run.
+                    delay = max(0.0, self.next_delay() - (time.monotonic() - started))
+                    logger.info(f"Next pass in {delay / 60:.1f} minutes.")
+                    self.stopping.wait(delay)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        logger.info("Daemon stopped.")
@@ -0,0 +1,520 @@
+"""Concurrent fetching of many wishlists with per-domain rate limiting.
+
+Pages of a single wishlist have to be requested in order, as the link to each
+page is only found on the page before it. Separate wishlists are independent
+of one another though, so `FetchEngine` crawls them side by side on an asyncio
+event loop. Blocking requests are handed to a thread pool, a semaphore bounds
+the number of requests in flight, and a `TokenBucket` per domain replaces the
+fixed sleep between pages. Within a wishlist the next page is requested while
+the current one is being parsed.
+
+Amazon throttles clients which request too much, with "503 Service
+Unavailable" / "429 Too Many Requests" responses or a captcha page in place
+of the wishlist. ``throttle_reason`` spots these before they reach a parser.
+When a domain throttles, its `TokenBucket` halves its rate and slowly
+recovers, failed requests are retried after ``retry_delay`` without holding
+up requests to other domains (see `RetryLater`), and a `CircuitBreaker`
+stops requests to the domain altogether after repeated failures.
+"""
+
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+# asyncio and concurrent.futures are imported where used, so they're only
+# loaded once wishlists are crawled rather than on every start up.
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+# Matches the average of the 1000-2000ms sleep previously used between pages.
+DEFAULT_REQUESTS_PER_SECOND = 1 / 1.5
+DEFAULT_BURST = 1
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_RETRY_SECONDS = 2.0
+MAX_RETRY_SECONDS = 120.0
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET_SECONDS = 600.0
+# A throttled domain's rate may be halved down to this fraction of the rate
+# set, and steps back up by this fraction with each successful request.
+MIN_RATE_FRACTION = 1 / 16
+RATE_RECOVERY_STEP = 1 / 8
+# Found in Amazon's captcha ("Robot Check") page, never in a wishlist.
+CAPTCHA_MARKERS = (
+    b"/errors/validateCaptcha",
+    b"api-services-support@amazon.com",
+)
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def rebase_url(url: str, base_url: str) -> str:
+    """Return ``url`` with its scheme and host replaced by those of
+    ``base_url``, e.g. to request pages from a `replay.ReplayServer`.
+    """
+    base = urlsplit(base_url)
+    return urlunsplit(urlsplit(url)._replace(scheme=base.scheme, netloc=base.netloc))
+
+
+class ThrottledError(Exception):
+    """A response shows the site is throttling requests.
+
+    Args:
+        url: URL requested.
+        reason: Why the response was taken as throttling.
+        retry_after: Optional; Seconds the site asked to wait before retrying.
+
+    Attributes:
+        url: URL requested.
+        reason: Why the response was taken as throttling.
+        retry_after: Seconds the site asked to wait before retrying, or `None`.
+    """
+
+    def __init__(self, url: str, reason: str, retry_after: Optional[float] = None):
+        """Init ThrottledError."""
+        super().__init__(f"{url} throttled: {reason}")
+        self.url = url
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RetryLater(Exception):
+    """A request failed, and is to be made again after a delay.
+
+    Raised by the ``fetch_page`` of a `FetchEngine`, which waits out the delay
+    without holding a slot, then retries.
+
+    Args:
+        url: URL requested.
+        attempt: Number of the attempt which failed, from 1.
+        delay: Seconds to wait before retrying.
+
+    Attributes:
+        url: URL requested.
+        attempt: Number of the attempt which failed, from 1.
+        delay: Seconds to wait before retrying.
+    """
+
+    def __init__(self, url: str, attempt: int, delay: float):
+        """Init RetryLater."""
+        super().__init__(f"Attempt {attempt} to request {url} failed.")
+        self.url = url
+        self.attempt = attempt
+        self.delay = delay
+
+
+class CircuitOpenError(Exception):
+    """Requests to a domain are stopped by its open `CircuitBreaker`."""
+
+
+def accept_encoding() -> str:
+    """Return the `Accept-Encoding` header to send with requests.
+
+    Brotli ("br"), which compresses pages smaller than gzip, is only offered
+    if a brotli decoder (`brotli` or `brotlicffi`) is installed for urllib3
+    to decode responses with.
+    """
+    import importlib.util
+
+    encodings = ["gzip", "deflate"]
+    if any(importlib.util.find_spec(name) for name in ("brotli", "brotlicffi")):
+        encodings.append("br")
+    return ", ".join(encodings)
+
+
+def throttle_reason(response: Any) -> Optional[str]:
+    """Return why ``response`` looks like throttling, or `None` if it doesn't.
+
+    Args:
+        response: A `requests.Response`, or anything with `status_code` and
+            `content` attributes.
+    """
+    if response.status_code in THROTTLE_STATUS_CODES:
+        return f"HTTP {response.status_code}"
+    content = response.content or b""
+    if any(marker in content for marker in CAPTCHA_MARKERS):
+        return "captcha"
+    return None
+
+
+def retry_after(response: Any) -> Optional[float]:
+    """Return the seconds given by a `Retry-After` header of ``response``, or
+    `None` if there isn't one in seconds.
+    """
+    value = response.headers.get("Retry-After", "")
+    return float(value) if value.strip().isdigit() else None
+
+
+def retry_delay(
+    attempt: int,
+    retry_seconds: float = DEFAULT_RETRY_SECONDS,
+    retry_after: Optional[float] = None,
+) -> float:
+    """Return the seconds to wait before retrying a request.
+
+    Doubles with each attempt up to `MAX_RETRY_SECONDS`, with "full jitter"
+    so clients retrying at once spread out. Never sooner than ``retry_after``.
+
+    Args:
+        attempt: Number of attempts made so far, from 1.
+        retry_seconds: Optional; Delay before jitter after the first attempt.
+        retry_after: Optional; Seconds the site asked to wait.
+    """
+    delay = random.uniform(
+        0, min(MAX_RETRY_SECONDS, retry_seconds * 2 ** (attempt - 1))
+    )
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, MAX_RETRY_SECONDS))
+    return delay
+
+
+class TokenBucket:
+    """Limit the rate of requests made to a single domain.
+
+    Tokens are added at ``rate`` per second up to ``capacity``. Each request
+    takes one token. When none are left the caller is told how long to wait
+    for the next one, with the token reserved for it so concurrent callers
+    queue up behind each other rather than all waking at once.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Optional; Max tokens held, i.e. the largest burst of
+            requests allowed without waiting. Defaults to 1.
+
+    Attributes:
+        rate: Tokens added per second. Lowered by ``slow_down``.
+        max_rate: The rate set, which ``speed_up`` returns to.
+        capacity: Max tokens held.
+        tokens: Tokens currently available. Negative when callers are waiting.
+    """
+
+    def __init__(self, rate: float, capacity: float = DEFAULT_BURST):
+        """Init the TokenBucket, starting full."""
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0.")
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def slow_down(self) -> None:
+        """Halve the rate, down to `MIN_RATE_FRACTION` of `max_rate`."""
+        with self._lock:
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def speed_up(self) -> None:
+        """Step the rate back up towards `max_rate`."""
+        with self._lock:
+            self.rate = min(
+                self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP
+            )
+
+    def wait(self) -> None:
+        """Block the calling thread until a token is available."""
+        time.sleep(self.reserve())
+
+    async def acquire(self) -> None:
+        """Wait on the event loop until a token is available."""
+        import asyncio
+
+        await asyncio.sleep(self.reserve())
+
+
+class CircuitBreaker:
+    """Stop requests to a domain after repeated failures.
+
+    After ``failures`` failed requests in a row the breaker opens, and
+    requests are refused with `CircuitOpenError` for ``reset_seconds``. Then a
+    request is let through to try the domain again. If it fails the breaker
+    opens again straight away, if it succeeds the breaker closes.
+
+    Args:
+        failures: Optional; Failed requests in a row which open the breaker.
+        reset_seconds: Optional; Seconds the breaker stays open.
+
+    Attributes:
+        failures: Failed requests in a row which open the breaker.
+        reset_seconds: Seconds the breaker stays open.
+        consecutive_failures: Failed requests since the last success.
+        opened_at: `time.monotonic` time the breaker opened, or `None` if
+            closed.
+    """
+
+    def __init__(
+        self,
+        failures: int = DEFAULT_BREAKER_FAILURES,
+        reset_seconds: float = DEFAULT_BREAKER_RESET_SECONDS,
+    ):
+        """Init the CircuitBreaker, closed."""
+        if failures < 1:
+            raise ValueError("failures must be at least 1.")
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def check(self, url: str) -> None:
+        """Raise `CircuitOpenError` if requests to ``url`` should not be made."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(
+                    f"Not requesting {url} for another {remaining:.0f}s after"
+                    f" {self.consecutive_failures} failed requests."
+                )
+            # Let this request through. One more failure opens it again.
+            self.opened_at = None
+            self.consecutive_failures = self.failures - 1
+
+    def record_success(self) -> None:
+        """Close the breaker."""
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        """Count a failed request, opening the breaker after `failures`."""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failures:
+                self.opened_at = time.monotonic()
+
+
+class FetchEngine:
+    """Crawl many wishlists concurrently.
+
+    Each wishlist is crawled page by page. Once a page is fetched the URL of
+    the next page is found, and the next page is requested while the current
+    one is parsed. All wishlists are crawled at the same time, limited by
+    ``max_concurrency`` requests in flight and by one `TokenBucket` per
+    domain. Pages are parsed on ``parse_concurrency`` worker threads. With
+    the default of one, ``parse_page`` is never called concurrently;
+    otherwise it must be thread safe, and up to that many pages of each
+    wishlist are parsed at once, while the page following them is
+    requested. ``fetch_page`` makes one attempt, using the domain's
+    `TokenBucket` and `CircuitBreaker` from ``bucket_for`` and
+    ``breaker_for``. To have it retried it raises `RetryLater`, and is called
+    again with the URL and the next attempt number once the delay has passed,
+    after taking a new token and slot, so a request waiting to be retried
+    never holds up others.
+
+    Args:
+        fetch_page: Blocking callable returning the response for a page URL,
+            or raising `RetryLater`. Called with the number of the attempt as
+            well when retrying. Typically ``PriceWatch.request_page_once``.
+        parse_page: Blocking callable which parses a response, typically
+            ``PriceWatch.parse_page``.
+        next_page_url: Callable returning the URL of the page following a
+            response, or `None` on the last page. Typically
+            ``pricewatch.find_next_page_url``.
+        max_concurrency: Optional; Max number of requests in flight at once.
+        requests_per_second: Optional; Request rate allowed per domain.
+        burst: Optional; Number of requests to a domain allowed back to back.
+        breaker_failures: Optional; Failed requests in a row which stop
+            requests to a domain. See `CircuitBreaker`.
+        breaker_reset_seconds: Optional; Seconds requests to a domain are
+            stopped for.
+        parse_concurrency: Optional; Max number of pages parsed at once.
+
+    Attributes:
+        max_concurrency: Max number of requests in flight at once.
+        requests_per_second: Request rate allowed per domain.
+        burst: Number of requests to a domain allowed back to back.
+        breaker_failures: Failed requests in a row which stop requests to a
+            domain.
+        breaker_reset_seconds: Seconds requests to a domain are stopped for.
+        parse_concurrency: Max number of pages parsed at once.
+        buckets: `TokenBucket` for each domain seen, keyed by domain.
+        breakers: `CircuitBreaker` for each domain seen, keyed by domain.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[str], Any],
+        parse_page: Callable[[Any], None],
+        next_page_url: Callable[[Any], Optional[str]],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        burst: int = DEFAULT_BURST,
+        breaker_failures: int = DEFAULT_BREAKER_FAILURES,
+        breaker_reset_seconds: float = DEFAULT_BREAKER_RESET_SECONDS,
+        parse_concurrency: int = 1,
+    ):
+        """Init the FetchEngine."""
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if parse_concurrency < 1:
+            raise ValueError("parse_concurrency must be at least 1.")
+        self.fetch_page = fetch_page
+        self.parse_page = parse_page
+        self.next_page_url = next_page_url
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.parse_concurrency = parse_concurrency
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._domains_lock = threading.Lock()
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        """Return the `TokenBucket` for the domain of ``url``."""
+        domain = urlparse(url).netloc
+        with self._domains_lock:
+            if domain not in self.buckets:
+                self.buckets[domain] = TokenBucket(self.requests_per_second, self.burst)
+            return self.buckets[domain]
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        """Return the `CircuitBreaker` for the domain of ``url``."""
+        domain = urlparse(url).netloc
+        with self._domains_lock:
+            if domain not in self.breakers:
+                self.breakers[domain] = CircuitBreaker(
+                    self.breaker_failures, self.breaker_reset_seconds
+                )
+            return self.breakers[domain]
+
+    def run(
+        self, wishlist_urls: Iterable[str], return_exceptions: bool = False
+    ) -> Dict[str, Exception]:
+        """Crawl every wishlist in ``wishlist_urls``, blocking until done.
+
+        Args:
+            wishlist_urls: First page URL of each wishlist.
+            return_exceptions: Optional; If True, a wishlist which fails
+                doesn't stop the others. Pages of it parsed before it failed
+                are kept.
+
+        Returns:
+            The exception each failed wishlist raised, keyed by its URL. Empty
+            unless ``return_exceptions``.
+
+        Raises:
+            Exception: The first exception raised by ``fetch_page`` or
+                ``parse_page`` for any wishlist, unless ``return_exceptions``.
+        """
+        import asyncio
+
+        return asyncio.run(self._crawl_all(list(wishlist_urls), return_exceptions))
+
+    async def _crawl_all(
+        self, wishlist_urls: List[str], return_exceptions: bool = False
+    ) -> Dict[str, Exception]:
+        """Crawl all wishlists on the running event loop."""
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        wishlist_urls = list(dict.fromkeys(wishlist_urls))
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency
+        ) as fetch_executor, ThreadPoolExecutor(
+            max_workers=self.parse_concurrency
+        ) as parse_executor:
+            results = await asyncio.gather(
+                *(
+                    self._crawl(url, semaphore, fetch_executor, parse_executor)
+                    for url in wishlist_urls
+                ),
+                return_exceptions=return_exceptions,
+            )
+        failures = {}
+        for url, result in zip(wishlist_urls, results):
+            if isinstance(result, Exception):
+                failures[url] = result
+            elif isinstance(result, BaseException):
+                raise result
+        return failures
+
+    async def _fetch(
+        self, url: str, semaphore: "asyncio.Semaphore", executor: "ThreadPoolExecutor"
+    ) -> Any:
+        """Fetch ``url`` once its domain's rate limit allows, retrying as
+        long as ``fetch_page`` raises `RetryLater`.
+        """
+        import asyncio
+        import functools
+
+        loop = asyncio.get_running_loop()
+        fetch_page = functools.partial(self.fetch_page, url)
+        while True:
+            # Wait for the domain's token before taking a slot, and for a retry
+            # without one, so a slow domain never holds up requests to the
+            # others.
+            await self.bucket_for(url).acquire()
+            async with semaphore:
+                try:
+                    return await loop.run_in_executor(executor, fetch_page)
+                except RetryLater as retry:
+                    delay = retry.delay
+                    fetch_page = functools.partial(
+                        self.fetch_page, url, retry.attempt + 1
+                    )
+            await asyncio.sleep(delay)
+
+    async def _crawl(
+        self,
+        url: str,
+        semaphore: "asyncio.Semaphore",
+        fetch_executor: "ThreadPoolExecutor",
+        parse_executor: "ThreadPoolExecutor",
+    ) -> None:
+        """Crawl every page of the wishlist starting at ``url``."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        # Pages being parsed, oldest first.
+        parsing: List["asyncio.Future"] = []
+        prefetch = None
+        try:
+            response = await self._fetch(url, semaphore, fetch_executor)
+            while response is not None:
+                next_url = self.next_page_url(response)
+                prefetch = (
+                    asyncio.ensure_future(
+                        self._fetch(next_url, semaphore, fetch_executor)
+                    )
+                    if next_url
+                    else None
+                )
+                if len(parsing) >= self.parse_concurrency:
+                    await parsing.pop(0)
+                parsing.append(
+                    loop.run_in_executor(parse_executor, self.parse_page, response)
+                )
+                # Drop the page handed to the parser before waiting on the next
+                # one, so only the pages being parsed are held.
+                response = None
+                if prefetch:
+                    response = await prefetch
+                    prefetch = None
+            while parsing:
+                await parsing.pop(0)
+        except BaseException:
+            if prefetch:
+                prefetch.cancel()
+            for future in parsing:
+                future.cancel()
+            raise
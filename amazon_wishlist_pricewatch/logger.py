@@ -1,28 +1,177 @@
+"""Logging for the program, kept off the paths doing the work.
+
+Records are put on a queue by a `QueueHandler` on the root `logger`, and
+formatted and written to the console and the rotating log file by a
+`QueueListener` on a thread of its own, so a slow disk or terminal doesn't
+hold up requesting and parsing pages. Nothing is installed on import:
+handlers are only added by ``setup_logging``.
+
+Records may carry the structured fields in `FIELDS`, given with ``fields``
+as the `extra` of a logging call, e.g.
+``logger.info("...", extra=fields(wishlist=url, stage="parse_page"))``.
+With ``setup_logging(json_logs=True)`` the log file holds one json object
+per record, including these fields, for log shippers to index.
+
+Rather than a record per item, which adds up for large wishlists, a single
+record names a sample of the items concerned (see ``sample``).
+"""
+
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+LOG_PATH = Path(Path(__file__).parent.resolve(), "pricewatch.log")
+# Structured fields a record may carry, see ``fields``.
+FIELDS = ("wishlist", "page", "stage")
+# Most values named in a record aggregating many, see ``sample``.
+SAMPLE_SIZE = 5
+_listener: Optional["QueueListener"] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def fields(
+    wishlist: Optional[str] = None,
+    page: Optional[str] = None,
+    stage: Optional[str] = None,
+) -> Dict[str, Optional[str]]:
+    """Return the structured fields of a record, to be given as `extra`.
+
+    Args:
+        wishlist: Optional; URL of the wishlist the record is about.
+        page: Optional; URL of the wishlist page the record is about.
+        stage: Optional; Stage of the pass, named as in `metrics.py`.
+    """
+    return {"wishlist": wishlist, "page": page, "stage": stage}
+
+
+def sample(values: List[str], limit: int = SAMPLE_SIZE) -> str:
+    """Return up to ``limit`` of ``values`` and a count of the rest, for one
+    record about many items rather than a record per item.
+
+    >>> sample(["a", "b", "c"], limit=2)
+    'a, b and 1 more'
+    """
+    shown = ", ".join(values[:limit])
+    return shown if len(values) <= limit else f"{shown} and {len(values) - limit} more"
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single line json object, with its time, level,
+    message and any structured fields (see `FIELDS`) set.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+def setup_logging(json_logs: bool = False) -> None:
+    """Log to the console and a rotating log file through a queue.
+
+    Called when the program starts rather than on import, so importing the
+    package doesn't open the log file. Calling more than once has no effect.
+    The queue is emptied and the listener stopped on exit, or by
+    ``stop_logging``.
+
+    Args:
+        json_logs: Optional; Write the log file as json lines (see
+            `JsonFormatter`) rather than plain text.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    import copy
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    # Create handlers.
+    console_handler = logging.StreamHandler()
+    file_handler = RotatingFileHandler(
+        LOG_PATH,
+        mode="a+",
+        maxBytes=2 * 1024 * 1024,  # 2MB max log size.
+        backupCount=5,  # Keep max 5 historical logs.
+    )
+    console_handler.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+
+    # Create formatters and add to handlers.
+    console_format = logging.Formatter("%(levelname)s - %(message)s")
+    file_format = (
+        JsonFormatter()
+        if json_logs
+        else logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    )
+    console_handler.setFormatter(console_format)
+    file_handler.setFormatter(file_format)
+
+    class ProcessQueueHandler(QueueHandler):
+        """Queues records in the process which set up logging. A process
+        forked from it, e.g. a worker of `tenants.run_many`, has no listener,
+        so handles its records directly instead.
+        """
+
+        pid = os.getpid()
+
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            # The message is merged with its args now, as they may change
+            # before the listener gets to it, but formatting, including of
+            # any exception, is left to the listener's handlers.
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            return record
+
+        def emit(self, record: logging.LogRecord) -> None:
+            if os.getpid() == self.pid:
+                super().emit(record)
+                return
+            for handler in (console_handler, file_handler):
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    # Add the queue handler to logger, and the handlers to its listener.
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    _queue_handler = ProcessQueueHandler(log_queue)
+    _listener = QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    logger.addHandler(_queue_handler)
+    atexit.register(stop_logging)
+
 
-# Create handlers.
-console_handler = logging.StreamHandler()
-file_handler = RotatingFileHandler(
-    Path(Path(__file__).parent.resolve(), "pricewatch.log"),
-    mode="a+",
-    maxBytes=2 * 1024 * 1024,  # 2MB max log size.
-    backupCount=5,  # Keep max 5 historical logs.
-)
-console_handler.setLevel(logging.INFO)
-file_handler.setLevel(logging.INFO)
-
-# Create formatters and add to handlers.
-console_format = logging.Formatter("%(levelname)s - %(message)s")
-file_format = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-console_handler.setFormatter(console_format)
-file_handler.setFormatter(file_format)
-
-# Add handlers to logger.
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+def stop_logging() -> None:
+    """Write any queued records, then stop the listener and remove the
+    handlers added by ``setup_logging``.
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logger.removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
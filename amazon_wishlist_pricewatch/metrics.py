@@ -0,0 +1,177 @@
+"""Timings and counts of each run, for monitoring.
+
+`Metrics` records how long each stage of a run takes and counts the pages,
+bytes, items, parse failures, retries, throttled requests, failed wishlists,
+wishlists shared by other tenants and alerts of the run. At the end of a run
+they are written, if set in the `metrics` section of `config.json`, as a JSON
+run report and as a Prometheus textfile for node_exporter's textfile
+collector to pick up.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import TYPE_CHECKING, ContextManager, Dict, Iterator, Optional, Union
+
+if TYPE_CHECKING:
+    from .profiling import StageProfiler
+
+COUNTERS = (
+    "wishlists",
+    "pages",
+    "bytes_downloaded",
+    "pages_cut_short",
+    "pages_cut_short_without_next",
+    "items_parsed",
+    "parse_failures",
+    "retries",
+    "throttled",
+    "failed_wishlists",
+    "shared_wishlists",
+    "alerts_sent",
+)
+PROMETHEUS_PREFIX = "pricewatch"
+
+
+class Metrics:
+    """Stage timings and counters of a single run. Safe to use from many
+    threads.
+
+    Attributes:
+        started_at: Unix time the run started.
+        finished_at: Unix time the run finished, or `None` until ``finish``.
+        stages: Total seconds spent in each stage, keyed by stage name. Stages
+            run concurrently, such as requesting pages of many wishlists, can
+            add up to more than the run took.
+        stage_calls: Number of times each stage was run, keyed by stage name.
+        counters: Value of each of `COUNTERS`.
+        profiler: A `profiling.StageProfiler` each stage is also profiled by,
+            or `None`.
+    """
+
+    def __init__(self, profiler: Optional["StageProfiler"] = None):
+        """Init Metrics, starting the run's clock."""
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stages: Dict[str, float] = {}
+        self.stage_calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.profiler = profiler
+        self._started = time.perf_counter()
+        self._duration = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the body of a ``with`` block as part of ``stage``, profiling
+        it too if there is a `profiler`.
+        """
+        profiling: ContextManager = (
+            self.profiler.stage(stage) if self.profiler is not None else nullcontext()
+        )
+        with profiling:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+                    self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """Add ``value`` to ``counter``, one of `COUNTERS`."""
+        with self._lock:
+            self.counters[counter] += value
+
+    def finish(self) -> None:
+        """Stop the run's clock."""
+        self.finished_at = time.time()
+        self._duration = time.perf_counter() - self._started
+
+    @property
+    def duration(self) -> float:
+        """Seconds the run took, or has taken so far if not finished."""
+        if self._duration is not None:
+            return self._duration
+        return time.perf_counter() - self._started
+
+    def report(self) -> Dict:
+        """Return the run's metrics as a json serialisable dict."""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "duration_seconds": self.duration,
+                "stages": {
+                    stage: {"seconds": seconds, "calls": self.stage_calls[stage]}
+                    for stage, seconds in self.stages.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def prometheus(self) -> str:
+        """Return the run's metrics in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_timestamp_seconds"
+            " Unix time the last run finished.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds"
+            f" {report['finished_at'] or time.time()}",
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_duration_seconds"
+            " Seconds the last run took.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_duration_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_last_run_duration_seconds"
+            f" {report['duration_seconds']}",
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_stage_seconds"
+            " Seconds spent in each stage of the last run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_stage_seconds gauge",
+        ]
+        for stage, values in sorted(report["stages"].items()):
+            lines.append(
+                f'{PROMETHEUS_PREFIX}_last_run_stage_seconds{{stage="{stage}"}}'
+                f" {values['seconds']}"
+            )
+        lines += [
+            f"# HELP {PROMETHEUS_PREFIX}_last_run_stage_calls"
+            " Times each stage ran in the last run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_last_run_stage_calls gauge",
+        ]
+        for stage, values in sorted(report["stages"].items()):
+            lines.append(
+                f'{PROMETHEUS_PREFIX}_last_run_stage_calls{{stage="{stage}"}}'
+                f" {values['calls']}"
+            )
+        for counter, value in report["counters"].items():
+            name = f"{PROMETHEUS_PREFIX}_last_run_{counter}"
+            lines += [
+                f"# HELP {name} {counter.replace('_', ' ').capitalize()} in the"
+                " last run.",
+                f"# TYPE {name} gauge",
+                f"{name} {value}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: Union[str, Path]) -> None:
+        """Write ``report`` to the json file at ``path``."""
+        _write_atomic(Path(path), json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path: Union[str, Path]) -> None:
+        """Write ``prometheus`` to the textfile at ``path``, which should end in
+        `.prom` to be read by node_exporter.
+        """
+        _write_atomic(Path(path), self.prometheus())
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """Write ``text`` to ``path`` via a temporary file, so a reader never
+    sees a partly written file.
+    """
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, "w") as file:
+        file.write(text)
+    os.replace(temp_path, path)
@@ -1,8 +1,20 @@
 """Custom types of a single WishlistItem dict and a dict structure to hold
-all WishlistItems in a Wishlist.
+all WishlistItems in a Wishlist. Also the ParsedItem tuple produced by the
+parser backends for each item found on a wishlist page, prices in integer
+minor units, the PreviousPrices looked up in the stores of wishlists saved by
+previous runs and the Channel interface notifications are sent through.
 """
 
-from typing import TypedDict, Optional, Dict
+from typing import (
+    NamedTuple,
+    NewType,
+    Protocol,
+    TypedDict,
+    Optional,
+    Dict,
+    List,
+    Union,
+)
 
 
 class WishlistItem(TypedDict):
@@ -14,3 +26,41 @@ class WishlistItem(TypedDict):
 
 
 WishlistDict = Dict[str, WishlistItem]
+
+
+class ParsedItem(NamedTuple):
+    title: str
+    byline: Optional[str]
+    price: Union[str, int]
+    url: str
+    asin: str
+
+
+# A price in hundredths of the currency, e.g. pence. See `prices.py`.
+MinorUnits = NewType("MinorUnits", int)
+
+
+class PreviousPrices(NamedTuple):
+    """The lowest prices saved by previous runs of the items of this run's
+    wishlist, as looked up by ``get_lowest_prices`` of a store.
+
+    Attributes:
+        asins: ASINs of the items saved by the last run, in the order given.
+        prices: Lowest price of each of `asins`, in minor units.
+        removed: ASINs saved by the last run which weren't given, as they are
+            no longer on the wishlist.
+    """
+
+    asins: List[str]
+    prices: List[MinorUnits]
+    removed: List[str]
+
+
+class Channel(Protocol):
+    """A way of sending notifications, e.g. email. See `outbox.py`."""
+
+    def send(self, text: str, html: str) -> None:
+        """Send a notification, raising an exception if it fails."""
+
+    def close(self) -> None:
+        """Release any connection held open between notifications."""
@@ -1,36 +1,89 @@
-import json
-import smtplib
-import ssl
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from html import escape
 from pathlib import Path
 from typing import (
+    TYPE_CHECKING,
     List,
     Dict,
+    Iterable,
+    Iterator,
     Tuple,
     Optional,
+    Union,
 )
-from urllib.parse import urlparse
+from urllib.parse import urljoin
 
 if __package__ is None or __package__ == "":
     # Uses current directory visibility when not running as a package.
+    import outbox
+    import settings
     from logger import logger
-    from my_types import WishlistItem
+    from my_types import Channel, WishlistItem
 else:
     # Uses current package visibility when running as a package or with pytest.
+    from . import outbox, settings
     from .logger import logger
-    from .my_types import WishlistItem
+    from .my_types import Channel, WishlistItem
+
+if TYPE_CHECKING:
+    import smtplib
+
+# Notification channel chosen by each digit of `notification_mode`.
+NOTIFICATION_MODES = settings.NOTIFICATION_MODES
+SMTP_SECURITY_MODES = settings.SMTP_SECURITY_MODES
+# Most characters in one price alert message sent to each channel, unless
+# set in the `notifications` section of `config.json`. Telegram rejects
+# messages over 4096 characters. Emails are kept well below the size most
+# SMTP servers accept.
+MAX_MESSAGE_SIZES = {"email": 1_000_000, "telegram": 4096}
+# Channels sent only the text of each message.
+TEXT_ONLY_CHANNELS = ("telegram",)
+_HTML_HEAD = "<html><body><p>"
+_HTML_TAIL = "</p></body></html>"
+
+
+def get_config(config_path: Optional[Path] = None) -> Dict:
+    """Load config file from disk as python dict and return it. File is
+    expected to exist on the same path as this source file, unless another
+    ``config_path`` is given.
 
+    The file is validated, and only read again once it has changed (see
+    ``settings.load``). The dict returned is shared, so is not to be changed.
 
-def get_config() -> Dict:
-    """Load config file from disk as python dict and return it. File is
-    expected to exist on the same path as this source file.
+    Raises:
+        settings.ConfigError: A value is missing or invalid.
+    """
+    return settings.load(config_path).raw
+
+
+def loaded_config() -> Dict:
+    """Return `config`, loading it from disk with ``get_config`` on first use.
+
+    Loading is deferred so importing this module doesn't read `config.json`.
+    """
+    global config
+    if config is None:
+        config = get_config()
+    return config
+
+
+def loaded_settings() -> settings.Settings:
+    """Return the `settings.Settings` of `config`, parsed once per config.
+
+    To change settings, replace `config` or call ``configure``, rather than
+    changing `config` in place once used.
     """
-    with open(
-        Path(Path(__file__).parent, "config.json").resolve(),
-        "r",
-    ) as json_file:
-        return json.load(json_file)
+    global _settings
+    raw = loaded_config()
+    if _settings is None or _settings.raw is not raw:
+        _settings = settings.parse(raw)
+    return _settings
+
+
+def configure(new_settings: settings.Settings) -> None:
+    """Use ``new_settings``, e.g. from a `settings.ConfigFile`, from now on."""
+    global config, _settings
+    config = new_settings.raw
+    _settings = new_settings
 
 
 def send_notification(
@@ -43,6 +96,11 @@ def send_notification(
     This function dispatches notifications to each notification method specified
     by the user in `config.json`. This allows custom text and html (for
     test/failure notifications) or a list of WishlistItem(s) to be provided.
+    Alerts for a list of items are split into as many messages as needed to
+    keep each within the size limit of each channel (see
+    ``max_message_size``). If ``start_dispatcher`` has been called the
+    notification is saved to the outbox and sent in the background, otherwise
+    it is sent before returning.
 
     Args:
         wishlist_item_list: Optional; A list of `WishlistItem` dicts which have
@@ -57,25 +115,126 @@ def send_notification(
     Raises:
         ValueError: Insufficient number or type of arguments provided.
     """
-    if wishlist_item_list:
-        text, html = parse_txt_html(wishlist_item_list)
-    elif not (text and html):
+    if not wishlist_item_list and not (text and html):
         raise ValueError(
             "text and html should be provided if wishlist_item_list is not."
         )
-    nm = config["general"]["notification_mode"]
-    if "1" in nm:
+    channels = notification_channels()
+    if not wishlist_item_list:
+        deliver(text, html, channels)
+        return
+    for channel in channels:
+        messages = 0
+        for text, html in render_messages(
+            wishlist_item_list,
+            max_message_size(channel),
+            include_html=channel not in TEXT_ONLY_CHANNELS,
+        ):
+            deliver(text, html, [channel])
+            messages += 1
+        logger.info(
+            f"Price alerts for {len(wishlist_item_list)} item(s) sent by"
+            f" {channel} in {messages} message(s)."
+        )
+
+
+def deliver(text: str, html: str, channels: List[str]) -> None:
+    """Send one message of ``text`` and ``html`` to each of ``channels``,
+    through the outbox if ``start_dispatcher`` has been called.
+    """
+    if dispatcher is not None:
+        dispatcher.send(text, html, channels)
+        return
+    if "email" in channels:
         send_email(text=text, html=html)
-    if "2" in nm:
+    if "telegram" in channels:
         telegram_message(text)
 
 
+def max_message_size(channel: str) -> int:
+    """Return the most characters in one price alert message sent by
+    ``channel``, from the optional `max_message_sizes` of the `notifications`
+    section of `config.json`, or `MAX_MESSAGE_SIZES`. 0 for no limit.
+    """
+    sizes = loaded_settings().notifications.max_message_sizes
+    return sizes.get(channel, MAX_MESSAGE_SIZES.get(channel, 0))
+
+
+def render_item(item: WishlistItem, wishlist_url: str = "") -> Tuple[str, str]:
+    """Return the plain-text and html of the price alert for ``item``.
+
+    The item's URL is absolute, as found on its wishlist page. A relative URL,
+    saved by an older version, is taken as relative to ``wishlist_url``.
+    """
+    title = item["title"]
+    byline = item["byline"]
+    url = urljoin(wishlist_url, item["url"])
+    price = item["price"]
+
+    text_list = [f"{title}\n"]
+    html_list = [f"{escape(title)}<br>"]
+    if byline:
+        text_list.append(f"{byline}\n")
+        html_list.append(f"{escape(byline)}<br>")
+    text_list.append(f"{url}\n")
+    html_list.append(f'<a href="{escape(url)}">{escape(url)}</a><br>')
+    text_list.append(f"Price: {price}\n\n")
+    html_list.append(f"Price: {escape(price)}<br><br>")
+    return "".join(text_list), "".join(html_list)
+
+
+def render_messages(
+    wishlist_item_list: Iterable[WishlistItem],
+    max_size: Optional[int] = None,
+    include_html: bool = True,
+) -> Iterator[Tuple[str, str]]:
+    """Render price alerts for many items as a stream of messages.
+
+    Items are rendered one at a time, and each message is yielded as soon as
+    adding another item would take it over ``max_size``, so only one message
+    is held in memory at once. Each message's html is a complete document.
+
+    Args:
+        wishlist_item_list: `WishlistItem` dicts which have a new lowest seen
+            price, typically from ``pricewatch.PriceWatch.compare_prices``.
+        max_size: Optional; Most characters in a message. An item which alone
+            is longer is sent in a message of its own. No limit if `None` or 0.
+        include_html: Optional; Whether ``max_size`` counts the html as well
+            as the text. `False` for channels only sent the text.
+
+    Yields:
+        A tuple of (text, html) strings of each message.
+    """
+    wishlist_urls = loaded_settings().general.wishlist_urls
+    wishlist_url = wishlist_urls[0] if wishlist_urls else ""
+    empty_size = len(_HTML_HEAD) + len(_HTML_TAIL) if include_html else 0
+    # Each message's parts are joined once it is full, rather than
+    # accumulated with +=, which can take quadratic time.
+    text_list: List[str] = []
+    html_list = [_HTML_HEAD]
+    size = empty_size
+    for item in wishlist_item_list:
+        text, html = render_item(item, wishlist_url)
+        item_size = len(text) + len(html) if include_html else len(text)
+        if text_list and max_size and size + item_size > max_size:
+            html_list.append(_HTML_TAIL)
+            yield "".join(text_list), "".join(html_list)
+            text_list, html_list, size = [], [_HTML_HEAD], empty_size
+        text_list.append(text)
+        html_list.append(html)
+        size += item_size
+    if text_list:
+        html_list.append(_HTML_TAIL)
+        yield "".join(text_list), "".join(html_list)
+
+
 def parse_txt_html(wishlist_item_list: List[WishlistItem]) -> Tuple[str, str]:
     """Parse list of `WishlistItem(s)` to text and html strings.
 
     This function takes in a list of WishlistItems and returns the key
     product information formatted as plain-text and html strings, formatted
-    to be easily sent as a notification to the user.
+    to be easily sent as a notification to the user, as a single message of
+    any size. See ``render_messages`` to split it.
 
     Args:
         wishlist_item_list (list): A list of `WishlistItem` dicts which have a new
@@ -84,44 +243,188 @@ def parse_txt_html(wishlist_item_list: List[WishlistItem]) -> Tuple[str, str]:
 
     Returns: A tuple containing (text, html) strings of key product information.
     """
-    wishlist_domain = urlparse(config["general"]["wishlist_url"]).netloc
-
-    # Using the + and += operators to accumulate a string within a loop can
-    # lead to quadratic rather than linear running time. Instead adding each
-    # substring to a list and ''.join the list after the loop terminates
-    # consistently has amortized-linear run time complexity.
-    text_list = []
-    html_list = ["<html><body><p>"]
-    for item in wishlist_item_list:
-        title = item["title"]
-        byline = item["byline"]
-        url = f"https://{wishlist_domain}{item['url']}"
-        price = item["price"]
+    return next(render_messages(wishlist_item_list), ("", _HTML_HEAD + _HTML_TAIL))
+
+
+class EmailChannel:
+    """Send email notifications, keeping the connection to the SMTP server
+    open between them.
+
+    The connection is made when the first email is sent and reused until
+    ``close`` is called. If the server has dropped it in the meantime, e.g.
+    after being idle, it is reconnected once.
 
-        text_list.append(f"{title}\n")
-        html_list.append(f"{title}<br>")
-        if byline:
-            text_list.append(f"{byline}\n")
-            html_list.append(f"{byline}<br>")
-        text_list.append(f"{url}\n")
-        html_list.append(f'<a href="{url}">{url}</a><br>')
-        text_list.append(f"Price: {price}\n\n")
-        html_list.append(f"Price: {price}<br><br>")
-        html_list.append("</p></body></html>")
+    Args:
+        email_config: The `settings.EmailSettings`, or the `email` section of
+            `config.json` to parse them from.
+        timeout: Optional; Seconds to wait on the SMTP server.
+
+    Attributes:
+        smtp_server: Host of the SMTP server.
+        smtp_port: Port of the SMTP server.
+        smtp_security: One of `SMTP_SECURITY_MODES`. "ssl" connects over
+            SMTP_SSL, "starttls" upgrades a plain connection with STARTTLS and
+            "none" sends in plain text, e.g. to a local relay.
+        sending_email: Address emails are sent from.
+        sending_email_pass: Password of `sending_email`. Login is skipped if
+            empty.
+        recipients: Addresses emails are sent to.
+        timeout: Seconds to wait on the SMTP server.
+        connection: The open `smtplib.SMTP` connection, or `None`.
+    """
+
+    def __init__(
+        self,
+        email_config: Union[settings.EmailSettings, Dict],
+        timeout: float = 30.0,
+    ):
+        """Init EmailChannel.
+
+        Raises:
+            settings.ConfigError: ``email_config`` is invalid.
+        """
+        if isinstance(email_config, dict):
+            email_config = settings.parse_email(email_config)
+        self.smtp_server = email_config.smtp_server
+        self.smtp_port = email_config.smtp_port
+        self.smtp_security = email_config.smtp_security
+        self.sending_email = email_config.sending_email
+        self.sending_email_pass = email_config.sending_email_pass
+        self.recipients = list(email_config.receiving_emails)
+        self.timeout = timeout
+        self.connection: Optional["smtplib.SMTP"] = None
+
+    def connect(self) -> "smtplib.SMTP":
+        """Connect and log in to the SMTP server."""
+        # Imported here as only needed when sending email, and slow to import.
+        import smtplib
+        import ssl
+
+        # The default context of ssl validates the host name and its
+        # certificates and optimizes the security of the connection.
+        if self.smtp_security == "ssl":
+            server: smtplib.SMTP = smtplib.SMTP_SSL(
+                self.smtp_server,
+                self.smtp_port,
+                timeout=self.timeout,
+                context=ssl.create_default_context(),
+            )
+        else:
+            server = smtplib.SMTP(
+                self.smtp_server, self.smtp_port, timeout=self.timeout
+            )
+            if self.smtp_security == "starttls":
+                server.starttls(context=ssl.create_default_context())
+        if self.sending_email_pass:
+            server.login(self.sending_email, self.sending_email_pass)
+        return server
+
+    def send(self, text: str, html: str) -> None:
+        """Send an email of ``text`` and ``html`` to all `recipients`.
+
+        Raises:
+            smtplib.SMTPException: Base exception class for smtplib.
+            smtplib.SMTPAuthenticationError: Most likely the wrong user/pass
+                supplied.
+            OSError: Couldn't connect to the SMTP server.
+        """
+        import smtplib
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        message = MIMEMultipart("alternative")
+        message["Subject"] = "Amazon Wishlist Price Alert"
+        message["From"] = self.sending_email
+        message["To"] = ", ".join(self.recipients)
+
+        plain_text = MIMEText(text, "plain")
+        html_text = MIMEText(html, "html")
+
+        # The last part of a multipart message, in this case the HTML message, is
+        # best and preferred (RFC 2046).
+        message.attach(plain_text)
+        message.attach(html_text)
+
+        reconnect = self.connection is not None
+        try:
+            if self.connection is None:
+                self.connection = self.connect()
+            try:
+                self.connection.send_message(
+                    message, from_addr=self.sending_email, to_addrs=self.recipients
+                )
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if not reconnect:
+                    raise
+                # The server may have closed the connection while it was idle.
+                self.connection = self.connect()
+                self.connection.send_message(
+                    message, from_addr=self.sending_email, to_addrs=self.recipients
+                )
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """Close the connection to the SMTP server, if open."""
+        if self.connection is None:
+            return
+        import smtplib
+
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+
+class TelegramChannel:
+    """Send plain-text telegram messages, reusing a single bot between them.
+
+    Args:
+        telegram_config: The `settings.TelegramSettings`, or the `telegram`
+            section of `config.json` to parse them from.
+
+    Attributes:
+        chat_id: Chat messages are sent to.
+        token: Secret token of the bot.
+        bot: The `telegram.Bot` messages are sent with, created on first use.
+    """
+
+    def __init__(self, telegram_config: Union[settings.TelegramSettings, Dict]):
+        """Init TelegramChannel."""
+        if isinstance(telegram_config, dict):
+            telegram_config = settings.parse_telegram(telegram_config)
+        self.chat_id = telegram_config.chat_id
+        self.token = telegram_config.token
+        self.bot = None
+
+    def send(self, text: str, html: str) -> None:
+        """Send ``text`` as a telegram message. ``html`` is not used.
+
+        Raises:
+            telegram.error.TelegramError: Base telegram exception.
+            telegram.error.NetworkError: Base network error exception.
+            telegram.error.InvalidToken: Invalid secret token provided.
+            telegram.error.ChatMigrated: `chat_id` incorrect / moved.
+        """
+        if self.bot is None:
+            import telegram  # type: ignore
 
-        logger.info(f"Price alert for {title}: {price}.")
-    text = "".join(text_list)
-    html = "".join(html_list)
+            self.bot = telegram.Bot(token=self.token)
+        self.bot.send_message(chat_id=self.chat_id, text=text)
 
-    return text, html
+    def close(self) -> None:
+        """Drop the bot, and with it its connections."""
+        self.bot = None
 
 
 def send_email(text: str, html: str) -> None:
     """Send an email notification to the user.
 
-    A connection with the `config` specified SMTP server is established over
-    SMTP_SLL and a MimeMultipart email is sent to all email addresses listed in
-    the `config` file.
+    A connection with the `config` specified SMTP server is established (see
+    `EmailChannel`) and a MimeMultipart email is sent to all email addresses
+    listed in the `config` file. Failures are logged.
 
     Args:
         text: The plain-text string to be emailed.
@@ -129,73 +432,94 @@ def send_email(text: str, html: str) -> None:
 
     Returns:
         None
-
-    Raises:
-        smtplib.SMTPException: Base exception class for smtplib.
-        smtplib.SMTPAuthenticationError: Most likely the wrong user/pass supplied.
-        smtplib.SMTPResponseException: Connection failed with the sending server.
     """
-    email_config = config["email"]
-    smtp_server = email_config["smtp_server"]
-    smtp_port = int(email_config["smtp_port"])
-    sending_email = email_config["sending_email"]
-    sending_email_pass = email_config["sending_email_pass"]
-    recipients = email_config["receiving_emails"]
-
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Amazon Wishlist Price Alert"
-    message["From"] = sending_email
-    message["To"] = ", ".join(recipients)
-
-    plain_text = MIMEText(text, "plain")
-    html_text = MIMEText(html, "html")
-
-    # The last part of a multipart message, in this case the HTML message, is
-    # best and preferred (RFC 2046).
-    message.attach(plain_text)
-    message.attach(html_text)
-
-    # The default context of ssl validates the host name and its certificates
-    # and optimizes the security of the connection.
-    context = ssl.create_default_context()
+    import smtplib
+
+    channel = EmailChannel(loaded_settings().email)
     try:
-        with smtplib.SMTP_SSL(smtp_server, smtp_port, context=context) as server:
-            server.login(sending_email, sending_email_pass)
-            server.send_message(
-                message,
-                from_addr=sending_email,
-                to_addrs=recipients,
-            )
-    except smtplib.SMTPException as e:
+        channel.send(text, html)
+    except (smtplib.SMTPException, OSError):
         logger.exception("Failed to send email. Check config.")
+    finally:
+        channel.close()
 
 
 def telegram_message(text: str) -> None:
-    """Send a plain-text telegram message.
+    """Send a plain-text telegram message. Failures are logged.
 
     Args:
         text: The text to be sent.
 
     Returns:
         None
-
-    Raises:
-        telegram.error.TelegramError: Base telegram exception.
-        telegram.error.NetworkError: Base network error exception.
-        telegram.error.InvalidToken: Invalid secret token provided.
-        telegram.error.ChatMigrated: `chat_id` incorrect / moved.
     """
     import telegram  # type: ignore
 
-    chat_id = config["telegram"]["chat_id"]
-    token = config["telegram"]["token"]
-    bot = telegram.Bot(token=token)
     try:
-        bot.send_message(chat_id=chat_id, text=text)
-    except telegram.error.TelegramError as e:
+        TelegramChannel(loaded_settings().telegram).send(text, text)
+    except telegram.error.TelegramError:
         logger.exception("Failed to send telegram message. Check config.")
 
 
+def notification_channels() -> List[str]:
+    """Return the names of the channels chosen by `notification_mode`."""
+    return list(loaded_settings().general.channels)
+
+
+def start_dispatcher(
+    outbox_dir: Union[str, Path],
+    deliver: bool = True,
+) -> outbox.Dispatcher:
+    """Send notifications through a persistent outbox in the background.
+
+    Until ``stop_dispatcher`` is called, ``send_notification`` saves each
+    notification to the outbox and returns without waiting for it to be sent.
+    Notifications left in the outbox by previous runs are sent too.
+
+    Args:
+        outbox_dir: Directory of the `outbox.Outbox`, `outbox` in the state
+            directory of the run, so runs kept apart by their state
+            directories don't share one.
+        deliver: Optional; If `False`, notifications are saved to the outbox
+            but not sent, e.g. for alerts from a run against a
+            `replay.ReplayServer`.
+
+    Returns:
+        The started `outbox.Dispatcher`.
+    """
+    global dispatcher
+    loaded = loaded_settings()
+    channels: Dict[str, Channel] = {}
+    for name in loaded.general.channels:
+        if name == "email":
+            channels[name] = EmailChannel(loaded.email)
+        else:
+            channels[name] = TelegramChannel(loaded.telegram)
+    dispatcher = outbox.Dispatcher(
+        outbox.Outbox(outbox_dir),
+        channels,
+        max_attempts=loaded.notifications.max_attempts,
+        retry_seconds=loaded.notifications.retry_seconds,
+    )
+    if deliver:
+        dispatcher.start()
+    return dispatcher
+
+
+def stop_dispatcher(timeout: Optional[float] = None) -> None:
+    """Stop the dispatcher started by ``start_dispatcher``, first waiting up to
+    ``timeout`` seconds for notifications to be sent. Defaults to
+    `flush_timeout_seconds` in `config.json`.
+    """
+    global dispatcher
+    if dispatcher is None:
+        return
+    if timeout is None:
+        timeout = loaded_settings().notifications.flush_timeout_seconds
+    dispatcher.stop(timeout)
+    dispatcher = None
+
+
 def failed_request_msg() -> None:
     """Send a notification that a web request to Amazon has failed."""
     send_notification(
@@ -214,4 +538,9 @@ def test_notification() -> None:
     )
 
 
-config = get_config()
+# Loaded on first use by ``loaded_config``.
+config: Optional[Dict] = None
+# Parsed from `config` by ``loaded_settings``.
+_settings: Optional[settings.Settings] = None
+# Set by ``start_dispatcher``.
+dispatcher: Optional[outbox.Dispatcher] = None
@@ -0,0 +1,283 @@
+"""A persistent outbox of notifications, sent in the background.
+
+Notifications are written to the `Outbox` on disk before any attempt is made
+to send them, so price alerts survive a crash, and are then delivered by a
+`Dispatcher`. The dispatcher has a worker thread for each notification
+channel (email, telegram), so channels are sent to concurrently, a slow mail
+server never holds up a run and each channel can keep its connection open
+between messages. Failed sends are retried with exponential backoff. Anything
+not delivered when the program exits is sent the next time it runs.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from logger import logger
+    from my_types import Channel
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .logger import logger
+    from .my_types import Channel
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_SECONDS = 30.0
+MAX_RETRY_SECONDS = 3600.0
+DEFAULT_FLUSH_TIMEOUT_SECONDS = 60.0
+
+
+class Outbox:
+    """Notifications waiting to be sent, saved as one json file each.
+
+    Each message records, for every channel it still has to be sent to, the
+    number of failed attempts and when it may next be tried. A message's file
+    is removed once it has been sent to every channel. Safe to use from many
+    threads.
+
+    Args:
+        outbox_dir: Directory messages are saved in, usually `outbox` in the
+            state directory of the run (see ``pricewatch.PriceWatch``).
+
+    Attributes:
+        outbox_dir: Directory messages are saved in, created if needed.
+        messages: Every message not yet sent to all its channels, keyed by id.
+    """
+
+    def __init__(self, outbox_dir: Union[str, Path]):
+        """Init Outbox, loading any messages left from previous runs."""
+        self.outbox_dir = Path(outbox_dir).resolve()
+        self.outbox_dir.mkdir(parents=True, exist_ok=True)
+        self.messages: Dict[str, Dict] = {}
+        for path in sorted(self.outbox_dir.glob("*.json")):
+            try:
+                with open(path, "r") as message_json:
+                    self.messages[path.stem] = json.load(message_json)
+            except json.JSONDecodeError:
+                logger.error(f"Skipping unreadable outbox message: {path}")
+        self._lock = threading.Lock()
+
+    def put(self, text: str, html: str, channels: Iterable[str]) -> str:
+        """Save a message to be sent to each of ``channels`` and return its id.
+
+        The message is on disk by the time this returns.
+        """
+        message_id = f"{time.time_ns():020d}-{os.urandom(4).hex()}"
+        message = {
+            "text": text,
+            "html": html,
+            "channels": {
+                channel: {"attempts": 0, "retry_at": 0.0} for channel in channels
+            },
+        }
+        with self._lock:
+            self.messages[message_id] = message
+            self._write(message_id)
+        return message_id
+
+    def due(self, channel: str, now: Optional[float] = None) -> List[str]:
+        """Return ids of messages due to be sent to ``channel``, oldest first."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [
+                message_id
+                for message_id, message in sorted(self.messages.items())
+                if channel in message["channels"]
+                and message["channels"][channel]["retry_at"] <= now
+            ]
+
+    def next_retry(self, channel: str) -> Optional[float]:
+        """Return when the next message for ``channel`` may be tried, or `None`
+        if there are no messages for it.
+        """
+        with self._lock:
+            times = [
+                message["channels"][channel]["retry_at"]
+                for message in self.messages.values()
+                if channel in message["channels"]
+            ]
+        return min(times, default=None)
+
+    def channels(self) -> List[str]:
+        """Return every channel any message is waiting to be sent to."""
+        with self._lock:
+            return sorted(
+                {
+                    channel
+                    for message in self.messages.values()
+                    for channel in message["channels"]
+                }
+            )
+
+    def discard(self, message_id: str, channel: str) -> None:
+        """Stop sending a message to ``channel``, once sent or given up on."""
+        with self._lock:
+            channels = self.messages[message_id]["channels"]
+            del channels[channel]
+            self._write(message_id)
+
+    def failed(self, message_id: str, channel: str, retry_at: float) -> int:
+        """Record a failed attempt to send a message to ``channel``, to be tried
+        again at ``retry_at``. Return the number of failed attempts so far.
+        """
+        with self._lock:
+            state = self.messages[message_id]["channels"][channel]
+            state["attempts"] += 1
+            state["retry_at"] = retry_at
+            self._write(message_id)
+            return state["attempts"]
+
+    def _write(self, message_id: str) -> None:
+        """Save a message, or remove it once sent to every channel. Written to
+        a temporary file first, so a crash never leaves a partly written message.
+        """
+        path = Path(self.outbox_dir, f"{message_id}.json")
+        message = self.messages[message_id]
+        if not message["channels"]:
+            del self.messages[message_id]
+            path.unlink(missing_ok=True)
+            return
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w") as message_json:
+            json.dump(message, message_json)
+            message_json.flush()
+            os.fsync(message_json.fileno())
+        os.replace(temp_path, path)
+
+
+class Dispatcher:
+    """Send messages in an `Outbox` on a worker thread per channel.
+
+    Args:
+        outbox: The `Outbox` to send messages from.
+        channels: The channel used to send each kind of message, keyed by name.
+        max_attempts: Optional; Failed attempts after which a message is no
+            longer sent to a channel.
+        retry_seconds: Optional; Seconds to wait before the first retry. Doubled
+            for each further failure, up to an hour, and varied randomly by up
+            to a fifth either way.
+
+    Attributes:
+        outbox: The `Outbox` to send messages from.
+        channels: The channel used to send each kind of message, keyed by name.
+        max_attempts: Failed attempts after which a message is dropped.
+        retry_seconds: Seconds to wait before the first retry.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        channels: Dict[str, Channel],
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_seconds: float = DEFAULT_RETRY_SECONDS,
+    ):
+        """Init the Dispatcher."""
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1.")
+        self.outbox = outbox
+        self.channels = channels
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._wake = {name: threading.Event() for name in channels}
+        self._draining = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        for name in self.outbox.channels():
+            if name not in channels:
+                logger.warning(
+                    f"Notifications waiting for {name} won't be sent as it's no"
+                    " longer a notification method."
+                )
+
+    def start(self) -> None:
+        """Start a worker thread for each channel."""
+        for name in self.channels:
+            thread = threading.Thread(
+                target=self._work, args=(name,), name=f"outbox-{name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def send(self, text: str, html: str, channels: Iterable[str]) -> str:
+        """Save a message to the outbox and wake the workers for ``channels``.
+
+        Returns the message id without waiting for it to be sent.
+        """
+        channels = [name for name in channels if name in self.channels]
+        message_id = self.outbox.put(text, html, channels)
+        for name in channels:
+            self._wake[name].set()
+        return message_id
+
+    def stop(self, timeout: Optional[float] = DEFAULT_FLUSH_TIMEOUT_SECONDS) -> None:
+        """Stop the workers once every message due has been tried, waiting up
+        to ``timeout`` seconds. Messages waiting to be retried, or not sent in
+        time, are left in the outbox for the next run.
+        """
+        self._draining.set()
+        for event in self._wake.values():
+            event.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+        self._stopping.set()
+        for event in self._wake.values():
+            event.set()
+        unsent = len(self.outbox.messages)
+        if unsent:
+            logger.warning(f"{unsent} notification(s) left in outbox for next run.")
+
+    def retry_delay(self, attempts: int) -> float:
+        """Return seconds to wait before retrying after ``attempts`` failures."""
+        delay = min(self.retry_seconds * 2 ** (attempts - 1), MAX_RETRY_SECONDS)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _work(self, name: str) -> None:
+        """Send messages due on channel ``name`` until stopped."""
+        channel = self.channels[name]
+        wake = self._wake[name]
+        try:
+            while not self._stopping.is_set():
+                wake.clear()
+                for message_id in self.outbox.due(name):
+                    if self._stopping.is_set():
+                        return
+                    self._deliver(name, channel, message_id)
+                if self.outbox.due(name):
+                    continue
+                if self._draining.is_set():
+                    return
+                next_retry = self.outbox.next_retry(name)
+                wake.wait(None if next_retry is None else next_retry - time.time())
+        finally:
+            channel.close()
+
+    def _deliver(self, name: str, channel: Channel, message_id: str) -> None:
+        """Try to send a message on ``channel``, recording the outcome."""
+        message = self.outbox.messages[message_id]
+        try:
+            channel.send(message["text"], message["html"])
+        except Exception:
+            attempts = message["channels"][name]["attempts"]
+            if attempts + 1 >= self.max_attempts:
+                logger.exception(
+                    f"Failed to send {name} notification after"
+                    f" {self.max_attempts} attempts. Giving up. Check config."
+                )
+                self.outbox.discard(message_id, name)
+                return
+            delay = self.retry_delay(attempts + 1)
+            logger.warning(
+                f"Failed to send {name} notification. Retrying in {delay:.0f}s.",
+                exc_info=True,
+            )
+            self.outbox.failed(message_id, name, time.time() + delay)
+        else:
+            self.outbox.discard(message_id, name)
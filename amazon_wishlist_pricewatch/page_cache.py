@@ -0,0 +1,133 @@
+"""Cache of wishlist pages seen on previous runs.
+
+For each page URL the `PageCache` keeps the validators Amazon sent with it
+(`ETag` and `Last-Modified`), a digest of the part of the page holding the
+wishlist items, the items parsed from it and the URL of the next page. This
+lets a page be requested conditionally, and lets a page whose items haven't
+changed skip parsing entirely.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from my_types import ParsedItem
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .my_types import ParsedItem
+
+
+def digest(region: str) -> str:
+    """Return a hex digest of the item list ``region`` of a page."""
+    import hashlib
+
+    return hashlib.sha256(region.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class PageCache:
+    """Validators, digests and parsed items of wishlist pages, by URL.
+
+    Args:
+        cache_path: Optional; Path of the json file the cache is saved to.
+            Defaults to `page_cache.json` on the same path as this source file.
+
+    Attributes:
+        cache_path: Path of the json file the cache is saved to.
+        pages: Cache entry of each page, keyed by URL.
+        visited: URLs looked up or stored this run. Only these are saved.
+    """
+
+    def __init__(self, cache_path: Optional[Union[str, Path]] = None):
+        """Init PageCache, loading `cache_path` if it exists."""
+        if cache_path is None:
+            cache_path = Path(Path(__file__).parent, "page_cache.json")
+        self.cache_path = Path(cache_path).resolve()
+        try:
+            with open(self.cache_path, "r") as cache_json:
+                self.pages: Dict[str, Dict] = json.load(cache_json)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.pages = {}
+        self.visited: set = set()
+        # Entries are replaced, never changed in place, so a shallow copy is
+        # enough to tell if anything has changed.
+        self._saved_pages = dict(self.pages)
+
+    def __contains__(self, url: str) -> bool:
+        """Return whether ``url`` is cached."""
+        return url in self.pages
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Return headers to request ``url`` only if modified since cached."""
+        page = self.pages.get(url, {})
+        headers = {}
+        if page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+        return headers
+
+    def get_items(
+        self, url: str, page_digest: Optional[str] = None
+    ) -> Optional[List[ParsedItem]]:
+        """Return the cached items of ``url``.
+
+        If ``page_digest`` is given, items are only returned if it matches the
+        digest of the cached page. Return `None` if nothing suitable cached.
+        """
+        self.visited.add(url)
+        page = self.pages.get(url)
+        if page is None or (page_digest and page_digest != page["digest"]):
+            return None
+        return [ParsedItem(*item) for item in page["items"]]
+
+    def get_next_url(self, url: str) -> Optional[str]:
+        """Return the cached URL of the page following ``url``."""
+        return self.pages.get(url, {}).get("next_url")
+
+    def store(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        page_digest: str,
+        items: List[ParsedItem],
+        next_url: Optional[str],
+    ) -> None:
+        """Cache a page's response ``headers`` validators, digest, items and
+        next page URL.
+        """
+        self.visited.add(url)
+        self.pages[url] = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "digest": page_digest,
+            "items": [list(item) for item in items],
+            "next_url": next_url,
+        }
+
+    def save(self) -> None:
+        """Save pages visited this run to `cache_path`.
+
+        Pages not visited are dropped, so pages no longer part of a wishlist
+        don't accumulate. Written to a temporary file first, so a crash never
+        leaves a partly written cache. Skipped if nothing has changed since
+        last loaded or saved.
+        """
+        pages = {url: self.pages[url] for url in self.visited if url in self.pages}
+        self.visited = set()
+        if pages == self._saved_pages:
+            return
+        import tempfile
+
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as cache_json:
+                json.dump(pages, cache_json)
+            os.replace(temp_path, self.cache_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.pages = pages
+        self._saved_pages = dict(pages)
@@ -0,0 +1,313 @@
+"""HTML parser backends for wishlist pages.
+
+Parsing is the most CPU hungry step of a run, so the backend used to turn a
+wishlist page into `ParsedItem` tuples can be chosen with the `parser` key in
+the `general` section of `config.json`:
+
+- "html.parser": Python's built-in parser. The default, no extra dependencies.
+- "lxml": The C based lxml parser. Requires `pip install lxml`.
+- "restricted": Python's built-in parser, but only the region of the page
+  holding the wishlist items is parsed. The rest of the page (navigation,
+  scripts etc.) is never read by the parser.
+- "restricted-lxml": As "restricted", using lxml.
+
+Every backend produces identical items. The "see more" (pagination) link is
+found separately by ``pricewatch.find_next_page_url``, so none of the backends
+need to build the rest of the page.
+
+Parsing is pure Python, so one interpreter parses one page at a time. Pages
+can instead be parsed by a pool of processes from ``process_pool``: the raw
+page bytes are sent to a worker, which returns plain item tuples from
+``parse_content`` rather than anything built by the parser.
+
+A page can also be parsed while it downloads, with a `StreamingParser` fed
+each chunk of it as it arrives. Items are parsed as soon as they are
+complete, and the parser tells when the item list and "see more" link have
+been read, so the rest of the page need not be.
+"""
+
+import json
+import re
+import sys
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import bs4  # type: ignore
+    from concurrent.futures import ProcessPoolExecutor
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from my_types import ParsedItem
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .my_types import ParsedItem
+
+DEFAULT_PARSER = "html.parser"
+PARSER_BACKENDS = ("html.parser", "lxml", "restricted", "restricted-lxml")
+
+# Class of each item's `li` element on a wishlist page.
+ITEM_CLASS = "a-spacing-none g-item-sortable"
+# Markers found after the last item on a wishlist page.
+END_OF_LIST_MARKERS = ('id="endOfListMarker"', "wl-see-more")
+# Characters kept before the first item is found, enough to hold the start of
+# its `li` tag, and after the item list while looking for the "see more" link.
+_MAX_TAG_LENGTH = 4 * 1024
+_SEE_MORE_TAG_RE = re.compile(r"<a\s[^>]*wl-see-more[^>]*>", re.IGNORECASE)
+
+
+def check_backend(backend: str) -> None:
+    """Check ``backend`` is a known parser backend which can be used.
+
+    Raises:
+        ValueError: Unknown parser backend.
+        ImportError: lxml is not installed for an lxml based backend.
+    """
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(
+            f"Unknown parser {backend!r}. Choose from {', '.join(PARSER_BACKENDS)}."
+        )
+    if backend.endswith("lxml"):
+        import lxml  # type: ignore # noqa: F401
+
+
+def parse_items(
+    markup: str, backend: str = DEFAULT_PARSER
+) -> Tuple[List[ParsedItem], int]:
+    """Parse the wishlist items on a page.
+
+    Args:
+        markup: The HTML of a wishlist page.
+        backend: Optional; One of `PARSER_BACKENDS`.
+
+    Returns:
+        A tuple of the `ParsedItem` found for each item, and the number of
+        items which could not be parsed. Items fail to parse when no longer
+        available on Amazon.
+    """
+    if backend.startswith("restricted"):
+        markup = item_list_region(markup)
+    return _parse_markup(markup, backend)
+
+
+def _parse_markup(markup: str, backend: str) -> Tuple[List[ParsedItem], int]:
+    import bs4  # type: ignore
+
+    features = "lxml" if backend.endswith("lxml") else "html.parser"
+    soup = bs4.BeautifulSoup(markup, features=features)
+
+    items = []
+    failures = 0
+    for item in soup.find_all("li", attrs={"class": ITEM_CLASS}):
+        try:
+            items.append(parse_item(item))
+        except (KeyError, TypeError):
+            failures += 1
+    return items, failures
+
+
+class StreamingParser:
+    """Parses the items of a wishlist page from chunks of it, as it downloads.
+
+    Each chunk is passed to ``feed`` as it arrives. Items are parsed in
+    batches, each as soon as the start of the item after it, or the end of
+    the item list, has arrived, so only the markup of the item list is ever
+    parsed (as by the "restricted" backends). Once the end of the list and
+    the "see more" link after it have been fed, `done` is set and the rest of
+    the page can be left unread. Otherwise, as on the last page of a wishlist,
+    call ``close`` once the whole page has been fed: a link further down the
+    page is never missed.
+
+    Produces the same items as ``parse_items``.
+
+    Args:
+        backend: Optional; One of `PARSER_BACKENDS`. Only whether lxml is used
+            matters.
+
+    Attributes:
+        items: The `ParsedItem` for each item parsed so far, in page order.
+        failures: Number of items which failed to parse so far.
+        done: Whether the item list and "see more" link have been fed, or
+            ``close`` has been called.
+    """
+
+    def __init__(self, backend: str = DEFAULT_PARSER):
+        """Init StreamingParser."""
+        self.backend = backend
+        self.items: List[ParsedItem] = []
+        self.failures = 0
+        self.done = False
+        # Markup fed and not yet parsed. Once the list has started, it begins
+        # at the `li` tag of the first item not yet parsed.
+        self._buffer = ""
+        self._list_started = False
+        self._list_ended = False
+
+    def feed(self, chunk: str) -> List[ParsedItem]:
+        """Feed the next ``chunk`` of the page.
+
+        Returns:
+            The items completed by ``chunk``, also added to `items`.
+        """
+        if self.done:
+            return []
+        self._buffer += chunk
+        if self._list_ended:
+            self._look_for_see_more()
+            return []
+        if not self._list_started:
+            first_item = self._buffer.find(ITEM_CLASS)
+            if first_item == -1:
+                self._buffer = self._buffer[-_MAX_TAG_LENGTH:]
+                return []
+            self._buffer = self._buffer[self._buffer.rfind("<li", 0, first_item) :]
+            self._list_started = True
+
+        end = self._list_end()
+        if end is not None:
+            complete, self._buffer = self._buffer[:end], self._buffer[end:]
+            self._list_ended = True
+        else:
+            # Parse up to the start of the last item begun, which may not
+            # have arrived in full yet.
+            last_item = self._buffer.rfind(ITEM_CLASS)
+            last_start = max(self._buffer.rfind("<li", 0, last_item), 0)
+            complete, self._buffer = (
+                self._buffer[:last_start],
+                self._buffer[last_start:],
+            )
+        new_items = self._parse(complete)
+        if self._list_ended:
+            self._look_for_see_more()
+        return new_items
+
+    def close(self) -> List[ParsedItem]:
+        """Parse what is left once the whole page has been fed.
+
+        Returns:
+            The items completed, also added to `items`.
+        """
+        new_items = (
+            self._parse(self._buffer)
+            if self._list_started and not self._list_ended
+            else []
+        )
+        self._buffer = ""
+        self.done = True
+        return new_items
+
+    def _list_end(self) -> Optional[int]:
+        """Return where the item list ends in `_buffer`, as in
+        ``item_list_region``, or `None` if its end hasn't arrived.
+        """
+        ends = [
+            self._buffer.rfind("<", 0, found)
+            for found in (self._buffer.find(marker) for marker in END_OF_LIST_MARKERS)
+            if found != -1
+        ]
+        return min(ends) if ends else None
+
+    def _look_for_see_more(self) -> None:
+        if _SEE_MORE_TAG_RE.search(self._buffer):
+            self.done = True
+        else:
+            # Enough to hold the start of a link split across chunks.
+            self._buffer = self._buffer[-_MAX_TAG_LENGTH:]
+
+    def _parse(self, markup: str) -> List[ParsedItem]:
+        if ITEM_CLASS not in markup:
+            return []
+        items, failures = _parse_markup(markup, self.backend)
+        self.items.extend(items)
+        self.failures += failures
+        return items
+
+
+def parse_content(
+    content: bytes, encoding: Optional[str], backend: str = DEFAULT_PARSER
+) -> Tuple[List[tuple], int]:
+    """As ``parse_items``, but from the raw bytes of a page, returning each
+    item as a plain tuple of its `ParsedItem` fields.
+
+    Run in the worker processes of ``process_pool``, so takes and returns
+    only what is cheap to send between processes.
+
+    Args:
+        content: The raw bytes of a wishlist page.
+        encoding: The page's encoding, from its response headers. utf-8 is
+            assumed if `None`.
+        backend: Optional; One of `PARSER_BACKENDS`.
+    """
+    markup = content.decode(encoding or "utf-8", errors="replace")
+    items, failures = parse_items(markup, backend)
+    return [tuple(item) for item in items], failures
+
+
+def process_pool(processes: int) -> "ProcessPoolExecutor":
+    """Return a pool of ``processes`` worker processes to parse pages with
+    ``parse_content``.
+
+    Workers are started by a fork server where available, rather than
+    forked from the calling process while its request threads are running,
+    and import the parser as they start.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context(method),
+        initializer=_import_parser,
+    )
+
+
+def _import_parser() -> None:
+    import bs4  # type: ignore # noqa: F401
+
+
+def item_list_region(markup: str) -> str:
+    """Return the part of a wishlist page from the first item to the last.
+
+    The region starts at the `li` tag of the first item and ends at the first
+    end of list marker after it, or the end of the page if none is found.
+    """
+    first_item = markup.find(ITEM_CLASS)
+    if first_item == -1:
+        return ""
+    start = markup.rfind("<li", 0, first_item)
+    end = len(markup)
+    for marker in END_OF_LIST_MARKERS:
+        found = markup.find(marker, first_item)
+        if found != -1:
+            end = min(end, markup.rfind("<", 0, found))
+    return markup[start:end]
+
+
+def parse_item(item: "bs4.element.Tag") -> ParsedItem:
+    """Parse a single wishlist item's `li` element.
+
+    Raises:
+        KeyError: An expected attribute is missing from the item.
+        TypeError: An expected element is missing from the item.
+    """
+    title = item.find("a", attrs={"class": "a-link-normal"})["title"]
+    byline = item.find("span", attrs={"class": "a-size-base"}).text.strip()
+    price = item["data-price"]
+    # For out of stock items Amazon sets "data-price" price to
+    # "-Infinity". We set price to sys.maxsize so an alert is
+    # generated when the item is restocked.
+    if price == "-Infinity":
+        price = sys.maxsize
+    url = item.find("a", attrs={"class": "a-link-normal"})["href"]
+
+    # Asin found in li class attrs as part of a json string.
+    item_attrs_json = item.attrs["data-reposition-action-params"]
+    item_attrs = json.loads(item_attrs_json)
+    asin_and_marketplace_id = item_attrs["itemExternalId"].split("|")
+    asin = asin_and_marketplace_id[0].lstrip("ASIN:")
+
+    return ParsedItem(title=title, byline=byline, price=price, url=url, asin=asin)
@@ -0,0 +1,87 @@
+"""Prices as integer minor units.
+
+Prices are scraped and saved as strings (e.g. "12.99"), with out of stock
+items saved as `sys.maxsize`. To compare them exactly, without parsing each
+as a float, they are converted to an integer number of minor units, i.e.
+hundredths of the currency (e.g. 1299 pence).
+
+Comparisons between columns of prices are made with NumPy if it is
+installed, otherwise in pure Python.
+"""
+
+import sys
+from typing import List, Sequence, Tuple, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from my_types import MinorUnits
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .my_types import MinorUnits
+
+# Price of an out of stock item. Greater than any real price, so an alert is
+# generated when the item is restocked.
+OUT_OF_STOCK: MinorUnits = MinorUnits(sys.maxsize)
+_OUT_OF_STOCK_STRINGS = {"-Infinity", "Infinity", "inf", "-inf", str(sys.maxsize)}
+
+
+def to_minor_units(price: Union[str, int, float]) -> MinorUnits:
+    """Convert a scraped or saved ``price`` to integer minor units.
+
+    Raises:
+        ValueError: ``price`` is not a number.
+    """
+    if price == sys.maxsize or price in _OUT_OF_STOCK_STRINGS:
+        return OUT_OF_STOCK
+    if isinstance(price, str):
+        # Fast path for the usual "12.99" / "1049.5" / "7" formats.
+        whole, _, fraction = price.partition(".")
+        if whole.isdigit() and (fraction.isdigit() or not fraction):
+            if len(fraction) <= 2:
+                return MinorUnits(int(whole) * 100 + int(fraction.ljust(2, "0")))
+    from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+    try:
+        minor = (Decimal(str(price)) * 100).quantize(Decimal(1), ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"Invalid price: {price!r}") from None
+    return MinorUnits(min(int(minor), OUT_OF_STOCK))
+
+
+def from_minor_units(price: MinorUnits) -> str:
+    """Format ``price`` in minor units as a price string, to be saved.
+
+    >>> from_minor_units(MinorUnits(1299))
+    '12.99'
+    """
+    if price >= OUT_OF_STOCK:
+        return str(sys.maxsize)
+    return f"{price // 100}.{price % 100:02d}"
+
+
+def compare_columns(
+    old: Sequence[MinorUnits], new: Sequence[MinorUnits]
+) -> Tuple[List[int], List[int]]:
+    """Compare aligned columns of ``old`` and ``new`` prices.
+
+    Args:
+        old: Prices in minor units.
+        new: Prices in minor units, of the same items in the same order.
+
+    Returns:
+        A tuple of the indices where the new price is lower, and the indices
+        where the new price is higher.
+    """
+    try:
+        import numpy  # type: ignore
+    except ImportError:
+        cheaper = [i for i, (o, n) in enumerate(zip(old, new)) if n < o]
+        dearer = [i for i, (o, n) in enumerate(zip(old, new)) if n > o]
+        return cheaper, dearer
+
+    old_array = numpy.fromiter(old, dtype=numpy.int64, count=len(old))
+    new_array = numpy.fromiter(new, dtype=numpy.int64, count=len(new))
+    return (
+        numpy.flatnonzero(new_array < old_array).tolist(),
+        numpy.flatnonzero(new_array > old_array).tolist(),
+    )
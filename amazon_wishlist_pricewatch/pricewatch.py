@@ -1,24 +1,168 @@
+import argparse
+import html
 import json
-import random
+import re
 import sys
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Optional, Iterator
-from urllib.parse import urlparse
+from typing import (
+    TYPE_CHECKING,
+    Collection,
+    List,
+    Dict,
+    Optional,
+    Iterable,
+    Iterator,
+    Tuple,
+    Union,
+)
+from urllib.parse import urljoin, urlparse
 
-import bs4  # type: ignore
-import requests
+# requests is slow to import, so is only imported once a page is requested.
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    import requests
 
 if __package__ is None or __package__ == "":
     # Uses current directory visibility when not running as a package.
+    import aggregates
+    import alerts
+    import daemon
+    import fetch
+    import metrics
     import notify
-    from logger import logger
-    from my_types import WishlistItem, WishlistDict
+    import page_cache
+    import parsers
+    import prices
+    import profiling
+    import settings
+    import shared_cache
+    import snapshot
+    import storage
+    import tenants
+    from logger import fields, logger, sample, setup_logging
+    from my_types import (
+        MinorUnits,
+        ParsedItem,
+        PreviousPrices,
+        WishlistItem,
+        WishlistDict,
+    )
 else:
     # Uses current package visibility when running as a package or with pytest.
-    from . import notify
-    from .logger import logger
-    from .my_types import WishlistItem, WishlistDict
+    from . import (
+        aggregates,
+        alerts,
+        daemon,
+        fetch,
+        metrics,
+        notify,
+        page_cache,
+        parsers,
+        prices,
+        profiling,
+        settings,
+        shared_cache,
+        snapshot,
+        storage,
+        tenants,
+    )
+    from .logger import fields, logger, sample, setup_logging
+    from .my_types import (
+        MinorUnits,
+        ParsedItem,
+        PreviousPrices,
+        WishlistItem,
+        WishlistDict,
+    )
+
+# Placeholder `wishlist_url` shipped in the default `config.json`.
+PLACEHOLDER_WISHLIST_URL = settings.PLACEHOLDER_WISHLIST_URL
+# Directory state is kept in between runs when none is given: the same path as
+# this source file.
+DEFAULT_STATE_DIR = Path(__file__).parent
+# Bytes read at a time from a page streamed with `stream_pages`.
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Class of the "see more" (pagination) link at the bottom of a wishlist page.
+SEE_MORE_CLASS = "a-size-base a-link-nav-icon a-js g-visible-no-js wl-see-more"
+_SEE_MORE_TAG_RE = re.compile(rb"<a\s[^>]*wl-see-more[^>]*>", re.IGNORECASE)
+_TAG_ATTR_RE = re.compile(rb"""([\w-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+
+def get_wishlist_urls(config: Dict) -> List[str]:
+    """Return every wishlist to be watched from the loaded ``config``.
+
+    The optional `wishlist_urls` list followed by `wishlist_url`, less
+    duplicates and the placeholder URL. Empty if the user has not filled in
+    `config.json`.
+    """
+    return settings.wishlist_urls(config["general"])
+
+
+def find_next_page_url(response: "requests.Response") -> Optional[str]:
+    """Find the URL of the wishlist page following ``response``.
+
+    The raw page is scanned for the "see more" (pagination) link rather than
+    being parsed, so the next page can be requested while this one is still
+    being parsed.
+
+    Args:
+        response: A `requests.Response` object of a wishlist page.
+
+    Returns:
+        The full URL of the next page of the wishlist, or `None` if this is the
+        last page or the page has no items.
+    """
+    content = response.content
+    if b"g-item-sortable" not in content:
+        # Pagination led to page without any items or wishlist was empty.
+        return None
+    for tag in _SEE_MORE_TAG_RE.finditer(content):
+        attrs = {
+            name.decode().lower(): html.unescape((double or single).decode())
+            for name, double, single in _TAG_ATTR_RE.findall(tag.group())
+        }
+        if " ".join(attrs.get("class", "").split()) == SEE_MORE_CLASS:
+            if "href" in attrs:
+                # The link is relative to the page it was found on, which may
+                # belong to any of the watched wishlists' domains.
+                return urljoin(response.url, attrs["href"])
+    return None
+
+
+def requested_url(response: "requests.Response") -> str:
+    """Return the URL requested for ``response``, before any redirects.
+
+    Pages are kept in `page_cache` by this URL, as it is the one requested
+    conditionally with the cached validators.
+    """
+    return response.history[0].url if response.history else response.url
+
+
+def absolute_urls(items: List[ParsedItem], page_url: str) -> List[ParsedItem]:
+    """Return ``items`` with each URL made absolute against ``page_url``, the
+    URL of the wishlist page they were found on.
+    """
+    return [item._replace(url=urljoin(page_url, item.url)) for item in items]
+
+
+def is_transient(error: Exception) -> bool:
+    """Return True if a request failing with ``error`` is worth retrying.
+
+    Timeouts, connection errors, throttling and server errors may succeed if
+    retried. Other errors, such as "404 Not Found", won't.
+    """
+    import requests
+
+    if isinstance(error, fetch.ThrottledError):
+        return True
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
 
 
 class PriceWatch:
@@ -31,82 +175,551 @@ class PriceWatch:
 
     Attributes:
         config: A dictionary of configuration values loaded from `config.json`.
-        wishlist: A `Wishlist` class instance to store items retrieved and parsed
+        settings: The `settings.Settings` parsed from `config`, which every
+            value used is read from.
+        wishlist_class: `CompactWishlist` if `compact_wishlist` is set to "1"
+            in `config.json`, otherwise `Wishlist`.
+        wishlist: A `wishlist_class` instance to store items retrieved and parsed
             during the current run.
         json_man: A `JsonManager` instance to access wishlist data from previous
-            runs, and to store data for the next run.
+            runs, and to store data for the next run. A `storage.SqliteManager`
+            if `storage` is set to "sqlite" in `config.json`, or a
+            `snapshot.SnapshotManager` if set to "snapshot".
         headers: Headers dictionary to be used in web requests. A user specified
             `User-Agent` is retrieved from `config.json`.
         session: A `requests.session` instance to persist parameters/cookies
             across requests.
         wishlist_url: The wishlist URL used for the initial request.
-        wishlist_domain: The domain of the wishlist URL to be concatenated with
-            additional page (pagination) paths.
+        wishlist_domain: The domain of the wishlist URL.
+        wishlist_urls: Every wishlist to be watched. The optional
+            `wishlist_urls` list from `config.json` followed by `wishlist_url`,
+            less duplicates and the placeholder URL.
+        base_url: Scheme and host every page is requested from in place of
+            Amazon's, if `base_url` is set in the `fetch` section of
+            `config.json`. For load testing with `replay.ReplayServer`.
+        fetch_engine: A `fetch.FetchEngine` to crawl `wishlist_urls`, holding
+            the rate limit and circuit breaker for each domain.
+        max_attempts: Times a page is requested before giving up.
+        retry_seconds: Delay before retrying a request, before it grows with
+            each attempt and jitter is applied.
+        stream_pages: Whether pages are parsed as they download, and only
+            read as far as needed (see ``stream_page``).
+        failed_wishlists: URLs of wishlists which failed to be fetched in full
+            on the last run.
+        parser: The `parsers` backend used to parse wishlist pages.
+        parse_processes: Number of worker processes pages are parsed by while
+            fetching wishlists, or 0 to parse them in this process.
+        page_cache: A `page_cache.PageCache` of pages seen on previous runs, or
+            `None` if `page_cache` is set to "0" in `config.json`.
+        price_stats: An `aggregates.PriceStats` of the rolling price
+            aggregates of each item, or `None` if `price_stats` is set to "0"
+            in `config.json`.
+        metrics: A `metrics.Metrics` of the current run's stage timings and
+            counts. Replaced at the start of each run by ``run_pass``.
+        profiler: A `profiling.StageProfiler` each stage of a run is profiled
+            by, or `None`. Set by ``profiling.profile_pass``.
+        state_dir: Directory the wishlist saved for the next run, the page
+            cache and the price aggregates are kept in. `DEFAULT_STATE_DIR`
+            by default.
+        alert_rules: The `alerts.RuleSet` compiled from the optional `alerts`
+            section of `config.json`, deciding which price drops are alerted on.
+        fired_rules: Name of the alert rule which fired for each item alerted
+            on by the last ``compare_prices``, keyed by ASIN.
+        shared_cache: A `shared_cache.SharedWishlistCache` of wishlists
+            fetched by other instances, or `None` if not shared.
     """
 
-    def __init__(self):
-        """Inits the PriceWatch class."""
-        self.config = notify.get_config()
-        self.wishlist = Wishlist()
-        self.json_man = JsonManager()
+    def __init__(
+        self,
+        config: Optional[Union[Dict, settings.Settings]] = None,
+        state_dir: Optional[Path] = None,
+        shared_cache_dir: Optional[Path] = None,
+    ):
+        """Inits the PriceWatch class.
+
+        Args:
+            config: Optional; The loaded `config.json`, or the
+                `settings.Settings` parsed from it. Loaded with
+                ``notify.get_config`` if not given.
+            state_dir: Optional; Directory to keep state between runs in, so
+                many configs can be run from one install. See `tenants.py`.
+            shared_cache_dir: Optional; Directory of a
+                `shared_cache.SharedWishlistCache` to share fetched wishlists
+                through. Overridden by `shared_cache_dir` in the `fetch`
+                section of `config.json`.
+
+        Raises:
+            settings.ConfigError: A value in ``config`` is missing or invalid.
+        """
+        if config is None:
+            config = notify.get_config()
+        self.settings = (
+            config if isinstance(config, settings.Settings) else settings.parse(config)
+        )
+        self.config = self.settings.raw
+        general = self.settings.general
+        self.wishlist_class = CompactWishlist if general.compact_wishlist else Wishlist
+        self.wishlist = self.wishlist_class()
+        self.state_dir = DEFAULT_STATE_DIR if state_dir is None else state_dir
+        if general.storage == "sqlite":
+            self.json_man = storage.SqliteManager(
+                Path(self.state_dir, "wishlist_items.sqlite3")
+            )
+        elif general.storage == "snapshot":
+            self.json_man = snapshot.SnapshotManager(
+                Path(self.state_dir, "wishlist_items.snapshot")
+            )
+        else:
+            self.json_man = JsonManager(Path(self.state_dir, "wishlist_items.json"))
         self.headers = {
-            "User-Agent": self.config["general"]["user_agent"],
+            "User-Agent": general.user_agent,
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
             "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8",
-            "Accept-Encoding": "gzip, deflate",
+            "Accept-Encoding": fetch.accept_encoding(),
             "DNT": "1",
             "Connection": "keep-alive",
             "Upgrade-Insecure-Requests": "1",
         }
+        import requests
+
         self.session = requests.session()
         self.session.headers.update(self.headers)
-        self.wishlist_url = self.config["general"]["wishlist_url"]
+        fetch_settings = self.settings.fetch
+        self.wishlist_url = general.wishlist_url
         self.wishlist_domain = urlparse(self.wishlist_url).netloc
+        self.wishlist_urls = list(general.wishlist_urls)
+        self.base_url = fetch_settings.base_url
+        if self.base_url:
+            self.wishlist_url = fetch.rebase_url(self.wishlist_url, self.base_url)
+            self.wishlist_urls = [
+                fetch.rebase_url(url, self.base_url) for url in self.wishlist_urls
+            ]
+        self.parser = general.parser
+        parsers.check_backend(self.parser)
+        self.parse_processes = general.parse_processes
+        self._parse_pool: Optional["ProcessPoolExecutor"] = None
+        # Held while changing the wishlist and page cache, as pages may be
+        # parsed on many threads.
+        self._parse_lock = threading.Lock()
+        self.page_cache = (
+            page_cache.PageCache(Path(self.state_dir, "page_cache.json"))
+            if general.page_cache
+            else None
+        )
+        self.price_stats = (
+            aggregates.PriceStats(Path(self.state_dir, "price_stats.json"))
+            if general.price_stats
+            else None
+        )
+        self.metrics = metrics.Metrics()
+        self.profiler: Optional[profiling.StageProfiler] = None
+        self.fetch_engine = fetch.FetchEngine(
+            self.request_page_once,
+            self.parse_page,
+            self.next_page_url,
+            max_concurrency=fetch_settings.max_concurrency,
+            requests_per_second=fetch_settings.requests_per_second,
+            burst=fetch_settings.burst,
+            breaker_failures=fetch_settings.circuit_breaker_failures,
+            breaker_reset_seconds=fetch_settings.circuit_breaker_reset_seconds,
+            parse_concurrency=max(self.parse_processes, 1),
+        )
+        self.stream_pages = fetch_settings.stream_pages
+        self.max_attempts = fetch_settings.max_attempts
+        self.retry_seconds = fetch_settings.retry_seconds
+        self.failed_wishlists: List[str] = []
+        shared_cache_dir = fetch_settings.shared_cache_dir or shared_cache_dir
+        self.shared_cache = (
+            shared_cache.SharedWishlistCache(
+                shared_cache_dir, fetch_settings.shared_cache_ttl_seconds
+            )
+            if shared_cache_dir and fetch_settings.shared_cache_ttl_seconds > 0
+            else None
+        )
+        # Items and next page URL of each page parsed while sharing wishlists,
+        # keyed by the normalized URL requested.
+        self._page_items: Dict[str, Tuple[List[ParsedItem], Optional[str]]] = {}
+        self.alert_rules = self.settings.alert_rules
+        self.fired_rules: Dict[str, str] = {}
 
-    def request_page(self, wishlist_url: Optional[str] = None) -> requests.Response:
+    def request_page(self, wishlist_url: Optional[str] = None) -> "requests.Response":
         """Request a wishlist page and return the response.
 
         If no argument for ``wishlist_url`` is supplied, it is assumed a request to
         the first wishlist page is being made, which is retrieved from the class
-        `wishlist_url` attribute. In the event of a failed request a notification
-        is triggered to the user via the notification methods specified in
-        `config.json` and an exception is raised.
+        `wishlist_url` attribute.
+
+        Each attempt is made by ``request_page_once``. Timeouts, connection
+        errors, server errors and throttling (see ``fetch.throttle_reason``)
+        are retried up to `max_attempts` times after a growing, jittered delay,
+        each retry waiting for a token from the domain's `fetch.TokenBucket`.
+        If the request still fails, an exception is raised.
+
+        Args:
+            wishlist_url: Optional; The wishlist page URL to request.
+
+        Returns:
+            A `requests.Response` object of the wishlist page if the request
+            is successful.
+
+        Raises:
+            See ``request_page_once``, other than `fetch.RetryLater`.
+        """
+        attempt = 1
+        while True:
+            try:
+                return self.request_page_once(wishlist_url, attempt)
+            except fetch.RetryLater as retry:
+                time.sleep(retry.delay)
+                self.fetch_engine.bucket_for(retry.url).wait()
+                attempt = retry.attempt + 1
+
+    def request_page_once(
+        self, wishlist_url: Optional[str] = None, attempt: int = 1
+    ) -> "requests.Response":
+        """Make one attempt at requesting a wishlist page, and return the
+        response.
+
+        Used by `fetch_engine`, which makes the retries itself, so a request
+        waiting to be retried doesn't hold up requests to other domains. See
+        ``request_page`` for ``wishlist_url``.
+
+        Throttling also slows the request rate to the domain, and repeated
+        failures stop requests to it for a while (see `fetch.CircuitBreaker`).
+
+        Pages held in `page_cache` are requested conditionally. If the page is
+        unchanged a "304 Not Modified" response without a body is returned.
+        Pages are cached by the URL requested, even if redirected (see
+        ``requested_url``). A 304 for a page not cached is requested again
+        without validators.
+
+        If `stream_pages` is set, the items on the page are parsed as it
+        downloads, and the page is only read as far as needed (see
+        ``stream_page``).
 
         Args:
             wishlist_url: Optional; The wishlist page URL to request.
+            attempt: Optional; Number of this attempt, from 1.
 
         Returns:
             A `requests.Response` object of the wishlist page if the request
             is successful.
 
         Raises:
+            fetch.RetryLater: The request failed, and is to be retried, up to
+                `max_attempts` times, after the delay given.
             requests.Timeout: The request timed out.
             requests.URLRequired: An invalid URL was supplied.
             requests.ConnectionError: User's IP may be blocked / bot detection.
             requests.exceptions.RequestException: Requests base exception.
+            fetch.ThrottledError: Amazon is throttling requests or asking for
+                a captcha.
+            fetch.CircuitOpenError: Requests to the domain are stopped after
+                repeated failures.
         """
+        import requests
+
         if not wishlist_url:
             # Visiting first page of wishlist.
             wishlist_url = self.wishlist_url
+        requested = wishlist_url
+        if self.base_url:
+            wishlist_url = fetch.rebase_url(wishlist_url, self.base_url)
+        bucket = self.fetch_engine.bucket_for(wishlist_url)
+        breaker = self.fetch_engine.breaker_for(wishlist_url)
+        breaker.check(wishlist_url)
         try:
-            res = self.session.get(wishlist_url, timeout=10)
+            headers = (
+                self.page_cache.conditional_headers(wishlist_url)
+                if self.page_cache is not None
+                else {}
+            )
+            with self.metrics.span("request_page"):
+                res = self.session.get(
+                    wishlist_url,
+                    headers=headers,
+                    timeout=10,
+                    stream=self.stream_pages,
+                )
+                if res.status_code == 304 and (
+                    self.page_cache is None or wishlist_url not in self.page_cache
+                ):
+                    # Nothing cached to stand in for the page's body.
+                    res.close()
+                    res = self.session.get(
+                        wishlist_url, timeout=10, stream=self.stream_pages
+                    )
+                if self.stream_pages and res.status_code == 200:
+                    self.stream_page(res)
+            reason = fetch.throttle_reason(res)
+            if reason:
+                raise fetch.ThrottledError(wishlist_url, reason, fetch.retry_after(res))
             res.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            notify.failed_request_msg()
-            logger.exception(f"Failed to request wishlist page: {wishlist_url}")
-            raise
+        except (requests.exceptions.RequestException, fetch.ThrottledError) as e:
+            breaker.record_failure()
+            if isinstance(e, fetch.ThrottledError):
+                self.metrics.count("throttled")
+                bucket.slow_down()
+            if attempt >= self.max_attempts or not is_transient(e):
+                logger.exception(
+                    f"Failed to request wishlist page: {wishlist_url}",
+                    extra=fields(page=wishlist_url, stage="request_page"),
+                )
+                raise
+            delay = fetch.retry_delay(
+                attempt, self.retry_seconds, getattr(e, "retry_after", None)
+            )
+            logger.warning(
+                f"Attempt {attempt} of {self.max_attempts} to request"
+                f" {wishlist_url} failed: {e}. Retrying in {delay:.1f}s.",
+                extra=fields(page=wishlist_url, stage="request_page"),
+            )
+            self.metrics.count("retries")
+            raise fetch.RetryLater(requested, attempt, delay) from e
+        breaker.record_success()
+        bucket.speed_up()
 
-        logger.info(f"Success requesting wishlist page: {wishlist_url}")
+        self.metrics.count("pages")
+        self.metrics.count("bytes_downloaded", len(res.content))
+        logger.info(
+            f"Success requesting wishlist page: {wishlist_url}",
+            extra=fields(page=wishlist_url, stage="request_page"),
+        )
         return res
 
-    def parse_wishlist(self, response: requests.Response) -> None:
+    def stream_page(self, response: "requests.Response") -> None:
+        """Read the body of the streamed ``response``, parsing its items as it
+        downloads with a `parsers.StreamingParser`.
+
+        Reading stops once the item list and "see more" link have been read,
+        skipping the scripts and footer after them. A page without the link,
+        such as the last page of a wishlist, is read in full. The part of the
+        page read stands in for the whole of it as ``response.content``, and
+        the items parsed are kept as ``response.streamed_items`` for
+        ``page_items``.
+
+        As items are parsed before the page has downloaded, a changed page
+        can't be told from an unchanged one in time to skip parsing it (see
+        ``parse_page``). Only a "304 Not Modified" response skips it.
+        """
+        import codecs
+
+        parser = parsers.StreamingParser(self.parser)
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+            errors="replace"
+        )
+        chunks = []
+        cut_short = False
+        try:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                chunks.append(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done:
+                    cut_short = True
+                    self.metrics.count("pages_cut_short")
+                    break
+            else:
+                parser.feed(decoder.decode(b"", final=True))
+                parser.close()
+        finally:
+            # Closes the connection if the page wasn't read in full.
+            response.close()
+        response._content = b"".join(chunks)
+        response.streamed_items = (parser.items, parser.failures)
+        if cut_short and find_next_page_url(response) is None:
+            # The link was found by the parser but isn't one to follow, so
+            # the rest of the wishlist may be missed.
+            self.metrics.count("pages_cut_short_without_next")
+            logger.warning(
+                f'Stopped reading {response.url} at a "see more" link without'
+                " a next page URL. Pages after it may be missed.",
+                extra=fields(page=response.url, stage="request_page"),
+            )
+
+    def fetch_wishlists(self) -> None:
+        """Request and parse every page of every wishlist in `wishlist_urls`.
+
+        Wishlists are crawled concurrently by `fetch_engine`, with the number
+        of requests in flight and the request rate per domain limited by the
+        optional `fetch` section of `config.json`.
+
+        A wishlist which fails doesn't stop the rest. Its URL is added to
+        `failed_wishlists`, the user is notified, and items parsed from it
+        before it failed are kept.
+
+        If `shared_cache` is set, wishlists are shared with other instances
+        (see ``fetch_shared_wishlists``). If `parse_processes` is set, pages
+        are parsed by a pool of that many processes (see ``parse_pool``).
+
+        Returns:
+            None
+
+        Raises:
+            Exception: The first wishlist's exception, if every wishlist failed
+                without any items being parsed.
+        """
+        with self.parse_pool():
+            if self.shared_cache is None:
+                failures = self.fetch_engine.run(
+                    self.wishlist_urls, return_exceptions=True
+                )
+            else:
+                failures = self.fetch_shared_wishlists()
+        self.failed_wishlists = list(failures)
+        if not failures:
+            logger.info(f"Success parsing {len(self.wishlist_urls)} wishlist(s).")
+            return
+        for url, error in failures.items():
+            logger.error(
+                f"Failed to fetch wishlist {url}: {error}",
+                extra=fields(wishlist=url, stage="fetch_wishlists"),
+            )
+        self.metrics.count("failed_wishlists", len(failures))
+        notify.failed_request_msg()
+        if len(failures) == len(self.wishlist_urls) and self.wishlist.is_empty():
+            raise next(iter(failures.values()))
+        logger.warning(
+            f"Parsed {len(self.wishlist_urls) - len(failures)} of"
+            f" {len(self.wishlist_urls)} wishlist(s) in full."
+        )
+
+    @contextmanager
+    def parse_pool(self) -> Iterator[None]:
+        """Parse pages with a pool of `parse_processes` worker processes (see
+        ``parsers.process_pool``) until exiting the context.
+
+        Only the raw bytes of each page are sent to a worker, and only plain
+        item tuples returned, which are merged into `wishlist` in this
+        process. Does nothing if `parse_processes` is 0.
+        """
+        if not self.parse_processes:
+            yield
+            return
+        self._parse_pool = parsers.process_pool(self.parse_processes)
+        try:
+            yield
+        finally:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
+
+    def fetch_shared_wishlists(self) -> Dict[str, Exception]:
+        """Fetch every wishlist in `wishlist_urls`, sharing them with other
+        instances through `shared_cache`.
+
+        Wishlists fetched by another instance within the cache's time to live
+        are taken from the cache without being requested. The rest are
+        claimed, fetched and shared. Wishlists another instance is fetching
+        right now are waited for once this instance's own are fetched, and
+        fetched here if the other instance fails to share them.
+
+        Returns:
+            The exception each failed wishlist raised, keyed by its URL.
+        """
+        shared = self.shared_cache
+        claimed = []
+        waiting = []
+        for url in self.wishlist_urls:
+            if self.add_shared_items(url, shared.get(url)):
+                continue
+            (claimed if shared.claim(url) else waiting).append(url)
+        try:
+            failures = self.fetch_engine.run(claimed, return_exceptions=True)
+            for url in claimed:
+                items = None if url in failures else self.wishlist_items(url)
+                if items is not None:
+                    shared.put(url, items)
+                shared.release(url)
+            unshared = [
+                url
+                for url in waiting
+                if not self.add_shared_items(url, shared.wait(url))
+            ]
+            failures.update(self.fetch_engine.run(unshared, return_exceptions=True))
+        finally:
+            for url in claimed:
+                shared.release(url)
+            self._page_items = {}
+        return failures
+
+    def add_shared_items(self, url: str, items: Optional[List[ParsedItem]]) -> bool:
+        """Add the ``items`` of wishlist ``url`` from `shared_cache` to
+        `self.wishlist`. Return `False` if ``items`` is `None`.
+        """
+        if items is None:
+            return False
+        for item in items:
+            self.wishlist.add_item(
+                title=item.title,
+                byline=item.byline,
+                price=item.price,
+                url=item.url,
+                asin=item.asin,
+            )
+        self.metrics.count("shared_wishlists")
+        logger.info(
+            f"Using items of {url} from the shared cache.",
+            extra=fields(wishlist=url, stage="fetch_wishlists"),
+        )
+        return True
+
+    def wishlist_items(self, url: str) -> Optional[List[ParsedItem]]:
+        """Return the items parsed this run from every page of the wishlist
+        starting at ``url``, or `None` if any page wasn't parsed.
+        """
+        items: List[ParsedItem] = []
+        page_url: Optional[str] = url
+        seen = set()
+        while page_url is not None:
+            page_key = shared_cache.normalize_url(page_url)
+            if page_key not in self._page_items or page_key in seen:
+                return None
+            seen.add(page_key)
+            page_items, page_url = self._page_items[page_key]
+            items.extend(page_items)
+        return items
+
+    def iter_pages(
+        self, response: "requests.Response"
+    ) -> Iterator["requests.Response"]:
+        """Yield ``response`` and each page of the wishlist following it.
+
+        The next page is requested in the background as soon as its URL is
+        found, so it downloads while the caller parses the page just yielded.
+        Only the page being parsed and the one being prefetched are held at
+        any time. Requests are rate limited per domain by `fetch_engine`.
+
+        Args:
+            response: A `requests.Response` object of a wishlist page.
+
+        Returns:
+            An iterator of `requests.Response` objects, one per page.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        def request_next_page(url: str) -> "requests.Response":
+            # Avoid bombarding Amazon with requests to avoid bot detection.
+            self.fetch_engine.bucket_for(url).wait()
+            return self.request_page(url)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page: Optional["requests.Response"] = response
+            while page is not None:
+                next_page_url = self.next_page_url(page)
+                prefetch = (
+                    executor.submit(request_next_page, next_page_url)
+                    if next_page_url
+                    else None
+                )
+                yield page
+                page = prefetch.result() if prefetch else None
+
+    def parse_wishlist(self, response: "requests.Response") -> None:
         """Parse wishlist items from a ``requests.Response``.
 
         Parse the wishlist request response for each item's `title`, `byline`,
         `price`, `url` and `asin`. Add items to the `self.wishlist` obj. If a
-        "see more" (pagination) link is found, a recursive call is made to
-        request and parse the next page. Sleeps for 1000-2000ms between each
-        request.
+        "see more" (pagination) link is found, the next page is requested and
+        parsed in turn, until the last page of the wishlist.
 
         Args:
             response: A `requests.Response` object of a wishlist page.
@@ -114,106 +727,209 @@ class PriceWatch:
         Returns:
             None
         """
-        soup = bs4.BeautifulSoup(response.text, features="html.parser")
-        items = soup.find_all("li", attrs={"class": "a-spacing-none g-item-sortable"})
+        for page in self.iter_pages(response):
+            self.parse_page(page)
+        logger.info("Success parsing wishlist.")
 
-        if items:
-            for item in items:
-                try:
-                    title = item.find("a", attrs={"class": "a-link-normal"})["title"]
-                    byline = item.find(
-                        "span", attrs={"class": "a-size-base"}
-                    ).text.strip()
-                    price = item["data-price"]
-                    # For out of stock items Amazon sets "data-price" price to
-                    # "-Infinity". We set price to sys.maxsize so an alert is
-                    # generated when the item is restocked.
-                    if price == "-Infinity":
-                        price = sys.maxsize
-                    url = item.find("a", attrs={"class": "a-link-normal"})["href"]
-
-                    # Asin found in li class attrs as part of a json string.
-                    item_attrs_json = item.attrs["data-reposition-action-params"]
-                    item_attrs = json.loads(item_attrs_json)
-                    asin_and_marketplace_id = item_attrs["itemExternalId"].split("|")
-                    asin = asin_and_marketplace_id[0].lstrip("ASIN:")
-
-                    self.wishlist.add_item(
-                        title=title,
-                        byline=byline,
-                        price=price,
-                        url=url,
-                        asin=asin,
-                    )
-                except (KeyError, TypeError) as e:
-                    logger.warning(
-                        "Failed to parse a wishlist item. Item may no longer be available."
-                    )
+    def next_page_url(self, response: "requests.Response") -> Optional[str]:
+        """Return the URL of the wishlist page following ``response``.
 
-            # Check for pagination / next page of wishlist.
-            see_more = soup.find(
-                "a",
-                attrs={
-                    "class": "a-size-base a-link-nav-icon "
-                    "a-js g-visible-no-js wl-see-more"
-                },
-            )
-            if see_more:
-                # Avoid bombarding Amazon with requests to avoid bot detection.
-                time.sleep(random.randint(1000, 2000) / 1000.0)
-                self.parse_wishlist(
-                    self.request_page(
-                        f"https://{self.wishlist_domain}{see_more['href']}"
-                    )
+        As ``find_next_page_url``, but for an unchanged "304 Not Modified"
+        page the URL is taken from `page_cache`.
+        """
+        if response.status_code == 304 and self.page_cache is not None:
+            return self.page_cache.get_next_url(requested_url(response))
+        return find_next_page_url(response)
+
+    def parse_page(self, response: "requests.Response") -> None:
+        """Parse the items on a single wishlist page.
+
+        Items found are added to the `self.wishlist` obj as in
+        ``parse_wishlist``, but pagination is not followed. See
+        ``next_page_url`` for that.
+
+        If the page is unchanged since cached in `page_cache`, either because
+        a "304 Not Modified" response was received or because the part of the
+        page holding the items is identical, the cached items are used and the
+        page is not parsed. A page streamed with `stream_pages` has already
+        been parsed, so its items are used and cached whether changed or not.
+
+        Args:
+            response: A `requests.Response` object of a wishlist page.
+
+        Returns:
+            None
+        """
+        with self.metrics.span("parse_page"):
+            items, failures = self.page_items(response)
+        self.metrics.count("items_parsed", len(items))
+        self.metrics.count("parse_failures", failures)
+        with self._parse_lock:
+            if self.shared_cache is not None:
+                # Keyed as the page is requested, as it is looked up by the
+                # URL of the wishlist or of the "see more" link leading to it.
+                self._page_items[
+                    shared_cache.normalize_url(requested_url(response))
+                ] = (
+                    items,
+                    self.next_page_url(response),
                 )
-            else:
-                # No more pages to wishlist.
-                logger.info("Success parsing wishlist.")
-                return
-        else:
+            for item in items:
+                self.wishlist.add_item(
+                    title=item.title,
+                    byline=item.byline,
+                    price=item.price,
+                    url=item.url,
+                    asin=item.asin,
+                )
+        if failures:
+            logger.warning(
+                f"Failed to parse {failures} wishlist item(s) on page {response.url}."
+                " Items may no longer be available.",
+                extra=fields(page=response.url, stage="parse_page"),
+            )
+        if not items and not failures:
             # Pagination led to page without any items or wishlist was empty.
             logger.warning(
-                f"End of wishlist or wrong URL? No items found on page {response.url}."
+                f"End of wishlist or wrong URL? No items found on page {response.url}.",
+                extra=fields(page=response.url, stage="parse_page"),
             )
-            return
+
+    def page_items(self, response: "requests.Response") -> Tuple[List[ParsedItem], int]:
+        """Return the items on a single wishlist page, and the number of items
+        which failed to parse. The items parsed while the page downloaded are
+        returned if it was streamed (see ``stream_page``), otherwise cached
+        items if the page is unchanged since cached in `page_cache` (see
+        ``parse_page``). Item URLs are made absolute against the page's URL,
+        as the watched wishlists may be on different domains.
+        """
+        items = None
+        failures = 0
+        page_digest = None
+        page_url = requested_url(response)
+        streamed_items = getattr(response, "streamed_items", None)
+        if self.page_cache is not None:
+            if response.status_code == 304:
+                with self._parse_lock:
+                    items = self.page_cache.get_items(page_url)
+            else:
+                page_digest = page_cache.digest(parsers.item_list_region(response.text))
+                if streamed_items is None:
+                    with self._parse_lock:
+                        items = self.page_cache.get_items(page_url, page_digest)
+        if items is None:
+            items, failures = streamed_items or self.parse_items(response)
+            items = absolute_urls(items, response.url)
+            if page_digest is not None:
+                next_page_url = find_next_page_url(response)
+                with self._parse_lock:
+                    self.page_cache.store(
+                        page_url,
+                        response.headers,
+                        page_digest,
+                        items,
+                        next_page_url,
+                    )
+        else:
+            # Cached by an older version, with item URLs relative to the page.
+            items = absolute_urls(items, response.url)
+        return items, failures
+
+    def parse_items(
+        self, response: "requests.Response"
+    ) -> Tuple[List[ParsedItem], int]:
+        """Parse the items on a single wishlist page with `parser`, in a worker
+        of the pool of ``parse_pool`` if open, as ``parsers.parse_items``.
+        """
+        if self._parse_pool is None:
+            return parsers.parse_items(response.text, self.parser)
+        item_tuples, failures = self._parse_pool.submit(
+            parsers.parse_content, response.content, response.encoding, self.parser
+        ).result()
+        return [ParsedItem(*item) for item in item_tuples], failures
 
     def compare_prices(self) -> Optional[List[WishlistItem]]:
         """Compare prices of items between two `Wishlist` objects.
 
         Compare prices of each item found in the current run's `Wishlist`
-        against the best price seen for that item across previous runs. Items
-        are matched by their `asin`. If a new lowest price is found, a dictionary
-        of the item's attrs is added to the list `new_cheaper_items`.
+        against the best price seen for that item across previous runs, looked
+        up in the store `json_man` by ``get_lowest_prices``. Items are matched
+        by their `asin`. If an alert rule fires for an item (by
+        default, if a new lowest price is found), a dictionary of the item's
+        attrs is added to the list `new_cheaper_items`, and the rule's name to
+        `fired_rules`.
+
+        Prices are compared, and `alert_rules` evaluated, in a single batch, as
+        aligned columns of integer minor units (see `prices.py`). The rolling
+        aggregates needed by window rules are read from `price_stats` before
+        the current prices are recorded in it.
 
         Returns:
-            new_cheaper_items: A list of `WishlistItem` dicts which have a new
-                lowest seen price. Or an empty list if no new price reductions
-                are found.
+            new_cheaper_items: A list of `WishlistItem` dicts which an alert
+                rule fired for. Or an empty list if no rule fired.
         """
         new_cheaper_items = []  # Store items found to have a price reduction.
-        # Load wishlist from last run of program.
-        prev_wishlist = Wishlist(self.json_man.get_wishlist_dict())
-        if prev_wishlist.is_empty():
+        self.fired_rules = {}
+        now = time.time()
+        # Prices found this run, before any are replaced with lower old ones.
+        current = dict(self.wishlist.minor_prices())
+        # Lowest prices saved by previous runs, looked up in the store.
+        previous = self.json_man.get_lowest_prices(current)
+        if not previous.asins and not previous.removed:
+            if self.price_stats is not None:
+                self.price_stats.observe_many(current.items(), now)
             logger.info(
                 "No previous wishlist to compare against."
                 " Probably running for the first time."
             )
             return None
         else:
-            for item in prev_wishlist:
-                old_price = float(item["price"])
-                try:
-                    current_price = float(self.wishlist.get_item_price(item["asin"]))
-                except KeyError:
-                    logger.info(f"{item['asin']} removed from wishlist. Skipping.")
-                    continue
-                if current_price < old_price:
-                    new_cheaper_items.append(self.wishlist.get_item(item["asin"]))
-                elif current_price > old_price:
-                    # Price has increased. Overwrite current wishlist item price
-                    # with the old, cheaper price to be saved to json for next run.
-                    # This keeps a record of the lowest ever seen price.
-                    self.wishlist.update_price(item["asin"], str(old_price))
+            asins, old_prices, removed = previous
+            if removed:
+                logger.info(
+                    f"{len(removed)} item(s) removed from wishlist. Skipping:"
+                    f" {sample(removed)}.",
+                    extra=fields(stage="compare_prices"),
+                )
+            current_prices = [current[asin] for asin in asins]
+            urls = (
+                [self.wishlist.get_item(asin)["url"] for asin in asins]
+                if self.alert_rules.by_wishlist
+                else None
+            )
+            windows = (
+                {
+                    days: self.price_stats.columns(asins, days, now)
+                    for days in self.alert_rules.window_days
+                }
+                if self.price_stats is not None
+                else None
+            )
+            if self.price_stats is not None:
+                self.price_stats.observe_many(current.items(), now)
+            fired = self.alert_rules.evaluate(
+                asins, old_prices, current_prices, urls, windows
+            )
+            _, dearer = prices.compare_columns(old_prices, current_prices)
+
+            fired_asins: Dict[str, List[str]] = {}
+            for i, rule_name in fired:
+                new_cheaper_items.append(self.wishlist.get_item(asins[i]))
+                self.fired_rules[asins[i]] = rule_name
+                fired_asins.setdefault(rule_name, []).append(asins[i])
+            for rule_name, rule_asins in fired_asins.items():
+                logger.info(
+                    f"Alert rule {rule_name!r} fired for {len(rule_asins)} item(s):"
+                    f" {sample(rule_asins)}.",
+                    extra=fields(stage="compare_prices"),
+                )
+            for i in dearer:
+                # Price has increased. Overwrite current wishlist item price
+                # with the old, cheaper price to be saved to json for next run.
+                # This keeps a record of the lowest ever seen price.
+                self.wishlist.update_price(
+                    asins[i], prices.from_minor_units(old_prices[i])
+                )
 
             if new_cheaper_items:
                 logger.info(
@@ -224,6 +940,29 @@ class PriceWatch:
 
             return new_cheaper_items
 
+    def keep_unfetched_items(self) -> None:
+        """Add each item saved by the previous run, but missing from this run's
+        `wishlist`, back into it as it was.
+
+        Used when some wishlists couldn't be fetched in full, so their items
+        and lowest seen prices aren't lost when the wishlist is saved.
+        """
+        prev_wishlist = self.json_man.prev_wishlist
+        kept = 0
+        for asin in prev_wishlist:
+            if asin not in self.wishlist:
+                item = prev_wishlist[asin]
+                self.wishlist.add_item(
+                    title=item["title"],
+                    price=item["price"],
+                    url=item["url"],
+                    asin=asin,
+                    byline=item["byline"],
+                )
+                kept += 1
+        if kept:
+            logger.info(f"Kept {kept} item(s) from wishlists not fetched in full.")
+
 
 class Wishlist:
     """An Amazon wishlist dictionary based data structure.
@@ -264,6 +1003,14 @@ class Wishlist:
         """Return number of wishlist items in `Wishlist` as int."""
         return len(self.wishlist_dict)
 
+    def __contains__(self, asin: object) -> bool:
+        """Return True if an item with ``asin`` is in the `Wishlist`."""
+        return asin in self.wishlist_dict
+
+    def asins(self) -> Iterator[str]:
+        """Iterate over the `asin` of each item in the `Wishlist`."""
+        return iter(self.wishlist_dict)
+
     def __getitem__(self, asin: str) -> WishlistItem:
         """Return `WishlistItem` matching ``asin``"""
         return self.wishlist_dict[asin]
@@ -272,6 +1019,11 @@ class Wishlist:
         """Return True is `Wishlist` is empty, False otherwise."""
         return self.wishlist_dict == {}
 
+    def minor_prices(self) -> Iterator[Tuple[str, MinorUnits]]:
+        """Iterate over the `asin` and `price` in minor units of each item."""
+        for asin in self.asins():
+            yield asin, prices.to_minor_units(self.get_item_price(asin))
+
     def add_item(
         self, title: str, price: str, url: str, asin: str, byline: Optional[str] = None
     ) -> None:
@@ -311,21 +1063,147 @@ class Wishlist:
         """Get `WishlistItem` by ``asin``"""
         return self.wishlist_dict[asin]
 
+    def to_dict(self) -> WishlistDict:
+        """Return the `Wishlist` as a `Dict[asin, WishlistItem]` to be saved."""
+        return self.wishlist_dict
+
+
+class WishlistRecord:
+    """A single wishlist item, as stored by `CompactWishlist`.
+
+    Holds the same fields as a `WishlistItem` dict in a fraction of the
+    memory, as the fields are stored in fixed slots rather than a dict.
+    """
+
+    __slots__ = ("title", "byline", "price", "url", "asin")
+
+    def __init__(
+        self, title: str, byline: Optional[str], price: str, url: str, asin: str
+    ):
+        """Init the WishlistRecord."""
+        self.title = title
+        self.byline = byline
+        self.price = price
+        self.url = url
+        self.asin = asin
+
+    def as_item(self) -> WishlistItem:
+        """Return the record as a `WishlistItem` dict."""
+        return {
+            "title": self.title,
+            "byline": self.byline,
+            "price": self.price,
+            "url": self.url,
+            "asin": self.asin,
+        }
+
+
+class CompactWishlist(Wishlist):
+    """A `Wishlist` which stores items compactly, for very large wishlists.
+
+    Items are stored as `WishlistRecord` objects rather than dicts, and
+    bylines (often shared, e.g. an author) are interned so each distinct
+    byline is held once. `WishlistItem` dicts are only built when an item is
+    accessed, so dicts returned by ``__getitem__``, ``get_item`` and
+    ``__iter__`` are copies; use ``update_price`` to change an item.
+
+    Args:
+        prev_dict: Optional; If creating a `Wishlist` from a previous run, provide
+        a ``prev_dict`` loaded from `wishlist_items.json`.
+
+    Attributes:
+        records: A dictionary containing all wishlist items in a
+        `Dict[asin, WishlistRecord]` format.
+    """
+
+    def __init__(self, prev_dict: Optional[WishlistDict] = None):
+        """Init the CompactWishlist class."""
+        self.records: Dict[str, WishlistRecord] = {}
+        if prev_dict:
+            for item in prev_dict.values():
+                self.add_item(**item)
+
+    @property
+    def wishlist_dict(self) -> WishlistDict:  # type: ignore
+        """A `Dict[asin, WishlistItem]` copy of all items. Built on each access."""
+        return self.to_dict()
+
+    def __iter__(self) -> Iterator[WishlistItem]:
+        """Iterate over items in the `Wishlist`.
+
+        Returns: `WishlistItem` dictionary.
+        """
+        for record in self.records.values():
+            yield record.as_item()
+
+    def __len__(self) -> int:
+        """Return number of wishlist items in `Wishlist` as int."""
+        return len(self.records)
+
+    def __getitem__(self, asin: str) -> WishlistItem:
+        """Return `WishlistItem` matching ``asin``"""
+        return self.records[asin].as_item()
+
+    def __contains__(self, asin: object) -> bool:
+        """Return True if an item with ``asin`` is in the `Wishlist`."""
+        return asin in self.records
+
+    def asins(self) -> Iterator[str]:
+        """Iterate over the `asin` of each item in the `Wishlist`."""
+        return iter(self.records)
+
+    def is_empty(self) -> bool:
+        """Return True is `Wishlist` is empty, False otherwise."""
+        return not self.records
+
+    def add_item(
+        self, title: str, price: str, url: str, asin: str, byline: Optional[str] = None
+    ) -> None:
+        """Add an item to the Wishlist. See ``Wishlist.add_item``."""
+        self.records[asin] = WishlistRecord(
+            title=title,
+            byline=sys.intern(byline) if byline and len(byline) > 0 else None,
+            price=price,
+            url=url,
+            asin=asin,
+        )
+
+    def update_price(self, asin: str, price: str) -> None:
+        """Update item `price` by ``asin``."""
+        self.records[asin].price = price
+
+    def get_item_price(self, asin: str) -> str:
+        """Get item `price` by ``asin``."""
+        return self.records[asin].price
+
+    def get_item(self, asin: str) -> WishlistItem:
+        """Get `WishlistItem` by ``asin``"""
+        return self.records[asin].as_item()
+
+    def to_dict(self) -> WishlistDict:
+        """Return the `Wishlist` as a `Dict[asin, WishlistItem]` to be saved."""
+        return {asin: record.as_item() for asin, record in self.records.items()}
+
 
 class JsonManager:
     """Manage loading/saving to/from the `wishlist_items` json file.
 
+    Args:
+        wishlist_json_path: Optional; Path to `wishlist_items.json`. Defaults
+            to the same path as this source file.
+
     Attributes:
-        wishlist_json_path: Path to `wishlist_items.json`. File is expected
-            to exist on the same path as this source file.
-        prev_wishlist: Json file loaded as a python dict.
+        wishlist_json_path: Path to `wishlist_items.json`, created when first
+            saved.
+        prev_wishlist: Json file loaded as a python dict. Kept up to date with
+            the last wishlist saved.
     """
 
-    def __init__(self):
+    def __init__(self, wishlist_json_path: Optional[Path] = None):
         """Init JsonManager using `wishlist_json_path`."""
-        self.wishlist_json_path = Path(
-            Path(__file__).parent, "wishlist_items.json"
-        ).resolve()
+        if wishlist_json_path is None:
+            wishlist_json_path = Path(Path(__file__).parent, "wishlist_items.json")
+        self.wishlist_json_path = Path(wishlist_json_path).resolve()
         self.prev_wishlist = self.get_wishlist_dict()
 
     def get_wishlist_dict(self) -> Dict:
@@ -339,45 +1217,252 @@ class JsonManager:
             # Probably running for the first time.
             return {}
 
+    def get_lowest_price(self, asin: str) -> Optional[str]:
+        """Get the lowest `price` seen for ``asin``, or `None` if never seen."""
+        item = self.prev_wishlist.get(asin)
+        return item["price"] if item else None
+
+    def get_lowest_prices(self, asins: Collection[str]) -> PreviousPrices:
+        """Look up the lowest price seen of each of ``asins``, and which items
+        saved by the last run aren't in ``asins``.
+        """
+        prev_wishlist = self.prev_wishlist
+        found = [asin for asin in asins if asin in prev_wishlist]
+        return PreviousPrices(
+            found,
+            [prices.to_minor_units(prev_wishlist[asin]["price"]) for asin in found],
+            [asin for asin in prev_wishlist if asin not in asins],
+        )
+
+    def record_observations(self, items: Iterable[WishlistItem]) -> None:
+        """Does nothing. Only the lowest price seen is kept in json, not the
+        history of prices observed.
+        """
+
     def save_wishlist_json(self, wishlist: Wishlist) -> None:
-        """Save ``wishlist`` as `wishlist_items.json`."""
+        """Save ``wishlist`` as `wishlist_items.json`. Skipped if identical to
+        the wishlist already saved.
+        """
+        wishlist_dict = wishlist.to_dict()
+        if wishlist_dict == self.prev_wishlist and self.wishlist_json_path.exists():
+            return
         with open(self.wishlist_json_path, "w+") as json_file:
-            json.dump(wishlist.wishlist_dict, json_file)
+            json.dump(wishlist_dict, json_file)
+        self.prev_wishlist = wishlist_dict
+
+
+def run_pass(pw: PriceWatch) -> None:
+    """Run one full pass of the program using ``pw``.
+
+    Request and parse all pages of each wishlist from Amazon's website. If
+    there are any items with a "new lowest price", send the user a
+    notification. Save the results from this pass for the next run. If some
+    wishlists couldn't be fetched in full, items missing from them are saved
+    as they were, rather than dropped.
+
+    The time spent in each stage, and counts of pages, items and alerts, are
+    recorded in a new `pw.metrics` and written out with ``write_metrics``.
+    """
+    # Start from an empty wishlist, as the same PriceWatch may run many passes.
+    pw.wishlist = pw.wishlist_class()
+    pw.metrics = metrics.Metrics(pw.profiler)
+    pw.metrics.count("wishlists", len(pw.wishlist_urls))
+    # Pagination of each wishlist will be followed and requested/parsed.
+    with pw.metrics.span("fetch_wishlists"):
+        pw.fetch_wishlists()
+    pw.json_man.record_observations(pw.wishlist)
+    with pw.metrics.span("compare_prices"):
+        new_cheaper_items = pw.compare_prices()
+    if new_cheaper_items:
+        with pw.metrics.span("send_notification"):
+            notify.send_notification(wishlist_item_list=new_cheaper_items)
+        pw.metrics.count("alerts_sent", len(new_cheaper_items))
+
+    if pw.failed_wishlists:
+        pw.keep_unfetched_items()
+    with pw.metrics.span("save_wishlist_json"):
+        pw.json_man.save_wishlist_json(pw.wishlist)
+    if pw.price_stats is not None:
+        with pw.metrics.span("save_price_stats"):
+            pw.price_stats.save()
+    if pw.page_cache is not None:
+        with pw.metrics.span("save_page_cache"):
+            pw.page_cache.save()
+    pw.metrics.finish()
+    write_metrics(pw)
+
+
+def write_metrics(pw: PriceWatch) -> None:
+    """Log a summary of `pw.metrics`, and write it to the files set in the
+    optional `metrics` section of `config.json`.
+    """
+    counters = pw.metrics.counters
+    logger.info(
+        f"Pass took {pw.metrics.duration:.1f}s: {counters['pages']} page(s),"
+        f" {counters['items_parsed']} item(s), {counters['alerts_sent']} alert(s)."
+    )
+    metrics_settings = pw.settings.metrics
+    try:
+        if metrics_settings.json_report:
+            pw.metrics.write_json(metrics_settings.json_report)
+        if metrics_settings.prometheus_textfile:
+            pw.metrics.write_prometheus(metrics_settings.prometheus_textfile)
+    except OSError:
+        logger.exception("Failed to write metrics. Check config.")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    arg_parser = argparse.ArgumentParser(
+        prog="pricewatch",
+        description="Check your Amazon wishlist for price reductions.",
+    )
+    arg_parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running, checking for price reductions on an interval",
+    )
+    arg_parser.add_argument(
+        "--interval",
+        type=float,
+        metavar="MINUTES",
+        help="minutes between checks in daemon mode (default: from config.json,"
+        f" or {daemon.DEFAULT_INTERVAL_MINUTES:g})",
+    )
+    arg_parser.add_argument(
+        "--log-json",
+        action="store_true",
+        help="write the log file as json lines, with wishlist, page and stage"
+        " fields",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="run once under cProfile and tracemalloc, writing the slowest"
+        " functions and largest allocations of each stage to --profile-dir",
+    )
+    arg_parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=profiling.DEFAULT_REPORT_DIR,
+        metavar="DIR",
+        help="directory to write the --profile report to (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--replay",
+        type=Path,
+        metavar="DIR",
+        help="with --profile, request the wishlist pages saved in DIR (*.html,"
+        " in name order) from a local server instead of Amazon",
+    )
+    subparsers = arg_parser.add_subparsers(dest="command")
+    run_many_parser = subparsers.add_parser(
+        "run-many",
+        help="run once for each config file in a directory",
+        description="Run once for each tenant config file (*.json) in"
+        " CONFIG_DIR, across a pool of processes.",
+    )
+    run_many_parser.add_argument("config_dir", type=Path, metavar="CONFIG_DIR")
+    run_many_parser.add_argument(
+        "--state-dir",
+        type=Path,
+        help="directory to keep each tenant's state in"
+        f" (default: CONFIG_DIR/{tenants.STATE_DIR_NAME})",
+    )
+    run_many_parser.add_argument(
+        "--processes",
+        type=int,
+        help="number of worker processes (default: number of available cores)",
+    )
+    args = arg_parser.parse_args(argv)
+    if args.profile and (args.daemon or args.command):
+        arg_parser.error("--profile runs a single pass, so can't be combined.")
+    if args.replay and not args.profile:
+        arg_parser.error("--replay needs --profile.")
+    return args
+
 
+def main(argv: Optional[List[str]] = None):
+    """Run the program.
 
-def main():
-    """Run one full pass of the program.
+    Before continuing, check if the user has filled in `config.json`, then
+    validate it (see `settings.py`) and check if the user has specified a
+    test notification only run. The checks are made before creating an
+    instance of `PriceWatch`, so none waits on importing the
+    libraries used to request and parse pages. If not, run one full pass of
+    the program (see ``run_pass``), or with ``--daemon`` keep running passes
+    on an interval until stopped, reloading the config file before a pass
+    whenever it has changed. Alerts are sent in the background through
+    the notification outbox, which is given time to empty before exiting.
 
-    Create an instance of `PriceWatch`. Before continuing, check if the user
-    has filled in `config.json` or has specified a test notification only run.
-    If not, continue to request and parse all pages of the wishlist from
-    Amazon's website. If there are any items with a "new lowest price", send
-    the user a notification. Save the results from this pass to a json file
-    for next run.
+    ``run-many`` instead runs a pass for each tenant config in a directory
+    (see `tenants.py`), exiting with status 1 if any tenant failed.
+    ``--profile`` runs a single pass under ``profiling.profile_pass``.
     """
+    args = parse_args(argv)
+    setup_logging(json_logs=args.log_json)
     logger.info("Started script.")
-    pw = PriceWatch()
+    if args.command == "run-many":
+        results = tenants.run_many(args.config_dir, args.state_dir, args.processes)
+        logger.info(tenants.summary(results))
+        if not all(result.ok for result in results):
+            sys.exit(1)
+        logger.info("Finished.")
+        return
+    config_file = settings.ConfigFile()
+    try:
+        if config_file.unfilled():
+            logger.error(f"You need to fill in the config file:\n{config_file.path}")
+            sys.exit()
+        loaded = config_file.load()
+    except (settings.ConfigError, json.JSONDecodeError) as e:
+        logger.error(f"Check the config file {config_file.path}:\n{e}")
+        sys.exit(1)
+    notify.configure(loaded)
 
-    if pw.config["general"]["send_test_notification"] == "1":
+    if loaded.general.send_test_notification:
         logger.info("Sending test notification and exiting.")
         notify.test_notification()
         sys.exit()
-    elif (
-        pw.config["general"]["wishlist_url"]
-        == "https://www.amazon.co.uk/hz/wishlist/ls/S0M3C0D3"
-    ):
-        config_file_path = Path(Path(__file__).parent, "config.json").resolve()
-        logger.error(f"You need to fill in the config file:\n{config_file_path}")
-        sys.exit()
 
-    page = pw.request_page()
-    # In parsing the first page, pagination will be followed and requested/parsed.
-    pw.parse_wishlist(page)
-    new_cheaper_items = pw.compare_prices()
-    if new_cheaper_items:
-        notify.send_notification(wishlist_item_list=new_cheaper_items)
+    if args.profile:
+        try:
+            report = profiling.profile_pass(loaded, args.profile_dir, args.replay)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        logger.info(
+            f"Wrote profile of {len(report) // 2} stage(s) to {args.profile_dir}."
+        )
+        return
 
-    pw.json_man.save_wishlist_json(pw.wishlist)
+    pw = PriceWatch(loaded)
+
+    def daemon_pass():
+        """Run a pass, first picking up any changes made to the config file."""
+        nonlocal pw
+        reloaded = config_file.load()
+        if reloaded is not pw.settings:
+            notify.stop_dispatcher()
+            notify.configure(reloaded)
+            pw = PriceWatch(reloaded)
+            notify.start_dispatcher(Path(pw.state_dir, "outbox"))
+        run_pass(pw)
+
+    # Alerts are sent in the background, including any left from earlier runs.
+    notify.start_dispatcher(Path(pw.state_dir, "outbox"))
+    try:
+        if args.daemon:
+            daemon_settings = loaded.daemon
+            daemon.Daemon(
+                daemon_pass,
+                interval=(args.interval or daemon_settings.interval_minutes) * 60,
+                jitter=daemon_settings.jitter,
+            ).run()
+        else:
+            run_pass(pw)
+    finally:
+        notify.stop_dispatcher()
     logger.info("Finished.")
 
 
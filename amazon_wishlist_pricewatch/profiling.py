@@ -0,0 +1,292 @@
+"""Profiles of where a run spends its time and memory, stage by stage.
+
+`StageProfiler` profiles each stage timed by `metrics.Metrics` (see
+``Metrics.span``), such as `request_page`, `parse_page`, `compare_prices`,
+`send_notification` and `save_wishlist_json`, with a `cProfile.Profile` of
+its own, and compares `tracemalloc` snapshots taken as the stage starts and
+ends. ``StageProfiler.write_report`` then writes for each stage the functions
+taking the most cumulative time and the lines allocating the most memory.
+
+Time is profiled on the thread running each stage, so pages requested on
+many threads at once are all counted, and time spent in a stage run within
+another on the same thread is only counted in the inner stage. Allocations
+are traced for the whole process, so those of a stage include any made at
+the same time on other threads, such as by requests for other pages. From
+Python 3.12, stages started while another is running on a different thread
+are counted in that stage's profile instead (see ``_enable``). Pages parsed
+in worker processes (see `parse_processes`) aren't profiled, so profile with
+`parse_processes` set to 0 to see parsing.
+
+Run with ``pricewatch --profile``, optionally with ``--replay DIR`` to
+request saved pages from a local `replay.ReplayServer` instead of Amazon
+(see ``profile_pass``).
+"""
+
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import cProfile
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    import settings
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from . import settings
+
+# Directory reports are written to when none is given, in the current
+# directory, as the installed package's directory may not be writable.
+DEFAULT_REPORT_DIR = Path("profile")
+# Number of functions and allocation sites listed for each stage.
+TOP_N = 25
+# Modules a run imports on first use, imported before profiling starts so
+# the time and memory taken to import them doesn't swamp the first stage to
+# use each, and the blocks they allocate don't slow every snapshot taken.
+# Imported if installed.
+PRELOADED_MODULES = ("asyncio", "bs4", "lxml", "numpy", "requests")
+
+
+def _enable(profile: "cProfile.Profile") -> None:
+    """Enable ``profile`` on the running thread.
+
+    From Python 3.12 a profile covers every thread, and only one can be
+    enabled at a time, so a stage starting while another runs on a different
+    thread is left to the profile of the one already running.
+    """
+    try:
+        profile.enable()
+    except ValueError:
+        pass
+
+
+class StageProfiler:
+    """cProfile and tracemalloc profiles of each stage of a run.
+
+    Args:
+        top: Optional; Number of functions and allocation sites listed for
+            each stage in the report.
+
+    Attributes:
+        top: Number of functions and allocation sites listed for each stage.
+        profiles: The `cProfile.Profile` of each thread a stage ran on, keyed
+            by stage name.
+        allocations: `[bytes, blocks]` allocated and not freed by each line,
+            keyed by stage name, then by `file:line`.
+        calls: Number of times each stage was run, keyed by stage name.
+    """
+
+    def __init__(self, top: int = TOP_N):
+        """Init StageProfiler."""
+        self.top = top
+        self.profiles: Dict[str, List["cProfile.Profile"]] = {}
+        self.allocations: Dict[str, Dict[str, List[int]]] = {}
+        self.calls: Dict[str, int] = {}
+        self._thread_profiles: Dict[Tuple[str, int], "cProfile.Profile"] = {}
+        self._lock = threading.Lock()
+        # Profiles of the stages running on each thread, innermost last.
+        self._local = threading.local()
+
+    def start(self) -> None:
+        """Start tracing memory allocations. Stages are still timed if not
+        called, but allocations aren't reported.
+        """
+        import tracemalloc
+
+        tracemalloc.start()
+
+    def stop(self) -> None:
+        """Stop tracing memory allocations."""
+        import tracemalloc
+
+        tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile the body of a ``with`` block as part of stage ``name``."""
+        import tracemalloc
+
+        stack: List["cProfile.Profile"] = self._local.__dict__.setdefault("stack", [])
+        profile = self._profile(name)
+        # A thread can only be profiled by one profile at a time, so an outer
+        # stage is paused while an inner one runs.
+        if stack:
+            stack[-1].disable()
+        stack.append(profile)
+        before = self._snapshot() if tracemalloc.is_tracing() else None
+        _enable(profile)
+        try:
+            yield
+        finally:
+            profile.disable()
+            stack.pop()
+            if before is not None and tracemalloc.is_tracing():
+                self._add_allocations(
+                    name, self._snapshot().compare_to(before, "lineno")
+                )
+            if stack:
+                _enable(stack[-1])
+
+    def _profile(self, name: str) -> "cProfile.Profile":
+        """Return the profile of stage ``name`` on the running thread."""
+        import cProfile
+
+        key = (name, threading.get_ident())
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            profile = self._thread_profiles.get(key)
+            if profile is None:
+                profile = self._thread_profiles[key] = cProfile.Profile()
+                self.profiles.setdefault(name, []).append(profile)
+        return profile
+
+    @staticmethod
+    def _snapshot():
+        """Take a `tracemalloc.Snapshot`."""
+        import tracemalloc
+
+        return tracemalloc.take_snapshot()
+
+    def _add_allocations(self, name: str, differences: List) -> None:
+        """Add the `tracemalloc.StatisticDiff` ``differences`` of a run of
+        stage ``name`` to `allocations`.
+        """
+        import tracemalloc
+
+        # The profilers' own allocations are left out.
+        own_files = (tracemalloc.__file__, __file__)
+        with self._lock:
+            sites = self.allocations.setdefault(name, {})
+            for difference in differences:
+                if not difference.size_diff and not difference.count_diff:
+                    continue
+                if difference.traceback[0].filename in own_files:
+                    continue
+                site = sites.setdefault(str(difference.traceback), [0, 0])
+                site[0] += difference.size_diff
+                site[1] += difference.count_diff
+
+    def write_report(self, report_dir: Union[str, Path]) -> List[Path]:
+        """Write the report of each stage profiled to ``report_dir``.
+
+        For each stage, `<stage>.txt` lists the `top` functions by cumulative
+        time and the `top` lines by memory allocated and not freed, and
+        `<stage>.prof` holds the full `pstats` profile, for tools such as
+        snakeviz. `summary.txt` lists every stage.
+
+        Returns:
+            The paths of the files written.
+        """
+        import io
+        import pstats
+
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        summary = []
+        for name in sorted(self.profiles):
+            stats = pstats.Stats(*self.profiles[name], stream=io.StringIO())
+            prof_path = Path(report_dir, f"{name}.prof")
+            stats.dump_stats(prof_path)
+            sites = sorted(
+                self.allocations.get(name, {}).items(),
+                key=lambda site: site[1][0],
+                reverse=True,
+            )
+            allocated = sum(size for size, _ in self.allocations.get(name, {}).values())
+            summary.append(
+                f"{name}: {self.calls[name]} call(s), {stats.total_tt:.3f}s,"
+                f" {allocated / 1024:.1f} KiB allocated net of frees"
+            )
+            text_path = Path(report_dir, f"{name}.txt")
+            with open(text_path, "w") as report:
+                report.write(f"{summary[-1]}\n\nTop {self.top} functions by")
+                report.write(" cumulative time:\n")
+                stats.stream = report
+                stats.sort_stats("cumulative").print_stats(self.top)
+                report.write(f"Top {self.top} allocation sites, net of frees:\n\n")
+                if not sites:
+                    report.write("None traced.\n")
+                for site, (size, count) in sites[: self.top]:
+                    report.write(f"{size / 1024:10.1f} KiB {count:8d} blocks  {site}\n")
+            written += [text_path, prof_path]
+        summary_path = Path(report_dir, "summary.txt")
+        summary_path.write_text("\n".join(summary) + "\n")
+        written.append(summary_path)
+        return written
+
+
+def profile_pass(
+    loaded: settings.Settings,
+    report_dir: Union[str, Path] = DEFAULT_REPORT_DIR,
+    replay_dir: Optional[Union[str, Path]] = None,
+) -> List[Path]:
+    """Run one pass of the program, as ``pricewatch.run_pass``, under a
+    `StageProfiler`, and write its report to ``report_dir``.
+
+    Args:
+        loaded: The `settings.Settings` to run with.
+        report_dir: Optional; Directory to write the report to.
+        replay_dir: Optional; Directory of wishlist pages saved from Amazon
+            (`*.html`, in name order, see ``replay.recorded_pages``). If given,
+            every wishlist is requested from a local `replay.ReplayServer`
+            serving them instead. The wishlist is then saved to, and compared
+            against, `state` in ``report_dir``, and alerts are saved to
+            `outbox` in ``report_dir`` but not sent, leaving the state and
+            notifications of normal runs untouched.
+
+    Returns:
+        The paths of the report files written.
+
+    Raises:
+        ValueError: There are no saved pages in ``replay_dir``.
+    """
+    if __package__ is None or __package__ == "":
+        import notify
+        import replay
+        from pricewatch import PriceWatch, run_pass
+    else:
+        from . import notify, replay
+        from .pricewatch import PriceWatch, run_pass
+
+    server = None
+    state_dir = None
+    outbox_dir = None
+    if replay_dir is not None:
+        pages = replay.recorded_pages(sorted(Path(replay_dir).glob("*.html")))
+        if not pages:
+            raise ValueError(f"No saved pages (*.html) in {replay_dir}.")
+        server = replay.ReplayServer(pages).start()
+        loaded = loaded._replace(fetch=loaded.fetch._replace(base_url=server.url))
+        state_dir = Path(report_dir, "state")
+        state_dir.mkdir(parents=True, exist_ok=True)
+        outbox_dir = Path(report_dir, "outbox")
+
+    import importlib
+
+    for module in PRELOADED_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    profiler = StageProfiler()
+    try:
+        pw = PriceWatch(loaded, state_dir)
+        pw.profiler = profiler
+        if outbox_dir is None:
+            outbox_dir = Path(pw.state_dir, "outbox")
+        notify.start_dispatcher(outbox_dir, deliver=server is None)
+        try:
+            profiler.start()
+            try:
+                run_pass(pw)
+            finally:
+                profiler.stop()
+        finally:
+            notify.stop_dispatcher()
+    finally:
+        if server is not None:
+            server.stop()
+    return profiler.write_report(report_dir)
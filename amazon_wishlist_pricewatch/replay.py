@@ -0,0 +1,318 @@
+"""A local stand-in for Amazon, for load testing the fetch pipeline offline.
+
+`ReplayServer` serves the pages of a wishlist over HTTP on localhost, either
+synthetic pages from `synthetic.py` or pages recorded from Amazon. Latency,
+random server errors and bursts of "503 Service Unavailable" throttling can
+be added to see how a run copes with them. Point ``PriceWatch`` at it by
+setting `base_url` in the `fetch` section of `config.json` to the server's
+URL: every wishlist page is then requested from the server instead. Any
+wishlist (`/hz/wishlist/ls/<id>`) requested is served the first page.
+
+Usage:
+    python -m amazon_wishlist_pricewatch.replay [--items N] [--pages M]
+        [--recorded DIR] [--port P] [--latency S] [--jitter S]
+        [--error-rate R] [--burst-every N] [--burst-length N]
+"""
+
+import argparse
+import hashlib
+import http.server
+import random
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    import synthetic
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from . import synthetic
+
+WISHLIST_PATH_PREFIX = "/hz/wishlist/ls/"
+RECORDED_WISHLIST_PATH = WISHLIST_PATH_PREFIX + "R3C0RD3D"
+
+
+def synthetic_pages(items: int, pages: int = 1, seed: int = 0) -> Dict[str, str]:
+    """Return the pages of a synthetic wishlist keyed by path and query.
+
+    See ``synthetic.generate_wishlist``.
+    """
+    return {
+        _path(page.url): page.html
+        for page in synthetic.generate_wishlist(items, pages, seed, base_url="")
+    }
+
+
+def recorded_pages(paths: Iterable[Union[str, Path]]) -> Dict[str, str]:
+    """Return wishlist pages saved from Amazon, keyed by path and query.
+
+    The first page is served at `RECORDED_WISHLIST_PATH`, and each page after
+    it at the path its "see more" link leads to.
+
+    Args:
+        paths: Saved HTML of each page of a wishlist, in order.
+    """
+    if __package__ is None or __package__ == "":
+        from pricewatch import find_next_page_url
+    else:
+        from .pricewatch import find_next_page_url
+
+    pages = {}
+    path: Optional[str] = RECORDED_WISHLIST_PATH
+    for page_path in paths:
+        if path is None:
+            raise ValueError(f"{page_path} follows a page without a see more link.")
+        content = Path(page_path).read_bytes()
+        pages[path] = content.decode("utf-8")
+        next_url = find_next_page_url(
+            SimpleNamespace(content=content, url=urljoin("http://replay", path))
+        )
+        path = _path(next_url) if next_url else None
+    return pages
+
+
+def _path(url: str) -> str:
+    """Return the path and query of ``url``."""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+class ReplayServer:
+    """Serve wishlist pages on localhost from a background thread.
+
+    Pages are served with an `ETag`, and unchanged pages requested
+    conditionally get a "304 Not Modified", as from Amazon. Use as a context
+    manager, or call ``start`` and ``stop``.
+
+    Args:
+        pages: HTML of each page, keyed by path and query, first page first.
+        port: Optional; Port to listen on. Defaults to any free port.
+        latency: Optional; Seconds to wait before each response.
+        jitter: Optional; Up to this many seconds are randomly added to
+            ``latency``.
+        error_rate: Optional; Chance of a request getting a "500 Internal
+            Server Error".
+        burst_every: Optional; After every ``burst_every`` requests, the
+            following ``burst_length`` requests are throttled with a "503
+            Service Unavailable". 0 for never.
+        burst_length: Optional; Requests throttled in each burst.
+        retry_after: Optional; `Retry-After` seconds sent when throttling.
+        seed: Optional; Seed of the random latency and errors.
+
+    Attributes:
+        pages: HTML of each page, keyed by path and query.
+        latency: Seconds to wait before each response.
+        jitter: Up to this many seconds are randomly added to ``latency``.
+        error_rate: Chance of a request getting a "500 Internal Server Error".
+        burst_every: Requests between bursts of throttling.
+        burst_length: Requests throttled in each burst.
+        retry_after: `Retry-After` seconds sent when throttling, or `None`.
+        stats: Number of requests served, by outcome: "ok", "not_modified",
+            "not_found", "error" and "throttled".
+    """
+
+    def __init__(
+        self,
+        pages: Dict[str, str],
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        burst_every: int = 0,
+        burst_length: int = 1,
+        retry_after: Optional[int] = None,
+        seed: int = 0,
+    ):
+        """Init the ReplayServer, listening on ``port`` but not yet serving."""
+        self.pages = {
+            path: (html.encode("utf-8"), f'"{hashlib.sha1(html.encode()).hexdigest()}"')
+            for path, html in pages.items()
+        }
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.stats = dict.fromkeys(
+            ("ok", "not_modified", "not_found", "error", "throttled"), 0
+        )
+        self._requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", port), self._handler()
+        )
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Scheme, host and port of the server, e.g. for `base_url`."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wishlist_url(self) -> str:
+        """Return the URL of the first page of the wishlist."""
+        return self.url + next(iter(self.pages))
+
+    def page(self, path: str) -> Optional[Tuple[bytes, str]]:
+        """Return the body and `ETag` of the page at ``path``, or `None`."""
+        page = self.pages.get(path)
+        if page is None and path.startswith(WISHLIST_PATH_PREFIX) and self.pages:
+            page = self.pages[next(iter(self.pages))]
+        return page
+
+    def start(self) -> "ReplayServer":
+        """Start serving from a background thread."""
+        # Polls for shutdown often, so stopping is quick.
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _outcome(self) -> str:
+        """Decide how to answer the next request, once its latency has passed."""
+        with self._lock:
+            self._requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            in_burst = (
+                self.burst_every > 0
+                and (self._requests - 1) % (self.burst_every + self.burst_length)
+                >= self.burst_every
+            )
+            if in_burst:
+                outcome = "throttled"
+            elif self._random.random() < self.error_rate:
+                outcome = "error"
+            else:
+                outcome = "ok"
+        if delay:
+            time.sleep(delay)
+        return outcome
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                outcome = server._outcome()
+                page = server.page(self.path)
+                if outcome == "throttled":
+                    headers = (
+                        {"Retry-After": str(server.retry_after)}
+                        if server.retry_after is not None
+                        else {}
+                    )
+                    self.reply(503, b"Service Unavailable", headers)
+                elif outcome == "error":
+                    self.reply(500, b"Internal Server Error")
+                elif page is None:
+                    outcome = "not_found"
+                    self.reply(404, b"Not Found")
+                elif self.headers.get("If-None-Match") == page[1]:
+                    outcome = "not_modified"
+                    self.reply(304, b"", {"ETag": page[1]})
+                else:
+                    self.reply(
+                        200,
+                        page[0],
+                        {"ETag": page[1], "Content-Type": "text/html; charset=utf-8"},
+                    )
+                with server._lock:
+                    server.stats[outcome] += 1
+
+            def reply(self, status: int, body: bytes, headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    # The client hung up, e.g. after reading only part of a
+                    # streamed page.
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Serve a wishlist until interrupted."""
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m amazon_wishlist_pricewatch.replay",
+        description="Serve wishlist pages locally, for load testing.",
+    )
+    arg_parser.add_argument("--items", type=int, default=1000)
+    arg_parser.add_argument("--pages", type=int, default=10)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument(
+        "--recorded",
+        type=Path,
+        metavar="DIR",
+        help="serve the *.html pages in DIR, in name order, instead",
+    )
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--jitter", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--burst-every", type=int, default=0)
+    arg_parser.add_argument("--burst-length", type=int, default=1)
+    arg_parser.add_argument("--retry-after", type=int)
+    args = arg_parser.parse_args(argv)
+
+    if args.recorded:
+        pages = recorded_pages(sorted(args.recorded.glob("*.html")))
+    else:
+        pages = synthetic_pages(args.items, args.pages, args.seed)
+    server = ReplayServer(
+        pages,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f'Serving {len(pages)} page(s). Set "base_url": "{server.url}" in the')
+    print(f"fetch section of config.json, or watch {server.wishlist_url()}")
+    with server:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    print(server.stats)
+
+
+if __name__ == "__main__":
+    main()
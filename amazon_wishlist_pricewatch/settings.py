@@ -0,0 +1,516 @@
+"""`config.json`, parsed and validated into typed settings.
+
+``parse`` turns the loaded json into a `Settings`, a tuple of one typed
+section per section of `config.json`, with every optional key filled in
+with its default, numbers converted and values checked. A `ConfigError`
+names the key at fault. The alert rules are compiled as well (see
+`alerts.py`).
+
+A `ConfigFile` keeps the `Settings` of a config file, and only reads and
+parses it again when the file's modification time or size changes, so a
+long-running process can check for edits before every pass without cost.
+``load`` keeps one `ConfigFile` per path.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    import alerts
+    import daemon
+    import fetch
+    import outbox
+    import parsers
+    import shared_cache
+    from logger import logger
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from . import alerts, daemon, fetch, outbox, parsers, shared_cache
+    from .logger import logger
+
+# Placeholder `wishlist_url` shipped in the default `config.json`.
+PLACEHOLDER_WISHLIST_URL = "https://www.amazon.co.uk/hz/wishlist/ls/S0M3C0D3"
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:87.0) Gecko/20100101 Firefox/87.0"
+)
+DEFAULT_CONFIG_PATH = Path(Path(__file__).parent, "config.json")
+# Notification channel chosen by each digit of `notification_mode`.
+NOTIFICATION_MODES = {"1": "email", "2": "telegram"}
+SMTP_SECURITY_MODES = ("ssl", "starttls", "none")
+STORAGE_BACKENDS = ("json", "sqlite", "snapshot")
+
+
+class ConfigError(ValueError):
+    """`config.json` has a missing or invalid value."""
+
+
+class GeneralSettings(NamedTuple):
+    """The `general` section.
+
+    Attributes:
+        notification_mode: As in `config.json`, e.g. "12".
+        channels: Names of the channels chosen by `notification_mode`.
+        wishlist_url: The wishlist URL, as in `config.json`.
+        wishlist_urls: Every wishlist to be watched. The optional
+            `wishlist_urls` list followed by `wishlist_url`, less duplicates
+            and the placeholder URL.
+        user_agent: `User-Agent` header sent to Amazon.
+        send_test_notification: Whether to only send a test notification.
+        parser: One of `parsers.PARSER_BACKENDS`.
+        parse_processes: Number of worker processes pages are parsed by, or
+            0 to parse them in the running process.
+        storage: One of `STORAGE_BACKENDS`.
+        page_cache: Whether pages are cached between runs.
+        price_stats: Whether rolling price aggregates of each item are kept
+            (see `aggregates.py`). Needed by window alert rules.
+        compact_wishlist: Whether wishlists are held in compact form.
+    """
+
+    notification_mode: str
+    channels: Tuple[str, ...]
+    wishlist_url: str
+    wishlist_urls: Tuple[str, ...]
+    user_agent: str
+    send_test_notification: bool
+    parser: str
+    parse_processes: int
+    storage: str
+    page_cache: bool
+    price_stats: bool
+    compact_wishlist: bool
+
+
+class EmailSettings(NamedTuple):
+    """The `email` section. See `notify.EmailChannel`."""
+
+    smtp_server: str
+    smtp_port: int
+    smtp_security: str
+    sending_email: str
+    sending_email_pass: str
+    receiving_emails: Tuple[str, ...]
+
+
+class TelegramSettings(NamedTuple):
+    """The `telegram` section. See `notify.TelegramChannel`."""
+
+    chat_id: str
+    token: str
+
+
+class FetchSettings(NamedTuple):
+    """The optional `fetch` section. See `fetch.FetchEngine`."""
+
+    max_concurrency: int
+    requests_per_second: float
+    burst: int
+    max_attempts: int
+    retry_seconds: float
+    circuit_breaker_failures: int
+    circuit_breaker_reset_seconds: float
+    base_url: Optional[str]
+    shared_cache_dir: Optional[str]
+    shared_cache_ttl_seconds: float
+    stream_pages: bool
+
+
+class NotificationSettings(NamedTuple):
+    """The optional `notifications` section. See `outbox.Dispatcher`."""
+
+    max_attempts: int
+    retry_seconds: float
+    flush_timeout_seconds: float
+    max_message_sizes: Dict[str, int]
+
+
+class MetricsSettings(NamedTuple):
+    """The optional `metrics` section. See `metrics.Metrics`."""
+
+    json_report: Optional[str]
+    prometheus_textfile: Optional[str]
+
+
+class DaemonSettings(NamedTuple):
+    """The optional `daemon` section. See `daemon.Daemon`."""
+
+    interval_minutes: float
+    jitter: float
+
+
+class Settings(NamedTuple):
+    """Every section of `config.json`, parsed and validated.
+
+    Attributes:
+        general: The `general` section.
+        email: The `email` section, or `None` if email isn't chosen by
+            `notification_mode`.
+        telegram: The `telegram` section, or `None` if Telegram isn't
+            chosen by `notification_mode`.
+        fetch: The `fetch` section.
+        notifications: The `notifications` section.
+        metrics: The `metrics` section.
+        daemon: The `daemon` section.
+        alert_rules: The `alerts.RuleSet` compiled from the `alerts`
+            section.
+        raw: The loaded json the settings were parsed from.
+    """
+
+    general: GeneralSettings
+    email: Optional[EmailSettings]
+    telegram: Optional[TelegramSettings]
+    fetch: FetchSettings
+    notifications: NotificationSettings
+    metrics: MetricsSettings
+    daemon: DaemonSettings
+    alert_rules: alerts.RuleSet
+    raw: Dict
+
+
+class _Section:
+    """Typed access to the keys of one section of `config.json`."""
+
+    def __init__(self, config: Dict, name: str, required: bool = False):
+        section = config.get(name)
+        if section is None:
+            if required:
+                raise ConfigError(f"Missing section {name!r}.")
+            section = {}
+        if not isinstance(section, dict):
+            raise ConfigError(f"{name}: must be an object.")
+        self.name = name
+        self.section = section
+
+    def value(self, key: str, default=None, required: bool = False):
+        if key in self.section:
+            return self.section[key]
+        if required:
+            raise ConfigError(f"Missing {self.name}.{key}.")
+        return default
+
+    def _convert(self, key: str, kind: type, default, description: str):
+        value = self.value(key, default, default is None)
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            raise ConfigError(
+                f"{self.name}.{key}: must be {description}, not {value!r}."
+            ) from None
+
+    def string(self, key: str, default: Optional[str] = None) -> str:
+        value = self.value(key, default, default is None)
+        if not isinstance(value, str):
+            raise ConfigError(f"{self.name}.{key}: must be a string, not {value!r}.")
+        return value
+
+    def optional_string(self, key: str) -> Optional[str]:
+        return self.string(key) if self.section.get(key) not in (None, "") else None
+
+    def choice(self, key: str, choices: Tuple[str, ...], default: str) -> str:
+        value = self.string(key, default)
+        if value not in choices:
+            raise ConfigError(
+                f"{self.name}.{key}: must be one of {', '.join(choices)},"
+                f" not {value!r}."
+            )
+        return value
+
+    def flag(self, key: str, default: str) -> bool:
+        return self.choice(key, ("0", "1"), default) == "1"
+
+    def integer(self, key: str, default: Optional[int] = None, minimum: int = 0) -> int:
+        value = self._convert(key, int, default, "a whole number")
+        if value < minimum:
+            raise ConfigError(f"{self.name}.{key}: must be at least {minimum}.")
+        return value
+
+    def number(self, key: str, default: float, minimum: float = 0) -> float:
+        value = self._convert(key, float, default, "a number")
+        if value < minimum:
+            raise ConfigError(f"{self.name}.{key}: must be at least {minimum}.")
+        return value
+
+    def positive_number(self, key: str, default: float) -> float:
+        value = self._convert(key, float, default, "a number")
+        if value <= 0:
+            raise ConfigError(f"{self.name}.{key}: must be greater than 0.")
+        return value
+
+    def strings(self, key: str, default: Optional[List[str]] = None) -> List[str]:
+        value = self.value(key, default, default is None)
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ConfigError(f"{self.name}.{key}: must be a list of strings.")
+        return value
+
+
+def wishlist_urls(general: Dict) -> List[str]:
+    """Return every wishlist to be watched from the `general` section.
+
+    The optional `wishlist_urls` list followed by `wishlist_url`, less
+    duplicates and the placeholder URL. Empty if the user has not filled in
+    `config.json`.
+    """
+    return [
+        url
+        for url in dict.fromkeys(
+            general.get("wishlist_urls", []) + [general["wishlist_url"]]
+        )
+        if url and url != PLACEHOLDER_WISHLIST_URL
+    ]
+
+
+def unfilled(config: Dict) -> bool:
+    """Return whether the user has yet to fill in the loaded ``config``: no
+    wishlist is set other than the placeholder, and a test notification isn't
+    asked for.
+
+    Checked before ``parse``, so the placeholder values of the default
+    `config.json`, such as its `smtp_port`, aren't reported as invalid.
+    Anything malformed is left for ``parse`` to report.
+    """
+    general = config.get("general") if isinstance(config, dict) else None
+    if not isinstance(general, dict) or general.get("send_test_notification") == "1":
+        return False
+    wishlist_url = general.get("wishlist_url", "")
+    urls = general.get("wishlist_urls", [])
+    if not isinstance(wishlist_url, str) or not isinstance(urls, list):
+        return False
+    return not wishlist_urls({"wishlist_url": wishlist_url, "wishlist_urls": urls})
+
+
+def parse(config: Dict) -> Settings:
+    """Parse and validate the loaded ``config``.
+
+    The `email` and `telegram` sections are only validated if chosen by
+    `notification_mode`.
+
+    Raises:
+        ConfigError: A value is missing or invalid.
+    """
+    general = _Section(config, "general", required=True)
+    notification_mode = general.string("notification_mode", "")
+    channels = tuple(
+        name for mode, name in NOTIFICATION_MODES.items() if mode in notification_mode
+    )
+    wishlist_url = general.string("wishlist_url", "")
+    general_settings = GeneralSettings(
+        notification_mode=notification_mode,
+        channels=channels,
+        wishlist_url=wishlist_url,
+        wishlist_urls=tuple(
+            wishlist_urls(
+                {
+                    "wishlist_url": wishlist_url,
+                    "wishlist_urls": general.strings("wishlist_urls", []),
+                }
+            )
+        ),
+        user_agent=general.string("user_agent", DEFAULT_USER_AGENT),
+        send_test_notification=general.flag("send_test_notification", "0"),
+        parser=general.choice(
+            "parser", parsers.PARSER_BACKENDS, parsers.DEFAULT_PARSER
+        ),
+        parse_processes=general.integer("parse_processes", 0),
+        storage=general.choice("storage", STORAGE_BACKENDS, "json"),
+        page_cache=general.flag("page_cache", "1"),
+        price_stats=general.flag("price_stats", "1"),
+        compact_wishlist=general.flag("compact_wishlist", "0"),
+    )
+
+    email_settings = parse_email(config.get("email")) if "email" in channels else None
+    telegram_settings = (
+        parse_telegram(config.get("telegram")) if "telegram" in channels else None
+    )
+
+    fetch_section = _Section(config, "fetch")
+    notifications = _Section(config, "notifications")
+    max_message_sizes = _Section(notifications.section, "max_message_sizes")
+    metrics = _Section(config, "metrics")
+    daemon_section = _Section(config, "daemon")
+    try:
+        alert_rules = alerts.RuleSet(_Section(config, "alerts").value("rules"))
+    except (TypeError, ValueError, AttributeError) as e:
+        raise ConfigError(f"alerts.rules: {e}") from None
+    if alert_rules.window_days and not general_settings.price_stats:
+        raise ConfigError(
+            'alerts.rules: Window rules need general.price_stats set to "1".'
+        )
+
+    return Settings(
+        general=general_settings,
+        email=email_settings,
+        telegram=telegram_settings,
+        fetch=FetchSettings(
+            max_concurrency=fetch_section.integer(
+                "max_concurrency", fetch.DEFAULT_MAX_CONCURRENCY, minimum=1
+            ),
+            requests_per_second=fetch_section.positive_number(
+                "requests_per_second", fetch.DEFAULT_REQUESTS_PER_SECOND
+            ),
+            burst=fetch_section.integer("burst", fetch.DEFAULT_BURST, minimum=1),
+            max_attempts=fetch_section.integer(
+                "max_attempts", fetch.DEFAULT_MAX_ATTEMPTS, minimum=1
+            ),
+            retry_seconds=fetch_section.number(
+                "retry_seconds", fetch.DEFAULT_RETRY_SECONDS
+            ),
+            circuit_breaker_failures=fetch_section.integer(
+                "circuit_breaker_failures", fetch.DEFAULT_BREAKER_FAILURES, minimum=1
+            ),
+            circuit_breaker_reset_seconds=fetch_section.number(
+                "circuit_breaker_reset_seconds", fetch.DEFAULT_BREAKER_RESET_SECONDS
+            ),
+            base_url=fetch_section.optional_string("base_url"),
+            shared_cache_dir=fetch_section.optional_string("shared_cache_dir"),
+            shared_cache_ttl_seconds=fetch_section.number(
+                "shared_cache_ttl_seconds", shared_cache.DEFAULT_TTL_SECONDS
+            ),
+            stream_pages=fetch_section.flag("stream_pages", "0"),
+        ),
+        notifications=NotificationSettings(
+            max_attempts=notifications.integer(
+                "max_attempts", outbox.DEFAULT_MAX_ATTEMPTS, minimum=1
+            ),
+            retry_seconds=notifications.number(
+                "retry_seconds", outbox.DEFAULT_RETRY_SECONDS
+            ),
+            flush_timeout_seconds=notifications.number(
+                "flush_timeout_seconds", outbox.DEFAULT_FLUSH_TIMEOUT_SECONDS
+            ),
+            max_message_sizes={
+                channel: max_message_sizes.integer(channel)
+                for channel in max_message_sizes.section
+            },
+        ),
+        metrics=MetricsSettings(
+            json_report=metrics.optional_string("json_report"),
+            prometheus_textfile=metrics.optional_string("prometheus_textfile"),
+        ),
+        daemon=DaemonSettings(
+            interval_minutes=daemon_section.number(
+                "interval_minutes", daemon.DEFAULT_INTERVAL_MINUTES
+            ),
+            jitter=daemon_section.number("jitter", daemon.DEFAULT_JITTER),
+        ),
+        alert_rules=alert_rules,
+        raw=config,
+    )
+
+
+def parse_email(email_config: Optional[Dict]) -> EmailSettings:
+    """Parse and validate the `email` section, ``email_config``.
+
+    Raises:
+        ConfigError: A value is missing or invalid.
+    """
+    email = _Section({"email": email_config}, "email", required=True)
+    return EmailSettings(
+        smtp_server=email.string("smtp_server"),
+        smtp_port=email.integer("smtp_port", minimum=1),
+        smtp_security=email.choice("smtp_security", SMTP_SECURITY_MODES, "ssl"),
+        sending_email=email.string("sending_email"),
+        sending_email_pass=email.string("sending_email_pass", ""),
+        receiving_emails=tuple(email.strings("receiving_emails")),
+    )
+
+
+def parse_telegram(telegram_config: Optional[Dict]) -> TelegramSettings:
+    """Parse and validate the `telegram` section, ``telegram_config``.
+
+    Raises:
+        ConfigError: A value is missing or invalid.
+    """
+    telegram = _Section({"telegram": telegram_config}, "telegram", required=True)
+    return TelegramSettings(
+        chat_id=str(telegram.value("chat_id", required=True)),
+        token=telegram.string("token"),
+    )
+
+
+class ConfigFile:
+    """The `Settings` of a config file, parsed again only when it changes.
+
+    Args:
+        path: Optional; Path of the config file. Defaults to `config.json`
+            on the same path as this source file.
+
+    Attributes:
+        path: Path of the config file.
+        settings: The `Settings` last loaded, or `None` before the first
+            ``load``.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """Init ConfigFile, without reading it yet."""
+        self.path = Path(DEFAULT_CONFIG_PATH if path is None else path).resolve()
+        self.settings: Optional[Settings] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    def changed(self) -> bool:
+        """Return whether the file has changed since last loaded, or last
+        failed to load.
+        """
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size) != self._stamp
+
+    def unfilled(self) -> bool:
+        """Return whether the user has yet to fill in the file (see
+        ``unfilled``).
+
+        Raises:
+            json.JSONDecodeError: The file isn't valid json.
+            OSError: The file couldn't be read.
+        """
+        with open(self.path, "r") as json_file:
+            return unfilled(json.load(json_file))
+
+    def load(self) -> Settings:
+        """Return the file's `Settings`, reading and parsing it only if it has
+        changed since last loaded.
+
+        If a changed file fails to load, the error is logged and the settings
+        last loaded are kept, so a long-running process isn't stopped by a
+        mistake made while editing. It isn't read again until it changes
+        again, so the error is only logged once.
+
+        Raises:
+            ConfigError: A value is missing or invalid, on the first load.
+            json.JSONDecodeError: The file isn't valid json, on the first load.
+            OSError: The file couldn't be read, on the first load.
+        """
+        stamp = None
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp and self.settings is not None:
+                return self.settings
+            with open(self.path, "r") as json_file:
+                settings = parse(json.load(json_file))
+        except (ConfigError, json.JSONDecodeError, OSError) as e:
+            if self.settings is None:
+                raise
+            logger.error(f"Failed to reload {self.path}. Keeping last settings: {e}")
+            if stamp is not None:
+                self._stamp = stamp
+            return self.settings
+        if self.settings is not None:
+            logger.info(f"Reloaded changed config file {self.path}.")
+        self.settings = settings
+        self._stamp = stamp
+        return settings
+
+
+def load(path: Optional[Union[str, Path]] = None) -> Settings:
+    """Return the `Settings` of the config file at ``path`` (see
+    `ConfigFile`), parsing it only if changed since last loaded by this
+    process.
+    """
+    config_file = ConfigFile(path)
+    config_file = _config_files.setdefault(config_file.path, config_file)
+    return config_file.load()
+
+
+# A `ConfigFile` for each config file loaded by ``load``.
+_config_files: Dict[Path, ConfigFile] = {}
@@ -0,0 +1,204 @@
+"""Cache of parsed wishlists shared by many `PriceWatch` instances.
+
+When many tenants are run (see `tenants.py`), several of them often watch the
+same public wishlist. The `SharedWishlistCache` lets the first tenant to
+fetch a wishlist in a cycle share the items parsed from it, so the others
+use them rather than requesting and parsing the wishlist again.
+
+The cache is a directory of json files, one per wishlist, keyed by the
+wishlist's normalized URL (see ``normalize_url``) and kept for a short time
+to live. A tenant about to fetch a wishlist first claims it with a lock
+file, so tenants running at the same time wait for it rather than fetching
+the same wishlist at once. Files are written atomically and lock files are
+created exclusively, so the cache is safe to share between processes.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from my_types import ParsedItem
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .my_types import ParsedItem
+
+DEFAULT_TTL_SECONDS = 300
+# A claim older than this is assumed to be left by a crashed tenant.
+DEFAULT_LOCK_TIMEOUT_SECONDS = 600
+# Query parameters which only track how a link was shared.
+_TRACKING_PARAMS = ("ref", "ref_", "_encoding", "tag")
+
+
+def normalize_url(url: str) -> str:
+    """Return the URL of a wishlist in a canonical form.
+
+    The scheme and host are lowercased, and the fragment, any trailing slash
+    and query parameters which only track how the link was shared are
+    dropped. Other query parameters, which may sort or filter the wishlist,
+    are kept in a fixed order.
+    """
+    parts = urlsplit(url)
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in _TRACKING_PARAMS
+    )
+    return urlunsplit(
+        (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path.rstrip("/"),
+            urlencode(query),
+            "",
+        )
+    )
+
+
+class SharedWishlistCache:
+    """Items of wishlists recently fetched by any tenant, by URL.
+
+    Args:
+        cache_dir: Directory the cache is kept in. Created if missing.
+        ttl_seconds: Optional; Seconds a fetched wishlist is reused for.
+        lock_timeout_seconds: Optional; Seconds after which a claim is
+            assumed to be abandoned.
+
+    Attributes:
+        cache_dir: Directory the cache is kept in.
+        ttl_seconds: Seconds a fetched wishlist is reused for.
+        lock_timeout_seconds: Seconds after which a claim is assumed to be
+            abandoned.
+        claimed: Normalized URLs of the wishlists this instance has claimed
+            and not yet released.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        lock_timeout_seconds: float = DEFAULT_LOCK_TIMEOUT_SECONDS,
+    ):
+        """Init SharedWishlistCache."""
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+        self.claimed: set = set()
+
+    def _path(self, url: str, suffix: str) -> Path:
+        key = hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()
+        return Path(self.cache_dir, key + suffix)
+
+    def get(self, url: str) -> Optional[List[ParsedItem]]:
+        """Return the items of wishlist ``url`` if fetched within the time to
+        live, otherwise `None`.
+        """
+        try:
+            with open(self._path(url, ".json"), "r") as entry_json:
+                entry = json.load(entry_json)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry["url"] != normalize_url(url):
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl_seconds:
+            return None
+        return [ParsedItem(*item) for item in entry["items"]]
+
+    def put(self, url: str, items: List[ParsedItem]) -> None:
+        """Share the ``items`` just fetched from wishlist ``url``.
+
+        Written to a temporary file first, so other tenants never read a
+        partly written entry.
+        """
+        import tempfile
+
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as entry_json:
+                json.dump(
+                    {
+                        "url": normalize_url(url),
+                        "fetched_at": time.time(),
+                        "items": [list(item) for item in items],
+                    },
+                    entry_json,
+                )
+            os.replace(temp_path, self._path(url, ".json"))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def claim(self, url: str) -> bool:
+        """Claim wishlist ``url`` to be fetched by this instance.
+
+        Returns:
+            `True` if claimed, or `False` if another tenant is fetching it.
+            Claims abandoned for `lock_timeout_seconds` are taken over.
+        """
+        lock_path = self._path(url, ".lock")
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._lock_abandoned(lock_path):
+                    return False
+                try:
+                    os.unlink(lock_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as lock_file:
+                lock_file.write(str(os.getpid()))
+            self.claimed.add(normalize_url(url))
+            return True
+        return False
+
+    def _lock_abandoned(self, lock_path: Path) -> bool:
+        try:
+            age = time.time() - lock_path.stat().st_mtime
+        except FileNotFoundError:
+            # Released since, so may be claimed.
+            return True
+        return age > self.lock_timeout_seconds
+
+    def release(self, url: str) -> None:
+        """Release the claim on wishlist ``url``, if held."""
+        if normalize_url(url) not in self.claimed:
+            return
+        self.claimed.discard(normalize_url(url))
+        try:
+            os.unlink(self._path(url, ".lock"))
+        except FileNotFoundError:
+            pass
+
+    def wait(
+        self, url: str, timeout: Optional[float] = None, poll_seconds: float = 0.1
+    ) -> Optional[List[ParsedItem]]:
+        """Wait for another tenant's claim on wishlist ``url`` to be released,
+        then return its items as ``get``.
+
+        Args:
+            url: URL of the wishlist.
+            timeout: Optional; Most seconds to wait. Defaults to
+                `lock_timeout_seconds`.
+            poll_seconds: Optional; Seconds between checks of the claim.
+
+        Returns:
+            The wishlist's items, or `None` if they weren't shared in time,
+            e.g. because the other tenant failed to fetch them.
+        """
+        lock_path = self._path(url, ".lock")
+        deadline = time.monotonic() + (
+            self.lock_timeout_seconds if timeout is None else timeout
+        )
+        while lock_path.exists() and not self._lock_abandoned(lock_path):
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(poll_seconds)
+        return self.get(url)
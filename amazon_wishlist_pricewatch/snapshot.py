@@ -0,0 +1,364 @@
+"""A compact, memory-mapped snapshot of the wishlist saved by the last run.
+
+`SnapshotManager` can be used in place of ``pricewatch.JsonManager`` by
+setting the `storage` key in the `general` section of `config.json` to
+"snapshot". Rather than parsing the whole of `wishlist_items.json` into
+dicts at start up, the snapshot file is opened with `mmap` and only the parts
+needed are read, when needed. Comparing prices only reads the ASINs and
+prices. An item's title, byline and URL are only decoded if it is looked up.
+
+File layout, all integers little-endian:
+
+- Header: the magic bytes `MAGIC` and the number of items, ``n``, as uint64.
+- ASIN index: ``n`` ASINs, sorted, each NUL padded to `ASIN_WIDTH` bytes.
+- Price column: ``n`` int64 lowest prices in minor units (see `prices.py`),
+  in the same order as the index.
+- Offsets: ``n + 1`` uint64 offsets of each item's record in the blob.
+- Blob: a json `[title, byline, url, price]` record for each item, with the
+  price exactly as saved.
+
+Usage:
+    python -m amazon_wishlist_pricewatch.snapshot import JSON SNAPSHOT
+    python -m amazon_wishlist_pricewatch.snapshot export SNAPSHOT JSON
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Collection, Iterable, Iterator, List, Optional, Tuple, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    import prices
+    from my_types import MinorUnits, PreviousPrices, WishlistDict, WishlistItem
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from . import prices
+    from .my_types import MinorUnits, PreviousPrices, WishlistDict, WishlistItem
+
+MAGIC = b"PWSNAP\x00\x01"
+ASIN_WIDTH = 16
+_HEADER = struct.Struct("<8sQ")
+
+
+def encode_snapshot(items: Iterable[WishlistItem]) -> bytes:
+    """Return the snapshot file contents holding ``items``.
+
+    Raises:
+        ValueError: An item's `asin` is not ASCII or is too long.
+    """
+    rows = []
+    for item in items:
+        key = item["asin"].encode("ascii")
+        if len(key) > ASIN_WIDTH:
+            raise ValueError(f"ASIN longer than {ASIN_WIDTH} bytes: {item['asin']}")
+        rows.append((key.ljust(ASIN_WIDTH, b"\0"), item))
+    rows.sort(key=lambda row: row[0])
+
+    records = [
+        json.dumps(
+            [item["title"], item["byline"], item["url"], item["price"]],
+            separators=(",", ":"),
+        ).encode("utf-8")
+        for _, item in rows
+    ]
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    count = len(rows)
+    return b"".join(
+        [
+            _HEADER.pack(MAGIC, count),
+            b"".join(key for key, _ in rows),
+            struct.pack(
+                f"<{count}q",
+                *(prices.to_minor_units(item["price"]) for _, item in rows),
+            ),
+            struct.pack(f"<{count + 1}Q", *offsets),
+            *records,
+        ]
+    )
+
+
+def write_snapshot(path: Union[str, Path], data: bytes) -> None:
+    """Write snapshot ``data`` to ``path``. Written to a temporary file first
+    and renamed into place, so a crash never leaves a partly written snapshot
+    and open snapshots keep reading the old file.
+    """
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(data)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+
+
+class Snapshot(Mapping):
+    """A read-only, memory-mapped view of a snapshot file.
+
+    A `Mapping` of ASIN to `WishlistItem`, like the dict saved to
+    `wishlist_items.json`. Looking up an item binary searches the ASIN index,
+    and only that item's record is decoded.
+
+    Args:
+        path: Path of the snapshot file.
+
+    Attributes:
+        path: Path of the snapshot file.
+
+    Raises:
+        ValueError: The file is not a snapshot.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Init Snapshot, mapping ``path`` into memory."""
+        self.path = Path(path)
+        with open(self.path, "rb") as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise ValueError(f"Not a snapshot file: {self.path}")
+        magic, self._count = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a snapshot file: {self.path}")
+        self._index = _HEADER.size
+        self._prices = self._index + ASIN_WIDTH * self._count
+        self._offsets = self._prices + 8 * self._count
+        self._blob = self._offsets + 8 * (self._count + 1)
+
+    def __len__(self) -> int:
+        """Return the number of items in the snapshot."""
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the ASIN of each item, in sorted order."""
+        index = self._mmap[self._index : self._prices]
+        for start in range(0, len(index), ASIN_WIDTH):
+            yield index[start : start + ASIN_WIDTH].rstrip(b"\0").decode("ascii")
+
+    def __contains__(self, asin: object) -> bool:
+        """Return True if an item with ``asin`` is in the snapshot."""
+        return isinstance(asin, str) and self.position(asin) is not None
+
+    def __getitem__(self, asin: str) -> WishlistItem:
+        """Return the `WishlistItem` matching ``asin``."""
+        i = self.position(asin)
+        if i is None:
+            raise KeyError(asin)
+        return self._item(i, asin)
+
+    def is_empty(self) -> bool:
+        """Return True if the snapshot has no items, False otherwise."""
+        return self._count == 0
+
+    def get_item_price(self, asin: str) -> str:
+        """Get item `price`, as saved, by ``asin``."""
+        return self[asin]["price"]
+
+    def position(self, asin: str) -> Optional[int]:
+        """Return the position of ``asin`` in the index, or `None` if absent."""
+        try:
+            key = asin.encode("ascii").ljust(ASIN_WIDTH, b"\0")
+        except UnicodeEncodeError:
+            return None
+        if len(key) > ASIN_WIDTH:
+            return None
+        mm = self._mmap
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._index + mid * ASIN_WIDTH
+            found = mm[start : start + ASIN_WIDTH]
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def minor_price(self, asin: str) -> Optional[MinorUnits]:
+        """Return the lowest price of ``asin`` in minor units, without decoding
+        the rest of the item. `None` if not in the snapshot.
+        """
+        i = self.position(asin)
+        if i is None:
+            return None
+        return MinorUnits(struct.unpack_from("<q", self._mmap, self._prices + 8 * i)[0])
+
+    def minor_prices(self) -> Iterator[Tuple[str, MinorUnits]]:
+        """Iterate over the ASIN and lowest price in minor units of each item,
+        reading only the index and price column.
+        """
+        column = struct.unpack_from(f"<{self._count}q", self._mmap, self._prices)
+        for asin, price in zip(self, column):
+            yield asin, MinorUnits(price)
+
+    def _item(self, i: int, asin: str) -> WishlistItem:
+        start, end = struct.unpack_from("<2Q", self._mmap, self._offsets + 8 * i)
+        title, byline, url, price = json.loads(
+            self._mmap[self._blob + start : self._blob + end]
+        )
+        return {
+            "title": title,
+            "byline": byline,
+            "price": price,
+            "url": url,
+            "asin": asin,
+        }
+
+    def to_dict(self) -> WishlistDict:
+        """Return every item as a `Dict[asin, WishlistItem]`, as saved to
+        `wishlist_items.json`.
+        """
+        return {asin: self._item(i, asin) for i, asin in enumerate(self)}
+
+    def matches(self, data: bytes) -> bool:
+        """Return True if the snapshot file holds exactly ``data``."""
+        return len(self._mmap) == len(data) and self._mmap[:] == data
+
+    def close(self) -> None:
+        """Unmap the snapshot file."""
+        self._mmap.close()
+
+
+class SnapshotManager:
+    """Manage loading/saving wishlist items to/from a snapshot file.
+
+    Provides the same ``get_wishlist_dict``, ``get_lowest_price``,
+    ``get_lowest_prices`` and ``save_wishlist_json`` methods as
+    ``pricewatch.JsonManager`` so either can be used by
+    ``pricewatch.PriceWatch``. If there is no snapshot yet but there is a
+    `wishlist_items.json` beside it, the json is imported.
+
+    Args:
+        snapshot_path: Optional; Path of the snapshot. Defaults to
+            `wishlist_items.snapshot` on the same path as this source file.
+
+    Attributes:
+        snapshot_path: Path of the snapshot, created when first saved.
+        prev_wishlist: A `Snapshot` of the items when last saved. Kept up to
+            date with the last wishlist saved. An empty dict if never saved.
+    """
+
+    def __init__(self, snapshot_path: Optional[Union[str, Path]] = None):
+        """Init SnapshotManager, opening the snapshot if it exists."""
+        if snapshot_path is None:
+            snapshot_path = Path(Path(__file__).parent, "wishlist_items.snapshot")
+        self.snapshot_path = Path(snapshot_path).resolve()
+        json_path = self.snapshot_path.with_suffix(".json")
+        if not self.snapshot_path.exists() and json_path.exists():
+            import_json(json_path, self.snapshot_path)
+        self.prev_wishlist: Union[Snapshot, WishlistDict] = self._open()
+
+    def _open(self) -> Union[Snapshot, WishlistDict]:
+        try:
+            return Snapshot(self.snapshot_path)
+        except FileNotFoundError:
+            # Probably running for the first time.
+            return {}
+
+    def get_wishlist_dict(self) -> WishlistDict:
+        """Return the items when last saved as a dict. Return empty dict if
+        nothing saved yet.
+        """
+        if isinstance(self.prev_wishlist, Snapshot):
+            return self.prev_wishlist.to_dict()
+        return {}
+
+    def get_lowest_price(self, asin: str) -> Optional[str]:
+        """Get the lowest `price` seen for ``asin``, as saved, or `None` if not
+        in the snapshot.
+        """
+        if asin not in self.prev_wishlist:
+            return None
+        return self.prev_wishlist[asin]["price"]
+
+    def get_lowest_prices(self, asins: Collection[str]) -> PreviousPrices:
+        """Look up the lowest price seen of each of ``asins``, and which items
+        in the snapshot aren't in ``asins``. Only the ASIN index and price
+        column are read.
+        """
+        lowest = (
+            dict(self.prev_wishlist.minor_prices())
+            if isinstance(self.prev_wishlist, Snapshot)
+            else {}
+        )
+        found = [asin for asin in asins if asin in lowest]
+        removed = [asin for asin in lowest if asin not in asins]
+        return PreviousPrices(found, [lowest[asin] for asin in found], removed)
+
+    def record_observations(self, items: Iterable[WishlistItem]) -> None:
+        """Does nothing. Only the lowest price seen is kept in the snapshot,
+        not the history of prices observed.
+        """
+
+    def save_wishlist_json(self, wishlist: Iterable[WishlistItem]) -> None:
+        """Save ``wishlist`` to the snapshot. Named to match
+        ``pricewatch.JsonManager``. Skipped if identical to the snapshot
+        already saved.
+        """
+        data = encode_snapshot(wishlist)
+        previous = self.prev_wishlist
+        if isinstance(previous, Snapshot):
+            if previous.matches(data):
+                return
+            # Unmapped before it's replaced, which fails on Windows while the
+            # file is mapped.
+            previous.close()
+        try:
+            write_snapshot(self.snapshot_path, data)
+        finally:
+            self.prev_wishlist = self._open()
+
+    def close(self) -> None:
+        """Unmap the snapshot."""
+        if isinstance(self.prev_wishlist, Snapshot):
+            self.prev_wishlist.close()
+
+
+def import_json(json_path: Union[str, Path], snapshot_path: Union[str, Path]) -> None:
+    """Convert a `wishlist_items.json` file to a snapshot."""
+    with open(json_path, "r") as wishlist_json:
+        wishlist_dict: WishlistDict = json.load(wishlist_json)
+    write_snapshot(snapshot_path, encode_snapshot(wishlist_dict.values()))
+
+
+def export_json(snapshot_path: Union[str, Path], json_path: Union[str, Path]) -> None:
+    """Convert a snapshot to a `wishlist_items.json` file."""
+    snapshot = Snapshot(snapshot_path)
+    try:
+        with open(json_path, "w") as wishlist_json:
+            json.dump(snapshot.to_dict(), wishlist_json)
+    finally:
+        snapshot.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Import or export a snapshot from the command line."""
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m amazon_wishlist_pricewatch.snapshot",
+        description="Convert between wishlist_items.json and a snapshot.",
+    )
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="json to snapshot")
+    import_parser.add_argument("json_path", type=Path)
+    import_parser.add_argument("snapshot_path", type=Path)
+    export_parser = subparsers.add_parser("export", help="snapshot to json")
+    export_parser.add_argument("snapshot_path", type=Path)
+    export_parser.add_argument("json_path", type=Path)
+    args = arg_parser.parse_args(argv)
+    if args.command == "import":
+        import_json(args.json_path, args.snapshot_path)
+    else:
+        export_json(args.snapshot_path, args.json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""A SQLite database as an alternative to `wishlist_items.json`.
+
+`SqliteManager` can be used in place of ``pricewatch.JsonManager`` by setting
+the `storage` key in the `general` section of `config.json` to "sqlite".
+Alongside the lowest price seen for each item it keeps the full history of
+prices observed, and only writes rows which have changed since the last run.
+"""
+
+import time
+from pathlib import Path
+from typing import Collection, Iterable, List, Optional, Tuple, Union
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    import prices
+    from my_types import MinorUnits, PreviousPrices, WishlistDict, WishlistItem
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from . import prices
+    from .my_types import MinorUnits, PreviousPrices, WishlistDict, WishlistItem
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    asin TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    byline TEXT,
+    url TEXT NOT NULL,
+    -- Lowest price seen, stored as given (str, or int for out of stock).
+    price NOT NULL,
+    -- Most recently observed price, in minor units.
+    last_price INTEGER,
+    -- 1 if the item was on the wishlist when last saved.
+    in_wishlist INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS price_observations (
+    asin TEXT NOT NULL REFERENCES items (asin),
+    observed_at REAL NOT NULL,
+    -- In minor units.
+    price INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS price_observations_asin_observed_at
+    ON price_observations (asin, observed_at);
+"""
+
+
+class SqliteManager:
+    """Manage loading/saving wishlist items and their price history to/from a
+    SQLite database.
+
+    Provides the same ``get_wishlist_dict``, ``get_lowest_price``,
+    ``get_lowest_prices`` and ``save_wishlist_json`` methods as
+    ``pricewatch.JsonManager`` so either can be used by
+    ``pricewatch.PriceWatch``.
+
+    Args:
+        db_path: Optional; Path of the database. Defaults to
+            `wishlist_items.sqlite3` on the same path as this source file.
+
+    Attributes:
+        db_path: Path of the database, created if it doesn't exist.
+        connection: The `sqlite3.Connection` to the database.
+        prev_wishlist: Items on the wishlist when last saved, as a dict. Kept
+            up to date with the last wishlist saved.
+    """
+
+    def __init__(self, db_path: Optional[Union[str, Path]] = None):
+        """Init SqliteManager, creating the database tables if needed."""
+        import sqlite3
+
+        if db_path is None:
+            db_path = Path(Path(__file__).parent, "wishlist_items.sqlite3")
+        self.db_path = Path(db_path).resolve()
+        self.connection = sqlite3.connect(self.db_path)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self._observations: List[Tuple[str, MinorUnits]] = []
+        self._observed_at = time.time()
+        self.prev_wishlist = self.get_wishlist_dict()
+
+    def get_wishlist_dict(self) -> WishlistDict:
+        """Return items on the wishlist when last saved, with the lowest price
+        seen for each, as dict. Return empty dict if nothing saved yet.
+        """
+        rows = self.connection.execute(
+            "SELECT asin, title, byline, url, price FROM items WHERE in_wishlist = 1"
+        )
+        return {
+            asin: {
+                "title": title,
+                "byline": byline,
+                "price": price,
+                "url": url,
+                "asin": asin,
+            }
+            for asin, title, byline, url, price in rows
+        }
+
+    def get_lowest_price(self, asin: str) -> Optional[Union[str, int]]:
+        """Get the lowest `price` seen for ``asin``, or `None` if never seen."""
+        row = self.connection.execute(
+            "SELECT price FROM items WHERE asin = ?", (asin,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_lowest_prices(self, asins: Collection[str]) -> PreviousPrices:
+        """Look up the lowest price seen of each of ``asins`` on the wishlist
+        when last saved, and which items saved then aren't in ``asins``.
+
+        ``asins`` are loaded into a temporary table and joined with `items` on
+        its primary key, so the prices of items no longer on the wishlist are
+        never read.
+        """
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS current_asins (asin TEXT PRIMARY KEY)"
+            )
+            self.connection.execute("DELETE FROM current_asins")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO current_asins VALUES (?)",
+                ((asin,) for asin in asins),
+            )
+            lowest = dict(
+                self.connection.execute(
+                    "SELECT items.asin, items.price FROM current_asins"
+                    " JOIN items ON items.asin = current_asins.asin"
+                    " WHERE items.in_wishlist = 1"
+                )
+            )
+            removed = [
+                asin
+                for (asin,) in self.connection.execute(
+                    "SELECT asin FROM items WHERE in_wishlist = 1"
+                    " AND asin NOT IN (SELECT asin FROM current_asins)"
+                )
+            ]
+        found = [asin for asin in asins if asin in lowest]
+        return PreviousPrices(
+            found, [prices.to_minor_units(lowest[asin]) for asin in found], removed
+        )
+
+    def get_price_history(
+        self, asin: str, since: float = 0.0
+    ) -> List[Tuple[float, MinorUnits]]:
+        """Get `(observed_at, price)` of each price change for ``asin``, oldest
+        first, optionally only those observed at or after ``since``. Prices are
+        in minor units.
+        """
+        return self.connection.execute(
+            "SELECT observed_at, price FROM price_observations"
+            " WHERE asin = ? AND observed_at >= ? ORDER BY observed_at",
+            (asin, since),
+        ).fetchall()
+
+    def record_observations(self, items: Iterable[WishlistItem]) -> None:
+        """Record the current price of each of ``items`` to be saved to the
+        price history on the next ``save_wishlist_json``.
+
+        Should be called before `compare_prices`, which replaces the current
+        price of items with the lowest price seen.
+        """
+        self._observed_at = time.time()
+        self._observations = [
+            (item["asin"], prices.to_minor_units(item["price"])) for item in items
+        ]
+
+    def save_wishlist_json(self, wishlist: Iterable[WishlistItem]) -> None:
+        """Save ``wishlist`` and any recorded observations to the database.
+
+        Named to match ``pricewatch.JsonManager``. Only items which are new or
+        have changed, and prices which differ from the last observation, are
+        written. All writes are made in a single transaction.
+        """
+        saved = {
+            asin: (title, byline, url, price, last_price, in_wishlist)
+            for asin, title, byline, url, price, last_price, in_wishlist in (
+                self.connection.execute(
+                    "SELECT asin, title, byline, url, price, last_price, in_wishlist"
+                    " FROM items"
+                )
+            )
+        }
+        observed = dict(self._observations)
+
+        item_rows = []
+        for item in wishlist:
+            asin = item["asin"]
+            last_price = observed.get(asin, saved.get(asin, (None,) * 5)[4])
+            row = (item["title"], item["byline"], item["url"], item["price"])
+            if saved.get(asin) != row + (last_price, 1):
+                item_rows.append((asin,) + row + (last_price,))
+        on_wishlist = {item["asin"] for item in wishlist}
+        removed_rows = [
+            (asin,) for asin, row in saved.items() if row[5] and asin not in on_wishlist
+        ]
+        observation_rows = [
+            (asin, self._observed_at, price)
+            for asin, price in self._observations
+            if asin not in saved or saved[asin][4] != price
+        ]
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO items"
+                " (asin, title, byline, url, price, last_price, in_wishlist)"
+                " VALUES (?, ?, ?, ?, ?, ?, 1)"
+                " ON CONFLICT (asin) DO UPDATE SET title = excluded.title,"
+                " byline = excluded.byline, url = excluded.url,"
+                " price = excluded.price, last_price = excluded.last_price,"
+                " in_wishlist = 1",
+                item_rows,
+            )
+            self.connection.executemany(
+                "UPDATE items SET in_wishlist = 0 WHERE asin = ?", removed_rows
+            )
+            self.connection.executemany(
+                "INSERT INTO price_observations (asin, observed_at, price)"
+                " VALUES (?, ?, ?)",
+                observation_rows,
+            )
+        self._observations = []
+        self.prev_wishlist = {item["asin"]: item for item in wishlist}
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        self.connection.close()
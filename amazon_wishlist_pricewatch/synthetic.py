@@ -0,0 +1,269 @@
+"""Synthetic Amazon wishlist pages, for benchmarks and local testing.
+
+``generate_wishlist`` builds the pages of a made up wishlist of any size, in
+the same shape as Amazon's: each item an `li` with the `g-item-sortable`
+class and `data-price` / `data-reposition-action-params` attributes, between
+the page's navigation and scripts, with each page linked to the next by the
+"see more" link. Like a real wishlist, some items are out of stock, some
+have no byline and some are no longer available and fail to parse.
+
+Wishlists are generated from a seed, so the same arguments always give the
+same pages, and ``expected_items`` gives the items a parser should find.
+"""
+
+import base64
+import html
+import random
+import sys
+from typing import List, NamedTuple, Optional
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    from my_types import ParsedItem
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from .my_types import ParsedItem
+
+DEFAULT_BASE_URL = "https://www.amazon.co.uk"
+WISHLIST_ID = "SYNTH3T1C"
+MARKETPLACE_ID = "A1F83G8C2ARO7P"
+# Roughly the size of the navigation, scripts and footer of a real page.
+DEFAULT_PAGE_PADDING = 64 * 1024
+
+OUT_OF_STOCK_RATE = 0.05
+UNAVAILABLE_RATE = 0.02
+NO_BYLINE_RATE = 0.3
+
+_NOUNS = (
+    "Programmer", "Skillet", "Espresso Machine", "Headphones", "Kettle",
+    "Backpack", "Keyboard", "Novel", "Lamp", "Board Game", "Chef's Knife",
+    "Water Bottle", "Tent", "Monitor", "Cookbook",
+)  # fmt: skip
+_ADJECTIVES = (
+    "Pragmatic", "Cast Iron", "Wireless", "Stainless Steel", "Compact",
+    "Ergonomic", "Bestselling", "Adjustable", "Family", "Japanese",
+    "Insulated", "Lightweight", "4K", "Vegetarian", "Deluxe",
+)  # fmt: skip
+_AUTHORS = 500
+
+
+class SyntheticItem(NamedTuple):
+    """An item on a synthetic wishlist.
+
+    Attributes:
+        item: The `ParsedItem` a parser should find, or `None` if the item is
+            no longer available and should fail to parse.
+        asin: Amazon's id of the item.
+        item_id: Id of the item on the wishlist.
+    """
+
+    item: Optional[ParsedItem]
+    asin: str
+    item_id: str
+
+
+class SyntheticPage(NamedTuple):
+    """A page of a synthetic wishlist.
+
+    Attributes:
+        url: Absolute URL of the page.
+        html: The page's HTML.
+        next_url: Absolute URL of the next page, or `None` on the last page.
+    """
+
+    url: str
+    html: str
+    next_url: Optional[str]
+
+
+def synthetic_items(items: int, seed: int = 0) -> List[SyntheticItem]:
+    """Return ``items`` made up wishlist items, the same for each ``seed``."""
+    rng = random.Random(seed)
+    result = []
+    for i in range(items):
+        asin = f"B{seed % 100:02d}{i:07d}"
+        item_id = f"I{seed % 100:02d}{i:011d}"
+        if rng.random() < UNAVAILABLE_RATE:
+            result.append(SyntheticItem(None, asin, item_id))
+            continue
+        title = f"{rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)} & More, No. {i}"
+        byline = (
+            ""
+            if rng.random() < NO_BYLINE_RATE
+            else f"by Author Number {rng.randrange(_AUTHORS)} (Paperback)"
+        )
+        price = (
+            sys.maxsize
+            if rng.random() < OUT_OF_STOCK_RATE
+            else str(rng.randrange(100, 100_000) / 100)
+        )
+        url = f"/dp/{asin}/?coliid={item_id}&colid={WISHLIST_ID}&psc=1&ref_=lv_ov_lig_dp_it"
+        result.append(
+            SyntheticItem(ParsedItem(title, byline, price, url, asin), asin, item_id)
+        )
+    return result
+
+
+def expected_items(items: int, seed: int = 0) -> List[ParsedItem]:
+    """Return the `ParsedItem` a parser should find for each item of the
+    wishlist generated with the same arguments, in order.
+    """
+    return [item.item for item in synthetic_items(items, seed) if item.item]
+
+
+def page_url(page: int, base_url: str = DEFAULT_BASE_URL) -> str:
+    """Return the absolute URL of page ``page`` (from 0) of the wishlist."""
+    if page == 0:
+        return f"{base_url}/hz/wishlist/ls/{WISHLIST_ID}"
+    return base_url + _page_path(page)
+
+
+def _page_path(page: int) -> str:
+    """Return the path and query of page ``page`` (from 1) as linked to by the
+    "see more" link of the page before it.
+    """
+    token = base64.urlsafe_b64encode(f'{{"page":{page + 1}}}'.encode()).decode()
+    return (
+        f"/hz/wishlist/slv/items?filter=unpurchased&paginationToken={token}"
+        f"&itemsLayout=LIST&sort=default&type=wishlist&lek={WISHLIST_ID.lower()}"
+    )
+
+
+def item_html(item: SyntheticItem) -> str:
+    """Return the `li` element of a single wishlist item."""
+    if item.item is None:
+        data_price = ""
+        body = (
+            '      <span class="a-size-base">This item is no longer available.</span>\n'
+        )
+    else:
+        title = html.escape(item.item.title)
+        url = html.escape(item.item.url)
+        if item.item.price == sys.maxsize:
+            data_price = ' data-price="-Infinity"'
+            price = '<span class="a-color-price">Currently unavailable.</span>'
+        else:
+            data_price = f' data-price="{item.item.price}"'
+            price = (
+                f'<span id="itemPrice_{item.item_id}" class="a-price">'
+                f'<span class="a-offscreen">£{float(item.item.price):,.2f}</span></span>'
+            )
+        body = (
+            '      <div class="a-fixed-left-grid-col a-col-left">\n'
+            f'        <a class="a-link-normal" title="{title}" href="{url}">\n'
+            f'          <img alt="{title}" src="https://m.media-amazon.com/images/I/{item.asin}.jpg" height="135" width="135">\n'
+            "        </a>\n"
+            "      </div>\n"
+            '      <div class="a-fixed-left-grid-col a-col-right">\n'
+            f'        <h3 class="a-size-base"><a id="itemName_{item.item_id}" class="a-link-normal" title="{title}" href="{url}">{title}</a></h3>\n'
+            f'        <span id="item-byline-{item.item_id}" class="a-size-base">\n'
+            f"          {html.escape(item.item.byline or '')}\n"
+            "        </span>\n"
+            f"        {price}\n"
+            "      </div>\n"
+        )
+    params = (
+        f'{{"itemExternalId":"ASIN:{item.asin}|{MARKETPLACE_ID}",'
+        '"listType":"wishlist","sid":"000-0000000-0000000"}'
+    )
+    return (
+        f'<li data-id="{WISHLIST_ID}" data-itemid="{item.item_id}"{data_price}'
+        f" data-reposition-action-params='{params}'"
+        ' class="a-spacing-none g-item-sortable">\n'
+        '  <span class="a-list-item">\n'
+        f'    <div id="itemMain_{item.item_id}" class="a-fixed-left-grid a-spacing-none">\n'
+        f"{body}"
+        "    </div>\n"
+        "  </span>\n"
+        "</li>\n"
+    )
+
+
+def page_html(
+    items: List[SyntheticItem],
+    next_path: Optional[str],
+    padding: int = DEFAULT_PAGE_PADDING,
+) -> str:
+    """Return a full wishlist page holding ``items``.
+
+    Args:
+        items: Items on the page.
+        next_path: Path and query of the next page, linked with the "see more"
+            link, or `None` on the last page.
+        padding: Optional; Bytes of navigation and scripts to surround the
+            items with, split between the top and bottom of the page.
+    """
+    filler = (
+        '<script type="text/javascript">P.when("A").execute(function (A)'
+        ' { A.declarative("nav-flyout", "click", function () {}); });</script>\n'
+    )
+    half_padding = filler * max(0, padding // (2 * len(filler)))
+    see_more = (
+        '<a class="a-size-base a-link-nav-icon a-js g-visible-no-js wl-see-more"'
+        f' href="{html.escape(next_path)}">See more</a>\n'
+        if next_path
+        else ""
+    )
+    return "".join(
+        [
+            '<!doctype html>\n<html lang="en-gb" class="a-no-js">\n<head>\n'
+            '<meta charset="utf-8">\n<title>Amazon.co.uk: Synthetic Wishlist</title>\n'
+            '</head>\n<body>\n<div id="a-page">\n'
+            '<header id="navbar-main" class="nav-opt-sprite">\n',
+            half_padding,
+            '</header>\n<div id="wishlist-page">\n'
+            '<ul id="g-items" class="a-unordered-list a-nostyle a-vertical'
+            ' a-spacing-none g-items-section ui-sortable">\n',
+            *(item_html(item) for item in items),
+            '</ul>\n<div id="endOfListMarker"></div>\n',
+            see_more,
+            '</div>\n<footer class="navLeftFooter nav-sprite-v1" id="navFooter">\n',
+            half_padding,
+            "</footer>\n</div>\n</body>\n</html>\n",
+        ]
+    )
+
+
+def generate_wishlist(
+    items: int,
+    pages: int = 1,
+    seed: int = 0,
+    base_url: str = DEFAULT_BASE_URL,
+    padding: int = DEFAULT_PAGE_PADDING,
+) -> List[SyntheticPage]:
+    """Generate the pages of a wishlist of ``items`` items.
+
+    Args:
+        items: Number of items on the wishlist.
+        pages: Optional; Number of pages the items are spread across, as evenly
+            as possible. At least one.
+        seed: Optional; Seed of the random items. See ``synthetic_items``.
+        base_url: Optional; Scheme and host of the page URLs, e.g. a local
+            server serving the pages.
+        padding: Optional; Bytes of navigation and scripts on each page.
+
+    Returns:
+        A `SyntheticPage` for each page, in order.
+    """
+    if pages < 1:
+        raise ValueError("pages must be at least 1.")
+    all_items = synthetic_items(items, seed)
+    per_page, extra = divmod(items, pages)
+    result = []
+    start = 0
+    for page in range(pages):
+        end = start + per_page + (page < extra)
+        last = page == pages - 1
+        result.append(
+            SyntheticPage(
+                url=page_url(page, base_url),
+                html=page_html(
+                    all_items[start:end],
+                    None if last else _page_path(page + 1),
+                    padding,
+                ),
+                next_url=None if last else page_url(page + 1, base_url),
+            )
+        )
+        start = end
+    return result
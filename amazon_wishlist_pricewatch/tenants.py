@@ -0,0 +1,186 @@
+"""Run the price watch for many config files from one install.
+
+``pricewatch run-many CONFIG_DIR`` treats each `*.json` file in `CONFIG_DIR`
+as the `config.json` of a tenant, named after the file. Each tenant's state
+(its saved wishlist, page cache and notification outbox) is kept in a
+directory of its own, `STATE_DIR/<tenant>`, so tenants never see each
+other's data. By default `STATE_DIR` is `CONFIG_DIR/state`. Only the items of
+wishlists fetched recently are shared, through the
+`shared_cache.SharedWishlistCache` in `STATE_DIR/_shared_cache`, so a
+wishlist watched by many tenants is only fetched once per cycle.
+
+Tenants run one pass each (see ``pricewatch.run_pass``) across a pool of
+processes, one per available core by default. A tenant which fails, even by
+crashing its worker process, is reported as failed without stopping the
+rest, and a summary of every tenant is logged at the end.
+"""
+
+import os
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+if __package__ is None or __package__ == "":
+    # Uses current directory visibility when not running as a package.
+    import notify
+    import settings
+    from logger import logger
+else:
+    # Uses current package visibility when running as a package or with pytest.
+    from . import notify, settings
+    from .logger import logger
+
+STATE_DIR_NAME = "state"
+SHARED_CACHE_DIR_NAME = "_shared_cache"
+
+
+class TenantResult(NamedTuple):
+    """The outcome of one tenant's pass.
+
+    Attributes:
+        tenant: Name of the tenant, its config file name less `.json`.
+        ok: True if the pass finished.
+        seconds: Seconds the pass took.
+        counters: The pass's `metrics.Metrics` counters, or empty if it failed
+            before they were recorded.
+        error: Description of the failure, or `None` if ``ok``.
+    """
+
+    tenant: str
+    ok: bool
+    seconds: float
+    counters: Dict[str, int]
+    error: Optional[str] = None
+
+
+def available_cores() -> int:
+    """Return the number of cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def tenant_configs(config_dir: Path) -> List[Path]:
+    """Return the config file of each tenant in ``config_dir``, by name."""
+    return sorted(path for path in Path(config_dir).glob("*.json") if path.is_file())
+
+
+def run_tenant(config_path: Path, state_dir: Path) -> TenantResult:
+    """Run one pass for the tenant configured by ``config_path``.
+
+    Runs in a worker process of ``run_many``. Any exception is caught and
+    returned as a failed `TenantResult`.
+
+    Args:
+        config_path: The tenant's `config.json`.
+        state_dir: Directory holding every tenant's state directory.
+    """
+    if __package__ is None or __package__ == "":
+        from pricewatch import PriceWatch, run_pass
+    else:
+        from .pricewatch import PriceWatch, run_pass
+
+    tenant = config_path.stem
+    start = time.perf_counter()
+    pw = None
+    try:
+        loaded = settings.load(config_path)
+        # Worker processes run many tenants, one after another.
+        notify.configure(loaded)
+        if not loaded.general.wishlist_urls:
+            raise ValueError(f"No wishlist_url set in {config_path}")
+        tenant_state_dir = Path(state_dir, tenant)
+        tenant_state_dir.mkdir(parents=True, exist_ok=True)
+        pw = PriceWatch(
+            loaded, tenant_state_dir, Path(state_dir, SHARED_CACHE_DIR_NAME)
+        )
+        notify.start_dispatcher(Path(tenant_state_dir, "outbox"))
+        try:
+            run_pass(pw)
+        finally:
+            notify.stop_dispatcher()
+    except Exception as e:
+        logger.error(f"Tenant {tenant} failed:\n{traceback.format_exc()}")
+        return TenantResult(
+            tenant,
+            False,
+            time.perf_counter() - start,
+            dict(pw.metrics.counters) if pw else {},
+            f"{type(e).__name__}: {e}",
+        )
+    return TenantResult(
+        tenant, True, time.perf_counter() - start, dict(pw.metrics.counters)
+    )
+
+
+def run_many(
+    config_dir: Path,
+    state_dir: Optional[Path] = None,
+    processes: Optional[int] = None,
+) -> List[TenantResult]:
+    """Run one pass for each tenant in ``config_dir`` across a process pool.
+
+    Args:
+        config_dir: Directory of tenant config files. See ``tenant_configs``.
+        state_dir: Optional; Directory to keep each tenant's state in.
+            Defaults to `state` in ``config_dir``.
+        processes: Optional; Number of worker processes. Defaults to the number
+            of available cores.
+
+    Returns:
+        A `TenantResult` for each tenant, by tenant name.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    config_paths = tenant_configs(config_dir)
+    if state_dir is None:
+        state_dir = Path(config_dir, STATE_DIR_NAME)
+    processes = min(processes or available_cores(), max(len(config_paths), 1))
+    results: Dict[str, TenantResult] = {}
+    crashed = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            path: executor.submit(run_tenant, path, state_dir) for path in config_paths
+        }
+        for path, future in futures.items():
+            try:
+                results[path.stem] = future.result()
+            except BrokenProcessPool:
+                crashed.append(path)
+    # A crashed worker breaks the pool, failing every tenant not yet finished.
+    # Those are run again one at a time, so only the tenant which crashed fails.
+    for path in crashed:
+        results[path.stem] = run_isolated(path, state_dir)
+    return [results[path.stem] for path in config_paths]
+
+
+def run_isolated(config_path: Path, state_dir: Path) -> TenantResult:
+    """Run a single tenant in a worker process of its own, reporting it as
+    failed if the process crashes.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(run_tenant, config_path, state_dir).result()
+        except BrokenProcessPool:
+            logger.error(f"Tenant {config_path.stem} crashed its worker process.")
+            return TenantResult(
+                config_path.stem, False, 0.0, {}, "Worker process crashed."
+            )
+
+
+def summary(results: List[TenantResult]) -> str:
+    """Return a summary of the ``results`` of ``run_many``."""
+    failed = [result for result in results if not result.ok]
+    items = sum(result.counters.get("items_parsed", 0) for result in results)
+    alerts = sum(result.counters.get("alerts_sent", 0) for result in results)
+    lines = [
+        f"{len(results)} tenants: {len(results) - len(failed)} succeeded,"
+        f" {len(failed)} failed. {items} items parsed, {alerts} alerts sent."
+    ]
+    lines += [f"  {result.tenant}: {result.error}" for result in failed]
+    return "\n".join(lines)
@@ -0,0 +1,73 @@
+"""Measure rendering price alerts for many items into size-capped messages.
+
+Usage:
+    python benchmarks/bench_notify.py [--items N] [--repeat R]
+
+Alerts for ``N`` (default 10,000) items with realistic titles, bylines and
+urls are rendered with ``notify.render_messages`` into messages within the
+default size limit of each channel, as after a big sale. Reported are the
+best time of ``R`` repeats, the number and largest size of the messages,
+and the peak memory used while rendering, measured with `tracemalloc`.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from amazon_wishlist_pricewatch import notify  # noqa: E402
+
+
+def make_items(items):
+    return [
+        {
+            "title": f"Example Product Title Number {i} with a Descriptive Subtitle",
+            "byline": f"by Author Number {i % 500} (Paperback)" if i % 3 else None,
+            "price": f"{i % 100}.{i % 100:02d}",
+            "url": f"/dp/B{i:09d}/?coliid=I{i:013d}&colid=3A5TWPSIKSNQ4&psc=1",
+            "asin": f"B{i:09d}",
+        }
+        for i in range(items)
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--items", type=int, default=10_000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+    notify.config = {
+        "general": {"wishlist_url": "https://www.amazon.co.uk/hz/wishlist/ls/B3NCH"}
+    }
+    items = make_items(args.items)
+
+    for channel, max_size in notify.MAX_MESSAGE_SIZES.items():
+        include_html = channel not in notify.TEXT_ONLY_CHANNELS
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            # Only the sizes are kept, as each message would be sent and dropped.
+            sizes = [
+                len(text) + len(html) if include_html else len(text)
+                for text, html in notify.render_messages(items, max_size, include_html)
+            ]
+            best = min(best, time.perf_counter() - start)
+
+        tracemalloc.start()
+        for _ in notify.render_messages(items, max_size, include_html):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print(
+            f"{channel:>8}: {args.items:,} items in {best * 1000:7.1f}ms,"
+            f" {len(sizes):5,} message(s) of up to {max(sizes):9,} chars,"
+            f" peak {peak / 1024:8,.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
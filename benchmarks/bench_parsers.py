@@ -0,0 +1,54 @@
+"""Time each parser backend against saved wishlist pages.
+
+Usage:
+    python benchmarks/bench_parsers.py [PAGE.html ...]
+
+Each page is parsed repeatedly with every available backend in
+`amazon_wishlist_pricewatch.parsers`, and the mean time per page is reported
+along with the speedup relative to the default "html.parser" backend. The
+backends are also checked to produce identical items. Defaults to the test
+fixture page if no pages are given.
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from amazon_wishlist_pricewatch import parsers  # noqa: E402
+
+DEFAULT_PAGE = Path(Path(__file__).parent.parent, "tests", "wishlist_page.html")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("pages", nargs="*", type=Path, default=[DEFAULT_PAGE])
+    arg_parser.add_argument("--repeat", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    pages = [page.read_text(encoding="utf-8") for page in args.pages]
+    expected = [parsers.parse_items(page) for page in pages]
+    baseline = None
+    for backend in parsers.PARSER_BACKENDS:
+        try:
+            parsers.check_backend(backend)
+        except ImportError:
+            print(f"{backend:>16}: skipped, lxml not installed")
+            continue
+        if [parsers.parse_items(page, backend) for page in pages] != expected:
+            sys.exit(f"{backend} parsed different items to {parsers.DEFAULT_PARSER}.")
+        seconds = timeit.timeit(
+            lambda: [parsers.parse_items(page, backend) for page in pages],
+            number=args.repeat,
+        ) / (args.repeat * len(pages))
+        baseline = baseline or seconds
+        print(
+            f"{backend:>16}: {seconds * 1000:8.3f} ms/page"
+            f"  {baseline / seconds:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
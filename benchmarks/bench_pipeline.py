@@ -0,0 +1,204 @@
+"""Measure how each stage of a run scales with the size of the wishlist.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--items N] [--pages M] [--parser P]
+        [--output RUN.json] [--compare BASELINE.json] [--tolerance 0.2]
+
+A synthetic wishlist of ``N`` (default 10,000) items over ``M`` (default
+``N / 10``) pages is generated with `amazon_wishlist_pricewatch.synthetic`,
+then each stage of a run is timed and its peak memory measured:
+
+- parse_wishlist: ``PriceWatch.parse_page`` of every page.
+- compare_prices: ``PriceWatch.compare_prices`` against a previous wishlist
+  where a third of the items were dearer and a third cheaper.
+- save_wishlist_json: ``JsonManager.save_wishlist_json`` to a temporary file.
+- parse_txt_html: ``notify.parse_txt_html`` of the items now cheaper.
+
+Times are the best of ``--repeat`` runs, reported as items/sec. Peak memory
+is measured separately with `tracemalloc`, so tracing doesn't slow the timed
+runs. Results can be saved with ``--output`` and a later run compared to
+them with ``--compare``. The exit status is 1 if any stage is slower, or uses
+more memory, than the baseline by more than ``--tolerance``.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from amazon_wishlist_pricewatch import notify, synthetic  # noqa: E402
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch  # noqa: E402
+
+# Prepares a stage, returning the callable to be measured.
+Stage = Callable[[], Callable[[], object]]
+
+
+def responses(pages: List[synthetic.SyntheticPage]) -> List[requests.Response]:
+    result = []
+    for page in pages:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = page.url
+        response.encoding = "utf-8"
+        response._content = page.html.encode("utf-8")
+        result.append(response)
+    return result
+
+
+def previous_wishlist(pw: PriceWatch) -> Dict:
+    """Return ``pw.wishlist`` with a third of prices higher, a third lower."""
+    previous = {}
+    for i, item in enumerate(pw.wishlist):
+        item = dict(item)
+        if item["price"] != sys.maxsize:
+            change = (1, -1, 0)[i % 3]
+            item["price"] = str(max(0.01, float(item["price"]) + change))
+        previous[item["asin"]] = item
+    return previous
+
+
+def build_stages(args: argparse.Namespace, work_dir: Path) -> Dict[str, Stage]:
+    pages = synthetic.generate_wishlist(args.items, args.pages)
+    config = {
+        "general": {
+            "notification_mode": "",
+            "wishlist_url": pages[0].url,
+            "user_agent": "bench_pipeline",
+            "send_test_notification": "0",
+            "parser": args.parser,
+            "page_cache": "0",
+        }
+    }
+    notify.config = config
+    pw = PriceWatch(config, work_dir)
+    page_responses = responses(pages)
+
+    def parse_wishlist():
+        pw.wishlist = pw.wishlist_class()
+        return lambda: [pw.parse_page(response) for response in page_responses]
+
+    parse_wishlist()()
+    parsed = pw.wishlist.to_dict()
+    pw.json_man.prev_wishlist = previous_wishlist(pw)
+    cheaper: list = []
+
+    def compare_prices():
+        pw.wishlist = pw.wishlist_class()
+        for item in parsed.values():
+            pw.wishlist.add_item(**item)
+
+        def run():
+            cheaper[:] = pw.compare_prices()
+
+        return run
+
+    def save_wishlist_json():
+        pw.json_man.prev_wishlist = {}
+        return lambda: pw.json_man.save_wishlist_json(pw.wishlist)
+
+    def parse_txt_html():
+        return lambda: notify.parse_txt_html(cheaper)
+
+    return {
+        "parse_wishlist": parse_wishlist,
+        "compare_prices": compare_prices,
+        "save_wishlist_json": save_wishlist_json,
+        "parse_txt_html": parse_txt_html,
+    }
+
+
+def measure(stage: Stage, repeat: int) -> Tuple[float, int]:
+    """Return the best time, and the peak memory, of running ``stage``."""
+    best = float("inf")
+    for _ in range(repeat):
+        run = stage()
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    run = stage()
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return a description of each stage regressed beyond ``tolerance``."""
+    regressions = []
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        slower = base["items_per_second"] / stage["items_per_second"] - 1
+        bigger = stage["peak_bytes"] / max(base["peak_bytes"], 1) - 1
+        print(f"{name:>20}: {-slower:+7.1%} items/sec  {bigger:+7.1%} peak memory")
+        if slower > tolerance:
+            regressions.append(f"{name} is {slower:.0%} slower")
+        if bigger > tolerance:
+            regressions.append(f"{name} uses {bigger:.0%} more memory")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--items", type=int, default=10_000)
+    arg_parser.add_argument("--pages", type=int)
+    arg_parser.add_argument("--parser", default="html.parser")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--output", type=Path)
+    arg_parser.add_argument("--compare", type=Path)
+    arg_parser.add_argument("--tolerance", type=float, default=0.2)
+    args = arg_parser.parse_args()
+    args.pages = args.pages or max(1, args.items // 10)
+    # Per page warnings about items which fail to parse are expected.
+    logging.disable(logging.CRITICAL)
+
+    results: Dict = {
+        "items": args.items,
+        "pages": args.pages,
+        "parser": args.parser,
+        "python": platform.python_version(),
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, stage in build_stages(args, Path(work_dir)).items():
+            seconds, peak = measure(stage, args.repeat)
+            results["stages"][name] = {
+                "seconds": seconds,
+                "items_per_second": args.items / seconds,
+                "peak_bytes": peak,
+            }
+            print(
+                f"{name:>20}: {args.items / seconds:12,.0f} items/sec"
+                f"  {peak / 2 ** 20:8.1f} MiB peak"
+            )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if (baseline["items"], baseline["pages"]) != (args.items, args.pages):
+            print("Warning: baseline was run with a different --items / --pages.")
+        print(f"Compared to {args.compare}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit("Regressions: " + "; ".join(regressions) + ".")
+
+
+if __name__ == "__main__":
+    main()
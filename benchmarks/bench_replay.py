@@ -0,0 +1,152 @@
+"""Measure a full run end to end against a local stand-in for Amazon.
+
+Usage:
+    python benchmarks/bench_replay.py [--items N] [--pages M] [--wishlists W]
+        [--latency S] [--jitter S] [--error-rate R] [--burst-every N]
+        [--burst-length N] [--requests-per-second R] [--max-concurrency C]
+        [--parse-processes P] [--stream-pages]
+
+A `ReplayServer` from `amazon_wishlist_pricewatch.replay` serves a synthetic
+wishlist of ``N`` items over ``M`` pages, with the latency, server errors
+and bursts of throttling given. ``W`` wishlists, each served the same pages,
+are then fetched, parsed, compared and saved by ``pricewatch.run_pass``, as
+configured with the `fetch` options given, parsing pages in ``P`` worker
+processes if given, or as they download with ``--stream-pages``. Needs no
+network.
+
+Reported are the run's throughput in pages and items per second, the
+latency of each HTTP request and of each page including retries (p50, p95,
+p99 and max), and the retries and throttling seen.
+"""
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from amazon_wishlist_pricewatch import notify, replay  # noqa: E402
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch, run_pass  # noqa: E402
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Return the p50, p95, p99 and max of ``samples``, in milliseconds."""
+    if len(samples) < 2:
+        samples = samples * 2 or [0.0, 0.0]
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50": cuts[49] * 1000,
+        "p95": cuts[94] * 1000,
+        "p99": cuts[98] * 1000,
+        "max": max(samples) * 1000,
+    }
+
+
+def timed(func, samples: List[float]):
+    """Wrap ``func``, appending the seconds each call takes to ``samples``."""
+    lock = threading.Lock()
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with lock:
+                samples.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--items", type=int, default=1_000)
+    arg_parser.add_argument("--pages", type=int, default=100)
+    arg_parser.add_argument("--wishlists", type=int, default=4)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--jitter", type=float, default=0.05)
+    arg_parser.add_argument("--error-rate", type=float, default=0.01)
+    arg_parser.add_argument("--burst-every", type=int, default=50)
+    arg_parser.add_argument("--burst-length", type=int, default=3)
+    arg_parser.add_argument("--requests-per-second", type=float, default=50)
+    arg_parser.add_argument("--max-concurrency", type=int, default=4)
+    arg_parser.add_argument("--retry-seconds", type=float, default=0.1)
+    arg_parser.add_argument("--parser", default="restricted")
+    arg_parser.add_argument("--parse-processes", type=int, default=0)
+    arg_parser.add_argument("--stream-pages", action="store_true")
+    args = arg_parser.parse_args()
+    # Warnings about retries and items which fail to parse are expected.
+    logging.disable(logging.CRITICAL)
+
+    server = replay.ReplayServer(
+        replay.synthetic_pages(args.items, args.pages),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+    )
+    config = {
+        "general": {
+            "notification_mode": "",
+            # Only the W wishlists below are fetched.
+            "wishlist_url": "",
+            "wishlist_urls": [
+                f"https://www.amazon.co.uk/hz/wishlist/ls/W{i}"
+                for i in range(args.wishlists)
+            ],
+            "user_agent": "bench_replay",
+            "send_test_notification": "0",
+            "parser": args.parser,
+            "page_cache": "0",
+            "parse_processes": args.parse_processes,
+        },
+        "fetch": {
+            "base_url": server.url,
+            "max_concurrency": args.max_concurrency,
+            "requests_per_second": args.requests_per_second,
+            "burst": args.max_concurrency,
+            "retry_seconds": args.retry_seconds,
+            "max_attempts": 8,
+            "circuit_breaker_failures": 1000,
+            "stream_pages": "1" if args.stream_pages else "0",
+        },
+    }
+    notify.config = config
+
+    with server, tempfile.TemporaryDirectory() as work_dir:
+        pw = PriceWatch(config, Path(work_dir))
+        request_times: List[float] = []
+        page_times: List[float] = []
+        pw.session.get = timed(pw.session.get, request_times)
+        pw.fetch_engine.fetch_page = timed(pw.request_page, page_times)
+        start = time.perf_counter()
+        run_pass(pw)
+        elapsed = time.perf_counter() - start
+
+    pages = pw.metrics.counters["pages"]
+    print(f"{len(pw.wishlist_urls)} wishlists, {pages} pages in {elapsed:.2f}s")
+    print(f"{pages / elapsed:12,.1f} pages/sec")
+    print(f"{pw.metrics.counters['items_parsed'] / elapsed:12,.0f} items/sec")
+    print(f"{pw.metrics.counters['bytes_downloaded'] / pages:12,.0f} bytes/page")
+    for name, samples in (("request", request_times), ("page", page_times)):
+        latency = percentiles(samples)
+        print(
+            f"{name:>8} latency ms: "
+            + "  ".join(f"{key} {value:7.1f}" for key, value in latency.items())
+        )
+    print(
+        f"retries {pw.metrics.counters['retries']},"
+        f" throttled {pw.metrics.counters['throttled']},"
+        f" failed wishlists {pw.metrics.counters['failed_wishlists']}"
+    )
+    print(f"server: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
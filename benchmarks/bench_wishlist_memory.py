@@ -0,0 +1,69 @@
+"""Measure the memory used per item by `Wishlist` and `CompactWishlist`.
+
+Usage:
+    python benchmarks/bench_wishlist_memory.py [--items N]
+
+Each wishlist is filled with ``N`` (default 100,000) items with realistic
+titles, urls and prices, with bylines drawn from a pool of authors as on a
+wishlist of books. Strings are built fresh for each item, as they would be
+when parsed. Memory is measured with `tracemalloc` and includes the strings.
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from amazon_wishlist_pricewatch.pricewatch import (  # noqa: E402
+    CompactWishlist,
+    Wishlist,
+)
+
+AUTHORS = 500
+
+
+def fill(wishlist, items):
+    for i in range(items):
+        asin = f"B{i:09d}"
+        wishlist.add_item(
+            title=f"Example Product Title Number {i} with a Descriptive Subtitle",
+            byline=f"by Author Number {i % AUTHORS} (Paperback)",
+            price=f"{i % 100}.{i % 100:02d}",
+            url=f"/dp/{asin}/?coliid=I{i:013d}&colid=3A5TWPSIKSNQ4&psc=1"
+            f"&ref_=lv_ov_lig_dp_it",
+            asin=asin,
+        )
+    return wishlist
+
+
+def measure(wishlist_class, items):
+    gc.collect()
+    tracemalloc.start()
+    wishlist = fill(wishlist_class(), items)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(wishlist) == items
+    return size
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--items", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    baseline = None
+    for wishlist_class in (Wishlist, CompactWishlist):
+        size = measure(wishlist_class, args.items)
+        baseline = baseline or size
+        print(
+            f"{wishlist_class.__name__:>16}: {size / args.items:6.0f} bytes/item"
+            f"  {size / 2 ** 20:6.1f} MiB  {size / baseline:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import json
 import logging.handlers
+import socketserver
+import threading
 from pathlib import Path
 
 import pytest
+import requests
 
+import amazon_wishlist_pricewatch.logger as logger
 import amazon_wishlist_pricewatch.notify as notify
+import amazon_wishlist_pricewatch.pricewatch as pricewatch
 from amazon_wishlist_pricewatch.pricewatch import Wishlist, JsonManager
 
 TESTS_FOLDER = Path(__file__).parent.resolve()
@@ -15,6 +20,28 @@ def disable_logging():
     logging.disable(logging.CRITICAL)
 
 
+@pytest.fixture(autouse=True)
+def log_path(tmp_path, monkeypatch):
+    """Log tests which run `main` to a file of their own rather than the
+    package's, and stop logging after each, so its handlers don't stay on the
+    root logger for later tests.
+    """
+    path = tmp_path / "pricewatch.log"
+    monkeypatch.setattr(logger, "LOG_PATH", path)
+    yield path
+    logger.stop_logging()
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path_factory, monkeypatch):
+    """Keep the state of `PriceWatch` instances made without a `state_dir` out
+    of the package directory.
+    """
+    path = tmp_path_factory.mktemp("state")
+    monkeypatch.setattr(pricewatch, "DEFAULT_STATE_DIR", path)
+    return path
+
+
 @pytest.fixture()
 def mock_prev_wishlist(monkeypatch):
     with open(Path(TESTS_FOLDER, "wishlist_items.json"), "r") as f:
@@ -43,6 +70,9 @@ def block_notification_calls(monkeypatch):
         return True, True
 
     monkeypatch.setattr(notify, "parse_txt_html", mock_calls)
+    monkeypatch.setattr(
+        notify, "render_messages", lambda *args, **kwargs: iter([(True, True)])
+    )
     monkeypatch.setattr(notify, "send_email", mock_calls)
     monkeypatch.setattr(notify, "telegram_message", mock_calls)
 
@@ -116,3 +146,91 @@ def mock_wishlist_items_list():
             "asin": "2",
         },
     ]
+
+
+@pytest.fixture()
+def wishlist_page_response():
+    """A `requests.Response` of a wishlist page with a "see more" link."""
+    with open(Path(TESTS_FOLDER, "wishlist_page.html"), "rb") as f:
+        content = f.read()
+
+    response = requests.Response()
+    response.status_code = 200
+    response.url = "https://www.amazon.co.uk/hz/wishlist/ls/T3STL1ST"
+    response.encoding = "utf-8"
+    response._content = content
+    return response
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for `smtplib` to log in and send mail."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost SMTP stub")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN")
+            elif command.startswith("AUTH"):
+                self.reply("235 Authentication successful")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for data_line in iter(self.rfile.readline, b".\r\n"):
+                    data.append(data_line)
+                self.server.messages.append(b"".join(data).decode())
+                self.reply("250 OK")
+                if self.server.hang_up:
+                    return
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """A local stand-in SMTP server, recording messages and connections."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPStubHandler)
+        self.messages = []
+        self.connections = 0
+        # Close the connection after each message, as an idle server might.
+        self.hang_up = False
+
+
+@pytest.fixture()
+def smtp_server():
+    """A running `SMTPStub`."""
+    server = SMTPStub()
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def email_config(smtp_server):
+    """The `email` section of `config.json` for sending to `smtp_server`."""
+    return {
+        "smtp_server": "127.0.0.1",
+        "smtp_port": str(smtp_server.server_address[1]),
+        "smtp_security": "none",
+        "sending_email": "pricewatch@example.com",
+        "sending_email_pass": "password",
+        "receiving_emails": ["person1@example.com", "person2@example.com"],
+    }
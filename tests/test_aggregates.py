@@ -0,0 +1,65 @@
+import json
+
+from amazon_wishlist_pricewatch import aggregates
+from amazon_wishlist_pricewatch.aggregates import PriceStats, Window, WindowColumns
+from amazon_wishlist_pricewatch.prices import OUT_OF_STOCK
+
+DAY = 24 * 60 * 60
+# Start of a bucket, so windows in the tests cover whole buckets.
+START = aggregates.bucket_of(1_700_000_000) * aggregates.BUCKET_DAYS * DAY
+
+
+def test_window(tmp_path):
+    stats = PriceStats(tmp_path / "price_stats.json")
+    assert stats.window("A", 30, START) is None
+    stats.observe("A", 1000, START)
+    stats.observe("A", 800, START + DAY)
+    stats.observe("A", 900, START + 40 * DAY)
+    stats.observe("A", OUT_OF_STOCK, START + 41 * DAY)
+
+    assert stats.window("A", 30, START + 41 * DAY) == Window(
+        900, 900.0, 1, START + 41 * DAY, OUT_OF_STOCK
+    )
+    assert stats.window("A", 90, START + 41 * DAY) == Window(
+        800, 900.0, 3, START + 41 * DAY, OUT_OF_STOCK
+    )
+    # Windows are rounded up to whole buckets.
+    stats.observe_many([("B", 1000), ("B", 800)], START)
+    assert stats.window("B", 1, START + 2 * DAY).count == 2
+    assert stats.window("B", 1, START + 3 * DAY).count == 0
+
+
+def test_observe_drops_expired_buckets(tmp_path):
+    stats = PriceStats(tmp_path / "price_stats.json")
+    for day in range(0, 200, 2):
+        stats.observe("A", 1000 + day, START + day * DAY)
+    buckets = stats.items["A"][2]
+    assert len(buckets) == aggregates.MAX_WINDOW_DAYS // aggregates.BUCKET_DAYS
+    window = stats.window("A", 90, START + 198 * DAY)
+    assert window.low == 1112 and window.count == 44
+
+
+def test_columns(tmp_path):
+    stats = PriceStats(tmp_path / "price_stats.json")
+    stats.observe_many([("A", 1000), ("B", OUT_OF_STOCK)], START)
+    assert stats.columns(["A", "B", "C"], 30, START) == WindowColumns(
+        [1000, 0, 0], [1000.0, 0.0, 0.0], [1000, OUT_OF_STOCK, OUT_OF_STOCK]
+    )
+
+
+def test_save(tmp_path):
+    stats_path = tmp_path / "price_stats.json"
+    stats = PriceStats(stats_path)
+    stats.save()
+    assert not stats_path.exists()
+
+    stats.observe_many([("A", 1000), ("B", 500)], START)
+    stats.observe("A", 900, START + 95 * DAY)
+    stats.save(now=START + 95 * DAY)
+    # Items not seen within the longest window are dropped.
+    assert list(json.loads(stats_path.read_text())) == ["A"]
+    loaded = PriceStats(stats_path)
+    assert loaded.window("A", 30, START + 95 * DAY) == Window(
+        900, 900.0, 1, START + 95 * DAY, 900
+    )
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,151 @@
+import sys
+
+import pytest
+
+from amazon_wishlist_pricewatch import alerts
+from amazon_wishlist_pricewatch.aggregates import WindowColumns
+from amazon_wishlist_pricewatch.prices import OUT_OF_STOCK
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def numpy_installed(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+    return request.param
+
+
+def evaluate(rule_configs, old, new, asins=None, urls=None):
+    asins = asins or [str(i) for i in range(len(old))]
+    return alerts.RuleSet(rule_configs).evaluate(asins, old, new, urls)
+
+
+@pytest.mark.parametrize(
+    "rule, expected",
+    [
+        ({"type": "new_low"}, [0, 1, 2, 3]),
+        ({"type": "percent_drop", "percent": 20}, [0, 1]),
+        ({"type": "percent_drop", "percent": "10"}, [0, 1, 3]),
+        ({"type": "target_price", "price": "8.00"}, [0, 1]),
+        ({"type": "min_drop", "amount": "1.50"}, [0, 1, 3]),
+        ({"type": "back_in_stock"}, [2]),
+    ],
+)
+def test_rule_types(rule, expected, numpy_installed):
+    old = [1000, 1000, OUT_OF_STOCK, 1000, 700, 500, OUT_OF_STOCK]
+    new = [800, 750, 2000, 850, 700, 600, OUT_OF_STOCK]
+    fired = evaluate([rule], old, new)
+    assert [i for i, _ in fired] == expected
+    assert {name for _, name in fired} <= {f"{rule['type']}:0"}
+
+
+def test_default_rule_is_new_low(numpy_installed):
+    assert alerts.RuleSet().evaluate(["a", "b"], [700, 700], [600, 800]) == [
+        (0, "new_low:0")
+    ]
+    assert alerts.RuleSet.from_config({"general": {}}).rules == alerts.RuleSet().rules
+    assert alerts.RuleSet().evaluate([], [], []) == []
+
+
+def test_first_rule_to_fire_is_reported(numpy_installed):
+    rules = [
+        {"name": "target", "type": "target_price", "price": "5", "asins": ["b"]},
+        {"name": "drop", "type": "percent_drop", "percent": 50},
+        {"name": "low", "type": "new_low"},
+    ]
+    fired = evaluate(rules, [1000, 1000, 1000, 900], [400, 400, 900, 900], "abcd")
+    assert fired == [(0, "drop"), (1, "target"), (2, "low")]
+
+
+def test_rules_limited_to_wishlists(numpy_installed):
+    rules = [
+        {
+            "name": "first",
+            "type": "new_low",
+            "wishlists": ["https://www.amazon.co.uk/hz/wishlist/ls/F1RSTL1ST"],
+        },
+        {"name": "second", "type": "min_drop", "amount": 5, "wishlists": ["S3C0ND"]},
+    ]
+    urls = [
+        "/dp/B1/?coliid=I1&colid=F1RSTL1ST&psc=1",
+        "/dp/B2/?coliid=I2&amp;colid=S3C0ND&amp;psc=1",
+        "/dp/B3/?coliid=I3&colid=S3C0ND",
+        "/dp/B4/",
+    ]
+    fired = evaluate(rules, [900] * 4, [800, 200, 800, 100], urls=urls)
+    assert fired == [(0, "first"), (1, "second")]
+
+    with pytest.raises(ValueError):
+        evaluate(rules, [900], [800])
+
+
+@pytest.mark.parametrize(
+    "rule, expected",
+    [
+        ({"type": "window_low"}, [0, 1, 3]),
+        ({"type": "below_average", "percent": 20}, [0, 1]),
+        ({"type": "below_average", "percent": 20, "days": 7}, [1]),
+    ],
+)
+def test_window_rules(rule, expected, numpy_installed):
+    old = [500, 500, 500, 500, 500, 500]
+    new = [800, 750, 900, 850, 700, 600]
+    # Aggregates of each item over 30 (the default for window_low), 90 (for
+    # below_average) and 7 days. Item 2 has fallen, but not below the low of
+    # the window, item 4 is the same as last seen and item 5 was never seen.
+    windows = {
+        30: WindowColumns(
+            [900, 900, 850, 900, 800, 0],
+            [1000.0, 1000.0, 1000.0, 1000.0, 1000.0, 0.0],
+            [1000, 1000, 1000, 900, 700, OUT_OF_STOCK],
+        ),
+        90: WindowColumns(
+            [900, 900, 850, 900, 800, 0],
+            [1000.0, 1000.0, 1000.0, 1000.0, 1000.0, 0.0],
+            [1000, 1000, 1000, 900, 700, OUT_OF_STOCK],
+        ),
+        7: WindowColumns(
+            [900] * 6,
+            [990.0, 1000.0, 1000.0, 1000.0, 1000.0, 0.0],
+            [1000, 1000, 1000, 900, 700, OUT_OF_STOCK],
+        ),
+    }
+    rule_set = alerts.RuleSet([rule])
+    fired = rule_set.evaluate([str(i) for i in range(6)], old, new, windows=windows)
+    assert [i for i, _ in fired] == expected
+
+    with pytest.raises(ValueError):
+        rule_set.evaluate(["0"], [500], [400])
+
+
+def test_window_days():
+    rule_set = alerts.RuleSet(
+        [
+            {"type": "new_low"},
+            {"type": "window_low", "days": 90},
+            {"type": "below_average", "percent": 10},
+            {"type": "window_low", "days": 7},
+        ]
+    )
+    assert rule_set.window_days == (7, 90)
+    assert [rule.days for rule in rule_set.rules] == [0, 90, 90, 7]
+    assert alerts.RuleSet().window_days == ()
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"type": "lower"},
+        {"type": "percent_drop"},
+        {"type": "percent_drop", "percent": 0},
+        {"type": "percent_drop", "percent": 101},
+        {"type": "target_price", "price": "£5"},
+        {"type": "below_average"},
+        {"type": "window_low", "days": 0},
+        {"type": "window_low", "days": 91},
+    ],
+)
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        alerts.RuleSet([rule])
@@ -0,0 +1,82 @@
+import os
+import signal
+import time
+
+import pytest
+
+from amazon_wishlist_pricewatch.daemon import Daemon
+
+
+class TestDaemon:
+    """Tests for daemon.Daemon."""
+
+    def test_runs_passes_until_stopped(self):
+        passes = []
+
+        def run_pass():
+            passes.append(len(passes))
+            if len(passes) == 3:
+                daemon.stop()
+
+        daemon = Daemon(run_pass, interval=0.001)
+        daemon.run()
+        assert passes == [0, 1, 2]
+
+    def test_interval_from_start_of_pass(self, monkeypatch):
+        clock = [0.0]
+        monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+        passes = []
+
+        def run_pass():
+            passes.append(clock[0])
+            # Each pass takes 40 seconds.
+            clock[0] += 40
+            if len(passes) == 2:
+                daemon.stop()
+
+        daemon = Daemon(run_pass, interval=100, jitter=0)
+        monkeypatch.setattr(
+            daemon.stopping,
+            "wait",
+            lambda delay: clock.__setitem__(0, clock[0] + delay),
+        )
+        daemon.run()
+        assert passes == [0, 100]
+
+    def test_failed_pass_does_not_stop(self):
+        passes = []
+
+        def run_pass():
+            passes.append(len(passes))
+            if len(passes) == 1:
+                raise ConnectionError("Failed to request wishlist page.")
+            daemon.stop()
+
+        daemon = Daemon(run_pass, interval=0.001)
+        daemon.run()
+        assert passes == [0, 1]
+
+    def test_sigterm_stops_after_pass(self):
+        passes = []
+
+        def run_pass():
+            os.kill(os.getpid(), signal.SIGTERM)
+            passes.append(len(passes))
+
+        handler = signal.getsignal(signal.SIGTERM)
+        Daemon(run_pass, interval=60).run()
+        # The pass in progress finished, and no more were started.
+        assert passes == [0]
+        assert signal.getsignal(signal.SIGTERM) == handler
+
+    def test_next_delay_jittered(self):
+        daemon = Daemon(lambda: None, interval=100, jitter=0.1)
+        delays = {daemon.next_delay() for _ in range(100)}
+        assert all(90 <= delay <= 110 for delay in delays)
+        assert len(delays) > 1
+
+    def test_invalid_interval(self):
+        with pytest.raises(ValueError):
+            Daemon(lambda: None, interval=0)
+        with pytest.raises(ValueError):
+            Daemon(lambda: None, interval=1, jitter=1)
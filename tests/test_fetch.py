@@ -0,0 +1,316 @@
+import threading
+import time
+
+import pytest
+
+from amazon_wishlist_pricewatch import fetch
+from amazon_wishlist_pricewatch.fetch import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FetchEngine,
+    RetryLater,
+    TokenBucket,
+)
+
+
+class FakeResponse:
+    def __init__(self, url, status_code=200, content=b"", headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class TestTokenBucket:
+    """Tests for fetch.TokenBucket."""
+
+    def test_burst_then_queue(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        # Callers beyond the burst queue up behind each other.
+        assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+        assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+    def test_refills_over_time(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        bucket.reserve()
+        time.sleep(0.02)
+        assert bucket.reserve() == 0
+
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+    def test_slow_down_and_speed_up(self):
+        bucket = TokenBucket(rate=16)
+        bucket.slow_down()
+        assert bucket.rate == 8
+        for _ in range(10):
+            bucket.slow_down()
+        assert bucket.rate == 16 * fetch.MIN_RATE_FRACTION
+        for _ in range(100):
+            bucket.speed_up()
+        assert bucket.rate == bucket.max_rate == 16
+
+
+class TestCircuitBreaker:
+    """Tests for fetch.CircuitBreaker."""
+
+    def test_opens_after_failures(self):
+        breaker = CircuitBreaker(failures=3, reset_seconds=60)
+        for _ in range(2):
+            breaker.record_failure()
+            breaker.check("https://www.amazon.co.uk/")
+        breaker.record_success()
+        for _ in range(3):
+            breaker.check("https://www.amazon.co.uk/")
+            breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.check("https://www.amazon.co.uk/")
+
+    def test_half_open_after_reset(self):
+        breaker = CircuitBreaker(failures=2, reset_seconds=0.02)
+        breaker.record_failure()
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.check("https://www.amazon.co.uk/")
+        time.sleep(0.03)
+        # One request is let through. It failing opens the breaker again.
+        breaker.check("https://www.amazon.co.uk/")
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.check("https://www.amazon.co.uk/")
+        time.sleep(0.03)
+        breaker.check("https://www.amazon.co.uk/")
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.check("https://www.amazon.co.uk/")
+
+
+class TestThrottling:
+    """Tests for fetch.throttle_reason, fetch.retry_after and fetch.retry_delay."""
+
+    def test_throttle_reason(self, wishlist_page_response):
+        assert fetch.throttle_reason(wishlist_page_response) is None
+        assert fetch.throttle_reason(FakeResponse("/", 503)) == "HTTP 503"
+        assert fetch.throttle_reason(FakeResponse("/", 429)) == "HTTP 429"
+        captcha = (
+            b"<html><title>Robot Check</title><form"
+            b' action="/errors/validateCaptcha"></form></html>'
+        )
+        assert fetch.throttle_reason(FakeResponse("/", 200, captcha)) == "captcha"
+        assert fetch.throttle_reason(FakeResponse("/", 304)) is None
+
+    def test_accept_encoding(self, monkeypatch):
+        import importlib.util
+
+        monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+        assert fetch.accept_encoding() == "gzip, deflate"
+        monkeypatch.setattr(
+            importlib.util, "find_spec", lambda name: name == "brotlicffi" or None
+        )
+        assert fetch.accept_encoding() == "gzip, deflate, br"
+
+    def test_retry_after(self):
+        assert fetch.retry_after(FakeResponse("/", headers={"Retry-After": "30"})) == 30
+        assert fetch.retry_after(FakeResponse("/")) is None
+        date = {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        assert fetch.retry_after(FakeResponse("/", headers=date)) is None
+
+    def test_retry_delay(self):
+        for attempt in range(1, 5):
+            assert 0 <= fetch.retry_delay(attempt, 1.0) <= 2 ** (attempt - 1)
+        assert fetch.retry_delay(20, 1.0) <= fetch.MAX_RETRY_SECONDS
+        assert fetch.retry_delay(1, 1.0, retry_after=30) >= 30
+
+
+class TestFetchEngine:
+    """Tests for fetch.FetchEngine."""
+
+    @staticmethod
+    def paginated_site(pages_per_wishlist):
+        """Fake fetch/parse callables for wishlists of several pages each."""
+        fetched = []
+        lock = threading.Lock()
+        in_flight = [0, 0]  # Current, max.
+
+        def fetch_page(url):
+            with lock:
+                fetched.append((time.monotonic(), url))
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return FakeResponse(url)
+
+        def next_page_url(response):
+            base, _, page = response.url.partition("?page=")
+            page = int(page or 1)
+            if page < pages_per_wishlist:
+                return f"{base}?page={page + 1}"
+            return None
+
+        def parse_page(response):
+            with lock:
+                parsed.append(response.url)
+
+        parsed = []
+        return fetch_page, parse_page, next_page_url, fetched, parsed, in_flight
+
+    def test_crawls_every_page(self):
+        site = self.paginated_site(3)
+        fetch_page, parse_page, next_page_url, fetched, parsed, _ = site
+        urls = [f"https://www.amazon.co.uk/ls/{i}" for i in range(3)]
+        engine = FetchEngine(
+            fetch_page, parse_page, next_page_url, requests_per_second=1000
+        )
+        engine.run(urls + urls[:1])
+
+        # Each page of each wishlist fetched and parsed exactly once.
+        expected = sorted(
+            urls + [f"{url}?page={page}" for url in urls for page in (2, 3)]
+        )
+        assert sorted(url for _, url in fetched) == expected
+        assert sorted(parsed) == expected
+
+    def test_prefetches_while_parsing(self):
+        events = []
+
+        def fetch_page(url):
+            events.append(f"fetched {url}")
+            return FakeResponse(url)
+
+        def parse_page(response):
+            time.sleep(0.05)
+            events.append(f"parsed {response.url}")
+
+        def next_page_url(response):
+            return "https://example.com/2" if response.url.endswith("1") else None
+
+        engine = FetchEngine(
+            fetch_page, parse_page, next_page_url, requests_per_second=1000
+        )
+        engine.run(["https://example.com/1"])
+
+        assert events == [
+            "fetched https://example.com/1",
+            "fetched https://example.com/2",
+            "parsed https://example.com/1",
+            "parsed https://example.com/2",
+        ]
+
+    def test_parse_concurrency(self):
+        fetch_page, _, next_page_url, _, parsed, _ = self.paginated_site(6)
+        lock = threading.Lock()
+        parsing = [0, 0]  # Current, max.
+
+        def parse_page(response):
+            with lock:
+                parsing[0] += 1
+                parsing[1] = max(parsing)
+            time.sleep(0.05)
+            with lock:
+                parsing[0] -= 1
+                parsed.append(response.url)
+
+        engine = FetchEngine(
+            fetch_page,
+            parse_page,
+            next_page_url,
+            requests_per_second=1000,
+            parse_concurrency=3,
+        )
+        engine.run(["https://www.amazon.co.uk/ls/1"])
+
+        # Pages of a single wishlist are parsed side by side.
+        assert len(parsed) == 6
+        assert parsing[1] == 3
+        with pytest.raises(ValueError):
+            FetchEngine(fetch_page, parse_page, next_page_url, parse_concurrency=0)
+
+    def test_max_concurrency(self):
+        fetch_page, parse_page, next_page_url, _, _, in_flight = self.paginated_site(2)
+        urls = [f"https://example{i}.com/ls/1" for i in range(8)]
+        engine = FetchEngine(
+            fetch_page,
+            parse_page,
+            next_page_url,
+            max_concurrency=2,
+            requests_per_second=1000,
+        )
+        engine.run(urls)
+        assert in_flight[1] == 2
+
+    def test_rate_limited_per_domain(self):
+        fetch_page, parse_page, next_page_url, fetched, _, _ = self.paginated_site(3)
+        urls = ["https://a.example.com/ls/1", "https://b.example.com/ls/1"]
+        engine = FetchEngine(
+            fetch_page, parse_page, next_page_url, requests_per_second=20
+        )
+        start = time.monotonic()
+        engine.run(urls)
+        elapsed = time.monotonic() - start
+
+        for domain in ("a.example.com", "b.example.com"):
+            times = [t for t, url in fetched if domain in url]
+            gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+            assert len(times) == 3
+            assert min(gaps) >= 0.04
+        # Domains are crawled side by side rather than one after another.
+        assert elapsed < 0.2
+
+    def test_retry_without_holding_slot(self):
+        fetch_page, parse_page, next_page_url, fetched, _, _ = self.paginated_site(3)
+        attempts = []
+
+        def retried_fetch_page(url, attempt=1):
+            if url == "https://a.example.com/ls/1":
+                attempts.append(attempt)
+                if attempt == 1:
+                    raise RetryLater(url, attempt, 0.2)
+            return fetch_page(url)
+
+        engine = FetchEngine(
+            retried_fetch_page,
+            parse_page,
+            next_page_url,
+            max_concurrency=1,
+            requests_per_second=1000,
+        )
+        engine.run(["https://a.example.com/ls/1", "https://b.example.com/ls/1"])
+
+        assert attempts == [1, 2]
+        # The other domain is crawled while the retry waits.
+        domains = [url.split("/")[2] for _, url in fetched]
+        assert domains[:3] == ["b.example.com"] * 3
+
+    def test_exception_propagates(self):
+        def fetch_page(url):
+            raise ConnectionError(url)
+
+        engine = FetchEngine(fetch_page, lambda response: None, lambda response: None)
+        with pytest.raises(ConnectionError):
+            engine.run(["https://www.amazon.co.uk/ls/1"])
+
+    def test_return_exceptions(self):
+        fetch_page, parse_page, next_page_url, _, parsed, _ = self.paginated_site(3)
+
+        def failing_fetch_page(url):
+            if url == "https://a.example.com/ls/1?page=3":
+                raise ConnectionError(url)
+            return fetch_page(url)
+
+        engine = FetchEngine(
+            failing_fetch_page, parse_page, next_page_url, requests_per_second=1e9
+        )
+        failures = engine.run(
+            ["https://a.example.com/ls/1", "https://b.example.com/ls/1"],
+            return_exceptions=True,
+        )
+
+        assert list(failures) == ["https://a.example.com/ls/1"]
+        assert isinstance(failures["https://a.example.com/ls/1"], ConnectionError)
+        # Pages parsed before the failure, and the other wishlist, are kept.
+        assert len(parsed) == 5
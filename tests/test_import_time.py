@@ -0,0 +1,61 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+# Generous, as CI machines vary. Importing requests and bs4 alone takes longer.
+IMPORT_TIME_BUDGET_US = 100_000
+# Only needed once pages are requested/parsed, data saved or alerts sent.
+DEFERRED_MODULES = (
+    "asyncio",
+    "bs4",
+    "lxml",
+    "numpy",
+    "requests",
+    "smtplib",
+    "sqlite3",
+    "ssl",
+    "telegram",
+)
+
+
+def import_times(*args: str) -> Dict[str, int]:
+    """Run python with ``args`` under `-X importtime` and return the self import
+    time, in microseconds, of each module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, module = line[len("import time:") :].split("|")
+        if self_us.strip().isdigit():
+            times[module.strip()] = int(self_us)
+    return times
+
+
+class TestImportTime:
+    """Tests the command line starts without importing more than it needs."""
+
+    cli = ("-m", "amazon_wishlist_pricewatch.pricewatch", "--help")
+
+    def test_deferred_modules_not_imported(self):
+        imported = import_times(*self.cli)
+        assert imported
+        for module in DEFERRED_MODULES:
+            assert module not in imported
+
+    def test_within_budget(self):
+        interpreter = import_times("-c", "pass")
+        added = sum(
+            us
+            for module, us in import_times(*self.cli).items()
+            if module not in interpreter
+        )
+        assert added < IMPORT_TIME_BUDGET_US
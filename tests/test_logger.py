@@ -0,0 +1,74 @@
+import json
+import logging
+import subprocess
+import sys
+
+import pytest
+
+from amazon_wishlist_pricewatch import logger as pricewatch_logger
+from amazon_wishlist_pricewatch.logger import fields, logger, sample
+
+
+@pytest.fixture()
+def log_file(tmp_path, monkeypatch):
+    # Logging may have been set up by an earlier test running `main`.
+    pricewatch_logger.stop_logging()
+    logging.disable(logging.NOTSET)
+    log_path = tmp_path / "pricewatch.log"
+    monkeypatch.setattr(pricewatch_logger, "LOG_PATH", log_path)
+    yield log_path
+    pricewatch_logger.stop_logging()
+
+
+def test_no_handlers_on_import():
+    code = (
+        "import logging, amazon_wishlist_pricewatch.pricewatch;"
+        " print(len(logging.getLogger().handlers))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "0"
+
+
+def test_sample():
+    assert sample([]) == ""
+    assert sample(["a", "b"]) == "a, b"
+    assert sample([str(i) for i in range(8)], limit=3) == "0, 1, 2 and 5 more"
+
+
+def test_json_logs(log_file):
+    handlers = len(logger.handlers)
+    pricewatch_logger.setup_logging(json_logs=True)
+    pricewatch_logger.setup_logging(json_logs=True)
+    assert len(logger.handlers) == handlers + 1
+    logger.info(
+        "Parsed %d item(s).", 3, extra=fields(page="https://p/1", stage="parse_page")
+    )
+    try:
+        raise ValueError("bad price")
+    except ValueError:
+        logger.exception("Failed.")
+    pricewatch_logger.stop_logging()
+
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert records[0]["message"] == "Parsed 3 item(s)."
+    assert records[0]["level"] == "INFO"
+    assert records[0]["page"] == "https://p/1"
+    assert records[0]["stage"] == "parse_page"
+    assert "wishlist" not in records[0]
+    assert records[1]["message"] == "Failed."
+    assert "ValueError: bad price" in records[1]["exception"]
+
+
+def test_plain_logs_written_on_stop(log_file):
+    pricewatch_logger.setup_logging()
+    handlers = len(logger.handlers)
+    for i in range(100):
+        logger.info(f"Record {i}.")
+    pricewatch_logger.stop_logging()
+
+    lines = log_file.read_text().splitlines()
+    assert len(lines) == 100
+    assert lines[-1].endswith("INFO - Record 99.")
+    assert len(logger.handlers) == handlers - 1
@@ -0,0 +1,82 @@
+import json
+import re
+import time
+
+import pytest
+
+from amazon_wishlist_pricewatch.metrics import COUNTERS, Metrics
+
+
+class TestMetrics:
+    """Tests for metrics.Metrics."""
+
+    def test_spans_accumulate(self):
+        metrics = Metrics()
+        for _ in range(2):
+            with metrics.span("parse_page"):
+                time.sleep(0.01)
+        with pytest.raises(KeyError):
+            with metrics.span("request_page"):
+                raise KeyError
+
+        assert metrics.stage_calls == {"parse_page": 2, "request_page": 1}
+        assert metrics.stages["parse_page"] >= 0.02
+
+    def test_counts(self):
+        metrics = Metrics()
+        metrics.count("pages")
+        metrics.count("bytes_downloaded", 1024)
+        metrics.count("bytes_downloaded", 1024)
+
+        assert metrics.counters["pages"] == 1
+        assert metrics.counters["bytes_downloaded"] == 2048
+        assert set(metrics.counters) == set(COUNTERS)
+        with pytest.raises(KeyError):
+            metrics.count("unknown")
+
+    def test_report(self):
+        metrics = Metrics()
+        with metrics.span("compare_prices"):
+            pass
+        metrics.count("alerts_sent", 2)
+        metrics.finish()
+        report = metrics.report()
+
+        assert report["finished_at"] >= report["started_at"]
+        assert report["duration_seconds"] == metrics.duration
+        assert report["stages"]["compare_prices"]["calls"] == 1
+        assert report["counters"]["alerts_sent"] == 2
+        json.dumps(report)
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        with metrics.span("parse_page"):
+            pass
+        metrics.count("pages", 3)
+        metrics.finish()
+        text = metrics.prometheus()
+
+        assert "pricewatch_last_run_pages 3\n" in text
+        assert re.search(
+            r'^pricewatch_last_run_stage_seconds\{stage="parse_page"\} [\d.e-]+$',
+            text,
+            re.MULTILINE,
+        )
+        # Every sample is preceded by its HELP and TYPE.
+        for name in re.findall(r"^(\w+)(?:\{[^}]*\})? \S+$", text, re.MULTILINE):
+            assert f"# TYPE {name} gauge" in text
+
+    def test_write(self, tmp_path):
+        metrics = Metrics()
+        metrics.finish()
+        metrics.write_json(tmp_path / "run_report.json")
+        metrics.write_prometheus(tmp_path / "pricewatch.prom")
+
+        assert json.loads((tmp_path / "run_report.json").read_text()) == (
+            metrics.report()
+        )
+        assert (tmp_path / "pricewatch.prom").read_text() == metrics.prometheus()
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "pricewatch.prom",
+            "run_report.json",
+        ]
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+
+from amazon_wishlist_pricewatch.outbox import Dispatcher, Outbox
+
+
+class RecordingChannel:
+    """A channel recording the text of each message sent, failing the first
+    ``failures`` sends and waiting for ``release`` if given.
+    """
+
+    def __init__(self, failures=0, release=None):
+        self.sent = []
+        self.attempts = 0
+        self.failures = failures
+        self.release = release
+        self.closed = False
+
+    def send(self, text, html):
+        self.attempts += 1
+        if self.release is not None:
+            self.release.wait()
+        if self.attempts <= self.failures:
+            raise ConnectionError("Send failed.")
+        self.sent.append(text)
+
+    def close(self):
+        self.closed = True
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        time.sleep(0.005)
+
+
+class TestOutbox:
+    """Tests for outbox.Outbox."""
+
+    def test_messages_survive_restart(self, tmp_path):
+        outbox = Outbox(tmp_path)
+        message_id = outbox.put("text", "<p>html</p>", ["email", "telegram"])
+
+        reloaded = Outbox(tmp_path)
+        assert reloaded.due("email") == [message_id]
+        assert reloaded.messages[message_id]["html"] == "<p>html</p>"
+        assert reloaded.channels() == ["email", "telegram"]
+
+    def test_removed_once_sent_to_every_channel(self, tmp_path):
+        outbox = Outbox(tmp_path)
+        message_id = outbox.put("text", "html", ["email", "telegram"])
+
+        outbox.discard(message_id, "email")
+        assert Outbox(tmp_path).channels() == ["telegram"]
+        outbox.discard(message_id, "telegram")
+        assert not list(tmp_path.iterdir())
+        assert not outbox.messages
+
+    def test_failed_messages_not_due_until_retry(self, tmp_path):
+        outbox = Outbox(tmp_path)
+        first = outbox.put("first", "html", ["email"])
+        second = outbox.put("second", "html", ["email"])
+
+        assert outbox.failed(first, "email", retry_at=time.time() + 60) == 1
+        assert outbox.due("email") == [second]
+        assert outbox.due("email", now=time.time() + 61) == [first, second]
+        assert Outbox(tmp_path).messages[first]["channels"]["email"]["attempts"] == 1
+
+
+class TestDispatcher:
+    """Tests for outbox.Dispatcher."""
+
+    def test_sends_to_every_channel(self, tmp_path):
+        channels = {"email": RecordingChannel(), "telegram": RecordingChannel()}
+        dispatcher = Dispatcher(Outbox(tmp_path), channels)
+        dispatcher.start()
+        dispatcher.send("first", "html", ["email", "telegram"])
+        dispatcher.send("second", "html", ["telegram"])
+        dispatcher.stop(timeout=5)
+
+        assert channels["email"].sent == ["first"]
+        assert channels["telegram"].sent == ["first", "second"]
+        assert channels["email"].closed and channels["telegram"].closed
+        assert not dispatcher.outbox.messages
+
+    def test_slow_channel_blocks_nothing(self, tmp_path):
+        release = threading.Event()
+        channels = {
+            "email": RecordingChannel(release=release),
+            "telegram": RecordingChannel(),
+        }
+        dispatcher = Dispatcher(Outbox(tmp_path), channels)
+        dispatcher.start()
+        dispatcher.send("alert", "html", ["email", "telegram"])
+
+        # Sending returned, and telegram was sent while email is stuck.
+        wait_for(lambda: channels["telegram"].sent == ["alert"])
+        assert channels["email"].sent == []
+        release.set()
+        dispatcher.stop(timeout=5)
+        assert channels["email"].sent == ["alert"]
+
+    def test_retries_with_backoff(self, tmp_path):
+        channel = RecordingChannel(failures=2)
+        dispatcher = Dispatcher(
+            Outbox(tmp_path), {"email": channel}, max_attempts=3, retry_seconds=0.01
+        )
+        assert dispatcher.retry_delay(1) < dispatcher.retry_delay(3)
+        dispatcher.start()
+        dispatcher.send("alert", "html", ["email"])
+
+        wait_for(lambda: channel.sent == ["alert"])
+        assert channel.attempts == 3
+        dispatcher.stop(timeout=5)
+
+    def test_gives_up_after_max_attempts(self, tmp_path):
+        channel = RecordingChannel(failures=10)
+        dispatcher = Dispatcher(
+            Outbox(tmp_path), {"email": channel}, max_attempts=2, retry_seconds=0.01
+        )
+        dispatcher.start()
+        dispatcher.send("alert", "html", ["email"])
+
+        wait_for(lambda: not dispatcher.outbox.messages)
+        assert channel.attempts == 2
+        dispatcher.stop(timeout=5)
+
+    def test_unsent_left_for_next_run(self, tmp_path):
+        failing = RecordingChannel(failures=1)
+        dispatcher = Dispatcher(Outbox(tmp_path), {"email": failing})
+        dispatcher.start()
+        dispatcher.send("alert", "html", ["email"])
+        wait_for(lambda: failing.attempts == 1)
+        # The retry is far off, so stopping doesn't wait for it.
+        dispatcher.stop(timeout=5)
+        assert failing.sent == []
+
+        channel = RecordingChannel()
+        outbox = Outbox(tmp_path)
+        for message_id in outbox.messages:
+            outbox.failed(message_id, "email", retry_at=0.0)
+        dispatcher = Dispatcher(outbox, {"email": channel})
+        dispatcher.start()
+        dispatcher.stop(timeout=5)
+        assert channel.sent == ["alert"]
+        assert not list(tmp_path.iterdir())
+
+    def test_invalid_max_attempts(self, tmp_path):
+        with pytest.raises(ValueError):
+            Dispatcher(Outbox(tmp_path), {}, max_attempts=0)
@@ -0,0 +1,144 @@
+import io
+import json
+
+import pytest
+
+from amazon_wishlist_pricewatch import parsers
+from amazon_wishlist_pricewatch.my_types import ParsedItem
+from amazon_wishlist_pricewatch.page_cache import PageCache, digest
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch
+
+URL = "https://www.amazon.co.uk/hz/wishlist/ls/T3STL1ST"
+ITEMS = [ParsedItem("Test title", None, "7.0", "/example/path", "1")]
+
+
+@pytest.fixture()
+def cache(tmp_path):
+    return PageCache(tmp_path / "page_cache.json")
+
+
+class TestPageCache:
+    """Tests for page_cache.PageCache."""
+
+    def test_conditional_headers(self, cache):
+        assert cache.conditional_headers(URL) == {}
+        cache.store(
+            URL,
+            {"ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+            digest(""),
+            ITEMS,
+            None,
+        )
+        assert cache.conditional_headers(URL) == {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT",
+        }
+
+    def test_get_items_by_digest(self, cache):
+        assert cache.get_items(URL) is None
+        cache.store(URL, {}, digest("<li>"), ITEMS, "https://next")
+        assert cache.get_items(URL, digest("<li>")) == ITEMS
+        assert cache.get_items(URL, digest("<li>changed")) is None
+        assert cache.get_next_url(URL) == "https://next"
+
+    def test_save_only_visited(self, cache):
+        cache.store(URL, {}, digest(""), ITEMS, None)
+        cache.save()
+        with open(cache.cache_path) as f:
+            assert list(json.load(f)) == [URL]
+
+        # Not visited on the next run.
+        reloaded = PageCache(cache.cache_path)
+        assert reloaded.get_items(URL) == ITEMS
+        reloaded.visited.clear()
+        reloaded.save()
+        assert PageCache(cache.cache_path).pages == {}
+
+
+class TestPriceWatchPageCache:
+    """Tests for pricewatch.PriceWatch use of page_cache.PageCache."""
+
+    def test_unchanged_page_not_parsed(
+        self, mock_config, cache, wishlist_page_response, monkeypatch
+    ):
+        pw = PriceWatch()
+        pw.page_cache = cache
+        wishlist_page_response.headers["ETag"] = '"v1"'
+        pw.parse_page(wishlist_page_response)
+        parsed = dict(pw.wishlist.wishlist_dict)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Unchanged page was parsed.")
+
+        monkeypatch.setattr(parsers, "parse_items", fail)
+
+        # Identical items, with changes to the rest of the page.
+        wishlist_page_response._content = wishlist_page_response.content.replace(
+            b"Help", b"Customer Service"
+        )
+        pw.wishlist = type(pw.wishlist)()
+        pw.parse_page(wishlist_page_response)
+        assert pw.wishlist.wishlist_dict == parsed
+
+        # Not modified since the cached version, so no body.
+        not_modified = type(wishlist_page_response)()
+        not_modified.status_code = 304
+        not_modified.url = wishlist_page_response.url
+        not_modified._content = b""
+        pw.wishlist = type(pw.wishlist)()
+        pw.parse_page(not_modified)
+        assert pw.wishlist.wishlist_dict == parsed
+        assert pw.next_page_url(not_modified) == pw.next_page_url(
+            wishlist_page_response
+        )
+        assert pw.page_cache.conditional_headers(not_modified.url) == {
+            "If-None-Match": '"v1"'
+        }
+
+    def test_redirected_page_cached_by_requested_url(
+        self, mock_config, cache, wishlist_page_response
+    ):
+        pw = PriceWatch()
+        pw.page_cache = cache
+        redirect = type(wishlist_page_response)()
+        redirect.status_code = 301
+        redirect.url = URL
+        wishlist_page_response.url = URL + "?ref_=redirected"
+        wishlist_page_response.history = [redirect]
+        wishlist_page_response.headers["ETag"] = '"v1"'
+        pw.parse_page(wishlist_page_response)
+        parsed = dict(pw.wishlist.wishlist_dict)
+        assert pw.page_cache.conditional_headers(URL) == {"If-None-Match": '"v1"'}
+
+        # The conditional request is redirected in turn.
+        not_modified = type(wishlist_page_response)()
+        not_modified.status_code = 304
+        not_modified.url = wishlist_page_response.url
+        not_modified.history = [redirect]
+        not_modified._content = b""
+        pw.wishlist = type(pw.wishlist)()
+        pw.parse_page(not_modified)
+        assert pw.wishlist.wishlist_dict == parsed
+        assert pw.next_page_url(not_modified) == pw.next_page_url(
+            wishlist_page_response
+        )
+
+    def test_not_modified_page_not_cached_requested_again(
+        self, mock_config, cache, wishlist_page_response, monkeypatch
+    ):
+        pw = PriceWatch()
+        pw.page_cache = cache
+        not_modified = type(wishlist_page_response)()
+        not_modified.status_code = 304
+        not_modified.url = URL
+        not_modified.raw = io.BytesIO()
+        responses = [not_modified, wishlist_page_response]
+        requests_headers = []
+
+        def get(url, headers=None, **kwargs):
+            requests_headers.append(headers)
+            return responses.pop(0)
+
+        monkeypatch.setattr(pw.session, "get", get)
+        assert pw.request_page(URL) is wishlist_page_response
+        assert requests_headers == [{}, None]
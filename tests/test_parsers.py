@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from amazon_wishlist_pricewatch import parsers
+
+TESTS_FOLDER = Path(__file__).parent.resolve()
+
+
+@pytest.fixture()
+def wishlist_page_html():
+    with open(Path(TESTS_FOLDER, "wishlist_page.html"), "r") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("backend", parsers.PARSER_BACKENDS)
+def test_backends_parse_identical_items(backend, wishlist_page_html):
+    if backend.endswith("lxml"):
+        pytest.importorskip("lxml")
+
+    items, failures = parsers.parse_items(wishlist_page_html, backend)
+
+    assert (items, failures) == parsers.parse_items(wishlist_page_html)
+    assert [item.asin for item in items] == ["B000000001", "B000000002", "B000000003"]
+    assert items[0].byline == "by David Thomas (Paperback)"
+    assert items[1].price == sys.maxsize
+    assert items[2].title == "Espresso Machine & Grinder"
+    # The fourth item has no price.
+    assert failures == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 4096, 1_000_000])
+def test_streaming_parser(chunk_size, wishlist_page_html):
+    parser = parsers.StreamingParser()
+    fed = 0
+    emitted = []
+    while not parser.done and fed < len(wishlist_page_html):
+        emitted += parser.feed(wishlist_page_html[fed : fed + chunk_size])
+        fed += chunk_size
+
+    assert parser.done
+    assert (parser.items, parser.failures) == parsers.parse_items(wishlist_page_html)
+    assert emitted == parser.items
+    # Stopped once the "see more" link was read, before the footer.
+    see_more = wishlist_page_html.index("wl-see-more")
+    assert fed - chunk_size < wishlist_page_html.index(">", see_more) + 1
+
+
+def test_streaming_parser_last_page(wishlist_page_html):
+    # Without a "see more" link, the page is read to its end.
+    html = wishlist_page_html.replace("wl-see-more", "wl-nothing-more")
+    parser = parsers.StreamingParser()
+    parser.feed(html)
+    parser.feed(" " * 100_000)
+    assert not parser.done
+    assert parser.close() == []
+    assert parser.done
+    assert parser.items == parsers.parse_items(html)[0]
+
+    # However far down the page the link is.
+    see_more = wishlist_page_html.index(
+        "<a class", wishlist_page_html.index("endOfListMarker")
+    )
+    parser = parsers.StreamingParser()
+    parser.feed(wishlist_page_html[:see_more] + " " * 100_000)
+    assert not parser.done
+    parser.feed(wishlist_page_html[see_more : see_more + 40])
+    parser.feed(wishlist_page_html[see_more + 40 :])
+    assert parser.done
+
+    # A page without items is read to its end.
+    parser = parsers.StreamingParser()
+    assert parser.feed("<html><body>Empty</body></html>") == []
+    assert not parser.done
+    assert parser.close() == []
+    assert parser.done and parser.items == []
+
+
+def test_parse_content(wishlist_page_html):
+    content = wishlist_page_html.encode("utf-8")
+    items, failures = parsers.parse_items(wishlist_page_html)
+
+    assert parsers.parse_content(content, "utf-8") == (
+        [tuple(item) for item in items],
+        failures,
+    )
+    assert parsers.parse_content(content, None, "restricted")[0][2] == tuple(items[2])
+
+
+def test_process_pool(wishlist_page_html):
+    content = wishlist_page_html.encode("utf-8")
+    with parsers.process_pool(2) as pool:
+        results = list(pool.map(parsers.parse_content, [content] * 4, ["utf-8"] * 4))
+    assert results == [parsers.parse_content(content, "utf-8")] * 4
+
+
+def test_check_backend():
+    parsers.check_backend("restricted")
+    with pytest.raises(ValueError):
+        parsers.check_backend("html5lib")
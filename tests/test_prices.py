@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+
+from amazon_wishlist_pricewatch import prices
+
+
+@pytest.mark.parametrize(
+    "price, expected",
+    [
+        ("12.99", 1299),
+        ("1049.5", 104950),
+        ("7", 700),
+        ("0.1", 10),
+        ("9.15", 915),
+        ("26.0", 2600),
+        ("1.005", 101),
+        (6.0, 600),
+        ("-Infinity", prices.OUT_OF_STOCK),
+        (sys.maxsize, prices.OUT_OF_STOCK),
+        ("9.223372036854776e+18", prices.OUT_OF_STOCK),
+    ],
+)
+def test_to_minor_units(price, expected):
+    assert prices.to_minor_units(price) == expected
+
+
+def test_to_minor_units_invalid():
+    with pytest.raises(ValueError):
+        prices.to_minor_units("£12.99")
+
+
+@pytest.mark.parametrize("price", ["12.99", "1049.50", "0.10", "7.00"])
+def test_from_minor_units(price):
+    assert prices.from_minor_units(prices.to_minor_units(price)) == price
+    assert prices.from_minor_units(prices.OUT_OF_STOCK) == str(sys.maxsize)
+
+
+def test_float_drift_avoided():
+    # 0.1 + 0.2 != 0.3 as floats, but is in minor units.
+    total = prices.to_minor_units("0.1") + prices.to_minor_units("0.2")
+    assert total == prices.to_minor_units("0.3")
+
+
+@pytest.mark.parametrize("numpy_installed", [True, False])
+def test_compare_columns(numpy_installed, monkeypatch):
+    if numpy_installed:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+
+    old = [700, 915, prices.OUT_OF_STOCK, 100]
+    new = [600, 1015, 2000, 100]
+    assert prices.compare_columns(old, new) == ([0, 2], [1])
+    assert prices.compare_columns([], []) == ([], [])
@@ -1,10 +1,24 @@
+import io
 import json
+import sys
+import time
 from pathlib import Path
 
 import pytest
+import requests
 
 import amazon_wishlist_pricewatch.notify as notify
-from amazon_wishlist_pricewatch.pricewatch import PriceWatch, Wishlist, JsonManager
+from amazon_wishlist_pricewatch import fetch, pricewatch, settings
+from amazon_wishlist_pricewatch.pricewatch import (
+    CompactWishlist,
+    PriceWatch,
+    Wishlist,
+    JsonManager,
+    SEE_MORE_CLASS,
+    find_next_page_url,
+    main,
+    run_pass,
+)
 
 
 # TODO: May be able to remove config2.json if mock .get_config -> True
@@ -31,6 +45,192 @@ class TestPriceWatch:
         pw.parse_wishlist(page)
         assert not pw.wishlist.is_empty()
 
+    def test_parse_page(self, mock_config, wishlist_page_response):
+        pw = PriceWatch()
+        pw.parse_page(wishlist_page_response)
+
+        # The fourth item has no price and is skipped.
+        assert len(pw.wishlist) == 3
+        item = pw.wishlist["B000000001"]
+        assert item["title"] == "The Pragmatic Programmer"
+        assert item["byline"] == "by David Thomas (Paperback)"
+        assert item["price"] == "12.99"
+        assert item["url"].startswith("https://www.amazon.co.uk/dp/B000000001/")
+        # Out of stock items are given the max price and no byline.
+        assert pw.wishlist["B000000002"]["price"] == sys.maxsize
+        assert pw.wishlist["B000000002"]["byline"] is None
+        assert pw.wishlist["B000000003"]["title"] == "Espresso Machine & Grinder"
+
+    @pytest.mark.parametrize("href", [True, False])
+    def test_stream_page(self, mock_config, wishlist_page_response, href, monkeypatch):
+        monkeypatch.setattr(pricewatch, "STREAM_CHUNK_SIZE", 256)
+        content = wishlist_page_response.content
+        if not href:
+            content = content.replace(b'wl-see-more" href=', b'wl-see-more" data-href=')
+        response = requests.Response()
+        response.status_code = 200
+        response.url = wishlist_page_response.url
+        response.encoding = "utf-8"
+        response.raw = io.BytesIO(content)
+        pw = PriceWatch()
+        pw.stream_page(response)
+
+        assert len(response.content) < len(content)
+        assert len(response.streamed_items[0]) == 3
+        assert pw.metrics.counters["pages_cut_short"] == 1
+        # Counted and logged, as the pages after it are missed.
+        assert pw.metrics.counters["pages_cut_short_without_next"] == (not href)
+
+    def test_parse_wishlist_follows_pagination(self, mock_config, monkeypatch):
+        pages_total = sys.getrecursionlimit() + 100
+        pw = PriceWatch()
+        pw.fetch_engine.requests_per_second = 1e9
+
+        def page_response(url):
+            page = int(url.rpartition("=")[2])
+            content = (
+                f"<li data-price='{page}.99' class='a-spacing-none g-item-sortable'"
+                " data-reposition-action-params="
+                f'\'{{"itemExternalId":"ASIN:{page}|A1F83G8C2ARO7P"}}\'>'
+                f"<a class='a-link-normal' title='Item {page}' href='/dp/{page}'></a>"
+                "<span class='a-size-base'></span></li>"
+            )
+            if page < pages_total:
+                content += (
+                    f"<a class='{SEE_MORE_CLASS}' href='/ls/items?page={page + 1}'></a>"
+                )
+            response = requests.Response()
+            response.url = url
+            response._content = content.encode()
+            response.encoding = "utf-8"
+            return response
+
+        requested = []
+
+        def mock_request_page(url=None):
+            requested.append(url)
+            return page_response(url)
+
+        monkeypatch.setattr(pw, "request_page", mock_request_page)
+        # Deeper than the recursion limit, which the old recursive
+        # implementation could not handle.
+        pw.parse_wishlist(page_response("https://www.amazon.co.uk/ls/items?page=1"))
+
+        assert len(pw.wishlist) == pages_total
+        assert len(requested) == pages_total - 1
+        assert pw.wishlist[str(pages_total)]["price"] == f"{pages_total}.99"
+
+    def test_request_page_retries(
+        self, mock_config, wishlist_page_response, monkeypatch
+    ):
+        pw = PriceWatch()
+        pw.page_cache = None
+        pw.retry_seconds = 0
+        pw.fetch_engine.requests_per_second = 1e9
+        throttled = requests.Response()
+        throttled.status_code = 503
+        throttled._content = b""
+        results = [throttled, requests.ConnectionError(), wishlist_page_response]
+
+        def mock_get(url, **kwargs):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        monkeypatch.setattr(pw.session, "get", mock_get)
+
+        assert pw.request_page() is wishlist_page_response
+        assert pw.metrics.counters["retries"] == 2
+        assert pw.metrics.counters["throttled"] == 1
+        # Slowed down when throttled, speeding up again once successful.
+        bucket = pw.fetch_engine.bucket_for(pw.wishlist_url)
+        assert bucket.rate < bucket.max_rate
+
+    def test_request_page_once(self, mock_config, monkeypatch):
+        pw = PriceWatch()
+        pw.page_cache = None
+        pw.retry_seconds = 0
+        calls = []
+
+        def mock_get(url, **kwargs):
+            calls.append(url)
+            raise requests.Timeout()
+
+        monkeypatch.setattr(pw.session, "get", mock_get)
+
+        # Left to the caller to retry, without sleeping.
+        with pytest.raises(fetch.RetryLater) as exc_info:
+            pw.request_page_once()
+        assert exc_info.value.url == pw.wishlist_url
+        assert exc_info.value.attempt == 1
+        with pytest.raises(requests.Timeout):
+            pw.request_page_once(attempt=pw.max_attempts)
+        assert len(calls) == 2
+
+    def test_request_page_not_retried(self, mock_config, monkeypatch):
+        pw = PriceWatch()
+        pw.page_cache = None
+        pw.retry_seconds = 0
+        not_found = requests.Response()
+        not_found.status_code = 404
+        not_found._content = b""
+        calls = []
+        monkeypatch.setattr(
+            pw.session, "get", lambda url, **kwargs: calls.append(url) or not_found
+        )
+
+        with pytest.raises(requests.HTTPError):
+            pw.request_page()
+        assert len(calls) == 1
+
+    def test_request_page_circuit_breaker(self, mock_config, monkeypatch):
+        pw = PriceWatch()
+        pw.page_cache = None
+        pw.retry_seconds = 0
+        pw.fetch_engine.requests_per_second = 1e9
+        pw.fetch_engine.breaker_failures = pw.max_attempts
+        calls = []
+
+        def mock_get(url, **kwargs):
+            calls.append(url)
+            raise requests.Timeout()
+
+        monkeypatch.setattr(pw.session, "get", mock_get)
+
+        with pytest.raises(requests.Timeout):
+            pw.request_page()
+        assert len(calls) == pw.max_attempts
+        with pytest.raises(fetch.CircuitOpenError):
+            pw.request_page()
+        assert len(calls) == pw.max_attempts
+
+    def test_find_next_page_url(self, wishlist_page_response):
+        assert find_next_page_url(wishlist_page_response) == (
+            "https://www.amazon.co.uk/hz/wishlist/slv/items?filter=unpurchased"
+            "&paginationToken=eyJwYWdlIjoyfQ&itemsLayout=LIST&sort=default"
+            "&type=wishlist&lek=a1b2c3"
+        )
+
+        # Links without the exact "see more" class are ignored.
+        wishlist_page_response._content = wishlist_page_response.content.replace(
+            b"g-visible-no-js wl-see-more", b"wl-see-more"
+        )
+        assert find_next_page_url(wishlist_page_response) is None
+
+    def test_wishlist_urls(self, mock_config):
+        notify.get_config()["general"]["wishlist_urls"] = [
+            "https://www.amazon.com/hz/wishlist/ls/A",
+            "https://www.amazon.de/hz/wishlist/ls/B",
+            "https://www.amazon.com/hz/wishlist/ls/A",
+        ]
+        pw = PriceWatch()
+        # Duplicates and the placeholder `wishlist_url` are dropped.
+        assert pw.wishlist_urls == [
+            "https://www.amazon.com/hz/wishlist/ls/A",
+            "https://www.amazon.de/hz/wishlist/ls/B",
+        ]
+
     def test_compare_prices(
         self, example_wishlist_items, mock_prev_wishlist, mock_config
     ):
@@ -42,6 +242,205 @@ class TestPriceWatch:
         assert cheaper_items[0]["price"] == "6.0"
         # When increased price found check the old, cheaper price is saved instead.
         assert pw.wishlist.get_item_price("2") == "9.15"
+        assert pw.fired_rules == {"1": "new_low:0"}
+
+    def test_compare_prices_alert_rules(
+        self, example_wishlist_items, mock_prev_wishlist, mock_config
+    ):
+        notify.get_config()["alerts"] = {
+            "rules": [{"name": "big drop", "type": "percent_drop", "percent": 20}]
+        }
+        pw = PriceWatch()
+        pw.wishlist = Wishlist(example_wishlist_items)
+        # 7.0 to 6.0 is a drop of under 20%.
+        assert pw.compare_prices() == []
+        # The lowest seen price is still kept.
+        assert pw.wishlist.get_item_price("1") == "6.0"
+
+        notify.get_config()["alerts"]["rules"][0]["percent"] = 10
+        pw = PriceWatch()
+        pw.wishlist = Wishlist(example_wishlist_items)
+        assert [item["asin"] for item in pw.compare_prices()] == ["1"]
+        assert pw.fired_rules == {"1": "big drop"}
+
+    def test_compare_prices_window_rules(
+        self, example_wishlist_items, mock_prev_wishlist, mock_config, tmp_path
+    ):
+        notify.get_config()["alerts"] = {
+            "rules": [{"name": "deal", "type": "below_average", "percent": 20}]
+        }
+        pw = PriceWatch(state_dir=tmp_path)
+        now = time.time()
+        pw.price_stats.observe_many([("1", 650), ("2", 1400)], now - 2 * 86400)
+        pw.price_stats.observe_many([("1", 650), ("2", 1300)], now - 86400)
+        pw.wishlist = Wishlist(example_wishlist_items)
+        # 10.15 is above the lowest seen price, but over 20% below the average.
+        assert [item["asin"] for item in pw.compare_prices()] == ["2"]
+        assert pw.fired_rules == {"2": "deal"}
+        # Prices are recorded as found, not as the lowest seen.
+        assert pw.price_stats.window("2", 90, time.time()).last_price == 1015
+        assert pw.price_stats.window("1", 90, time.time()).count == 3
+
+        notify.get_config()["general"]["price_stats"] = "0"
+        with pytest.raises(settings.ConfigError, match="price_stats"):
+            PriceWatch()
+
+
+def test_run_pass_keeps_state_warm(
+    mock_config, block_notification_calls, tmpdir, monkeypatch
+):
+    pw = PriceWatch()
+    pw.page_cache = None
+    pw.price_stats = None
+    pw.json_man.wishlist_json_path = Path(tmpdir, "wishlist_items.json")
+    pw.json_man.prev_wishlist = {}
+    scraped_prices = iter(["7.0", "7.0", "6.0"])
+
+    def mock_fetch_wishlists():
+        pw.wishlist.add_item(
+            title="Test title", price=next(scraped_prices), url="/p", asin="1"
+        )
+
+    monkeypatch.setattr(pw, "fetch_wishlists", mock_fetch_wishlists)
+    sent = []
+    monkeypatch.setattr(
+        notify, "send_notification", lambda wishlist_item_list: sent.append(1)
+    )
+    saves = []
+    original_dump = json.dump
+    monkeypatch.setattr(
+        json,
+        "dump",
+        lambda *args, **kwargs: saves.append(original_dump(*args, **kwargs)),
+    )
+    monkeypatch.setattr(
+        pw.json_man,
+        "get_wishlist_dict",
+        lambda: pytest.fail("Previous wishlist reloaded from disk."),
+    )
+
+    run_pass(pw)
+    assert len(saves) == 1
+    # Unchanged, so not saved again.
+    run_pass(pw)
+    assert len(saves) == 1 and not sent
+    # Compared against the previous pass held in memory.
+    run_pass(pw)
+    assert len(saves) == 2 and len(sent) == 1
+    with open(pw.json_man.wishlist_json_path) as f:
+        assert json.load(f)["1"]["price"] == "6.0"
+
+
+def test_run_pass_keeps_unfetched_items(
+    mock_config, block_notification_calls, wishlist_page_response, tmpdir, monkeypatch
+):
+    failing_url = "https://www.amazon.com/hz/wishlist/ls/F41L1NG"
+    config = notify.get_config()
+    config["general"]["wishlist_url"] = wishlist_page_response.url
+    config["general"]["wishlist_urls"] = [failing_url]
+    pw = PriceWatch()
+    pw.page_cache = None
+    pw.retry_seconds = 0
+    pw.fetch_engine.requests_per_second = 1e9
+    pw.json_man.wishlist_json_path = Path(tmpdir, "wishlist_items.json")
+    unfetched = {
+        "title": "On the wishlist which failed",
+        "byline": None,
+        "price": "3.50",
+        "url": "/dp/B0F41L1NG0",
+        "asin": "B0F41L1NG0",
+    }
+    pw.json_man.prev_wishlist = {"B0F41L1NG0": unfetched}
+    last_page = requests.Response()
+    last_page.status_code = 200
+    last_page._content = b"<html><body></body></html>"
+
+    def mock_get(url, **kwargs):
+        if url == failing_url:
+            raise requests.ConnectionError()
+        if url == wishlist_page_response.url:
+            return wishlist_page_response
+        last_page.url = url
+        return last_page
+
+    monkeypatch.setattr(pw.session, "get", mock_get)
+    failure_messages = []
+    monkeypatch.setattr(
+        notify, "failed_request_msg", lambda: failure_messages.append(1)
+    )
+    run_pass(pw)
+
+    assert pw.failed_wishlists == [failing_url]
+    assert pw.metrics.counters["failed_wishlists"] == 1
+    assert pw.metrics.counters["retries"] == pw.max_attempts - 1
+    assert len(failure_messages) == 1
+    with open(pw.json_man.wishlist_json_path) as f:
+        saved = json.load(f)
+    assert saved["B0F41L1NG0"] == unfetched
+    assert len(saved) == 4
+
+    # Nothing at all fetched is still a failure.
+    config["general"]["wishlist_url"] = failing_url
+    pw = PriceWatch()
+    pw.retry_seconds = 0
+    pw.fetch_engine.requests_per_second = 1e9
+    monkeypatch.setattr(pw.session, "get", mock_get)
+    with pytest.raises(requests.ConnectionError):
+        run_pass(pw)
+
+
+def test_run_pass_writes_metrics(
+    mock_config, block_notification_calls, wishlist_page_response, tmpdir, monkeypatch
+):
+    config = notify.get_config()
+    config["general"]["wishlist_url"] = wishlist_page_response.url
+    config["metrics"] = {
+        "json_report": str(Path(tmpdir, "run_report.json")),
+        "prometheus_textfile": str(Path(tmpdir, "pricewatch.prom")),
+    }
+    pw = PriceWatch()
+    pw.page_cache = None
+    pw.json_man.wishlist_json_path = Path(tmpdir, "wishlist_items.json")
+    pw.fetch_engine.requests_per_second = 1e9
+    last_page = requests.Response()
+    last_page.status_code = 200
+    last_page._content = b"<html><body></body></html>"
+
+    def mock_get(url, **kwargs):
+        if url == wishlist_page_response.url:
+            return wishlist_page_response
+        last_page.url = url
+        return last_page
+
+    monkeypatch.setattr(pw.session, "get", mock_get)
+    run_pass(pw)
+
+    with open(Path(tmpdir, "run_report.json")) as f:
+        report = json.load(f)
+    assert report["counters"] == {
+        "wishlists": 1,
+        "pages": 2,
+        "bytes_downloaded": len(wishlist_page_response.content)
+        + len(last_page.content),
+        "pages_cut_short": 0,
+        "pages_cut_short_without_next": 0,
+        "items_parsed": 3,
+        "parse_failures": 1,
+        "retries": 0,
+        "throttled": 0,
+        "failed_wishlists": 0,
+        "shared_wishlists": 0,
+        "alerts_sent": 0,
+    }
+    assert report["stages"]["request_page"]["calls"] == 2
+    assert report["stages"]["parse_page"]["calls"] == 2
+    assert set(report["stages"]) >= {
+        "fetch_wishlists",
+        "compare_prices",
+        "save_wishlist_json",
+    }
+    with open(Path(tmpdir, "pricewatch.prom")) as f:
+        assert "pricewatch_last_run_items_parsed 3\n" in f.read()
 
 
 class TestWishlist:
@@ -105,6 +504,55 @@ class TestWishlist:
         assert item["asin"] == "1"
 
 
+class TestCompactWishlist:
+    """Tests for pricewatch.CompactWishlist."""
+
+    def test_same_items_as_wishlist(self, example_wishlist_items):
+        wishlist = Wishlist(example_wishlist_items)
+        compact = CompactWishlist(example_wishlist_items)
+
+        assert len(compact) == 2
+        assert list(compact) == list(wishlist)
+        assert compact["2"] == wishlist["2"]
+        assert compact.get_item("1") == wishlist.get_item("1")
+        assert compact.to_dict() == wishlist.to_dict()
+        assert "1" in compact and "3" not in compact
+        assert not compact.is_empty()
+        assert CompactWishlist().is_empty()
+
+    def test_update_price(self, example_wishlist_items):
+        compact = CompactWishlist(example_wishlist_items)
+        compact.update_price(asin="1", price="26.00")
+        assert compact.get_item_price("1") == "26.00"
+        assert compact["1"]["price"] == "26.00"
+
+    def test_bylines_interned(self):
+        compact = CompactWishlist()
+        for asin in ("1", "2"):
+            compact.add_item(
+                title="t",
+                byline="".join(["by ", "Author"]),
+                price="1",
+                url="/",
+                asin=asin,
+            )
+        compact.add_item(title="t", byline="", price="1", url="/", asin="3")
+
+        assert compact.records["1"].byline is compact.records["2"].byline
+        assert compact["3"]["byline"] is None
+
+    def test_compare_prices(
+        self, example_wishlist_items, mock_prev_wishlist, mock_config
+    ):
+        notify.get_config()["general"]["compact_wishlist"] = "1"
+        pw = PriceWatch()
+        pw.wishlist = CompactWishlist(example_wishlist_items)
+        cheaper_items = pw.compare_prices()
+        assert len(cheaper_items) == 1
+        assert cheaper_items[0]["price"] == "6.0"
+        assert pw.wishlist.get_item_price("2") == "9.15"
+
+
 class TestJsonManager:
     """Tests for pricewatch.JsonManager."""
 
@@ -123,6 +571,15 @@ class TestJsonManager:
 
         assert json_man.get_wishlist_dict() == {}
 
+    def test_get_lowest_prices(self, tmpdir, example_wishlist_items):
+        json_man = JsonManager(Path(tmpdir, "wishlist_items.json"))
+        assert json_man.get_lowest_prices(["1"]) == ([], [], [])
+        json_man.save_wishlist_json(Wishlist(example_wishlist_items))
+
+        assert json_man.get_lowest_prices(["3", "2"]) == (["2"], [1015], ["1"])
+        assert json_man.get_lowest_price("2") == "10.15"
+        assert json_man.get_lowest_price("3") is None
+
     def test_save_wishlist_json(self, tmpdir, wishlist_with_two_items):
         truth_wishlist_json = Path(TESTS_FOLDER, "wishlist_items.json")
         temp_wishlist_json = Path(tmpdir, "wishlist_items.json")
@@ -140,6 +597,7 @@ class TestJsonManager:
 # notify.py #
 #############
 
+
 def test_send_notification(block_notification_calls, mock_config):
     notify.config = notify.get_config()
     # Type checking error below for wishlist_item_list can be ignored as all
@@ -163,6 +621,174 @@ def test_parse_text_html(mock_config, mock_wishlist_items_list, parsed_text_html
     assert html == true_html
 
 
+def test_parse_text_html_item_domains(mock_config):
+    notify.config = notify.get_config()
+    notify.config["general"]["wishlist_url"] = ""
+    notify.config["general"]["wishlist_urls"] = [
+        "https://www.amazon.com/hz/wishlist/ls/US",
+        "https://www.amazon.de/hz/wishlist/ls/DE",
+    ]
+    items = alert_items(3)
+    items[0]["url"] = "https://www.amazon.de/dp/B000000000/"
+    items[1]["url"] = "https://www.amazon.co.uk/dp/B000000001/"
+
+    text, _ = notify.parse_txt_html(items)
+
+    assert "https://www.amazon.de/dp/B000000000/\n" in text
+    assert "https://www.amazon.co.uk/dp/B000000001/\n" in text
+    # Relative URLs saved by older versions are taken as on the first wishlist.
+    assert "https://www.amazon.com/dp/B000000002/\n" in text
+    assert "https:///" not in text
+
+
+def alert_items(count):
+    return [
+        {
+            "title": f"Item {i} & <friends>",
+            "byline": "by Author" if i % 2 else None,
+            "price": f"{i}.99",
+            "url": f"/dp/B{i:09d}/",
+            "asin": f"B{i:09d}",
+        }
+        for i in range(count)
+    ]
+
+
+def test_render_messages_split(mock_config):
+    notify.config = notify.get_config()
+    items = alert_items(50)
+
+    messages = list(notify.render_messages(items, max_size=2000))
+
+    assert len(messages) > 1
+    assert all(len(text) + len(html) <= 2000 for text, html in messages)
+    for _, html in messages:
+        # Each message is a complete html document.
+        assert html.startswith("<html><body><p>")
+        assert html.endswith("</p></body></html>")
+        assert html.count("</html>") == 1
+        assert "<friends>" not in html
+    # Every item is sent once, in order.
+    assert "".join(text for text, _ in messages) == notify.parse_txt_html(items)[0]
+    text_only = list(notify.render_messages(items, 2000, include_html=False))
+    assert len(text_only) < len(messages)
+    assert all(len(text) <= 2000 for text, _ in text_only)
+    # An item longer than the limit is sent on its own.
+    assert len(list(notify.render_messages(items[:3], max_size=10))) == 3
+
+
+def test_send_notification_splits_per_channel(mock_config, monkeypatch):
+    notify.config = notify.get_config()
+    notify.config["general"]["notification_mode"] = "12"
+    notify.config["notifications"] = {"max_message_sizes": {"email": 0}}
+    sent = []
+    monkeypatch.setattr(
+        notify, "send_email", lambda text, html: sent.append(("email", text))
+    )
+    monkeypatch.setattr(
+        notify, "telegram_message", lambda text: sent.append(("telegram", text))
+    )
+
+    notify.send_notification(wishlist_item_list=alert_items(1000))
+
+    emails = [text for channel, text in sent if channel == "email"]
+    telegrams = [text for channel, text in sent if channel == "telegram"]
+    assert len(emails) == 1
+    assert len(telegrams) > 1
+    assert all(len(text) <= notify.MAX_MESSAGE_SIZES["telegram"] for text in telegrams)
+    assert "".join(telegrams) == emails[0]
+
+
+class TestEmailChannel:
+    """Tests for notify.EmailChannel against a local stand-in SMTP server."""
+
+    def test_reuses_connection(self, smtp_server, email_config):
+        channel = notify.EmailChannel(email_config)
+        channel.send("first text", "<p>first html</p>")
+        channel.send("second text", "<p>second html</p>")
+        channel.close()
+
+        assert smtp_server.connections == 1
+        assert len(smtp_server.messages) == 2
+        assert "first text" in smtp_server.messages[0]
+        assert "<p>second html</p>" in smtp_server.messages[1]
+        assert "To: person1@example.com, person2@example.com" in smtp_server.messages[0]
+
+    def test_reconnects_if_server_hung_up(self, smtp_server, email_config):
+        smtp_server.hang_up = True
+        channel = notify.EmailChannel(email_config)
+        channel.send("first text", "html")
+        channel.send("second text", "html")
+        channel.close()
+
+        assert smtp_server.connections == 2
+        assert len(smtp_server.messages) == 2
+
+    def test_unknown_smtp_security(self, email_config):
+        email_config["smtp_security"] = "tls"
+        with pytest.raises(ValueError):
+            notify.EmailChannel(email_config)
+
+
+def test_send_notification_via_outbox(tmpdir, smtp_server, email_config):
+    notify.config = {
+        "general": {"notification_mode": "1"},
+        "email": email_config,
+        "notifications": {"flush_timeout_seconds": "5"},
+    }
+    notify.start_dispatcher(Path(tmpdir))
+    try:
+        notify.send_notification(text="alert text", html="<p>alert html</p>")
+        notify.send_notification(text="second text", html="<p>second html</p>")
+    finally:
+        notify.stop_dispatcher()
+
+    assert notify.dispatcher is None
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 2
+    assert "alert text" in smtp_server.messages[0]
+    assert not list(Path(tmpdir).iterdir())
+
+
+def test_main_unfilled_config(log_path, tmp_path, monkeypatch):
+    with open(Path(TESTS_FOLDER, "config2.json"), "r") as f:
+        config = json.load(f)
+    # As in the default config.json, which would fail to parse.
+    config["email"]["smtp_port"] = "YOUR-SMTP-SSL-PORT (e.g. 465 for gmail)"
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    monkeypatch.setattr(settings, "DEFAULT_CONFIG_PATH", config_path)
+
+    with pytest.raises(SystemExit) as exc_info:
+        main([])
+    assert not exc_info.value.code
+    # Logged to the test's own file, see the `log_path` fixture.
+    assert log_path.exists()
+    assert not Path(pricewatch.__file__).with_name("pricewatch.log").exists()
+
+    config["general"]["wishlist_url"] = "https://www.amazon.co.uk/hz/wishlist/ls/F1LL3D"
+    config_path.write_text(json.dumps(config))
+    with pytest.raises(SystemExit) as exc_info:
+        main([])
+    assert exc_info.value.code == 1
+
+
+def test_main_outbox_in_state_dir(state_dir, tmp_path, monkeypatch):
+    with open(Path(TESTS_FOLDER, "config2.json"), "r") as f:
+        config = json.load(f)
+    config["general"]["wishlist_url"] = "https://www.amazon.co.uk/hz/wishlist/ls/F1LL3D"
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    monkeypatch.setattr(settings, "DEFAULT_CONFIG_PATH", config_path)
+    passes = []
+    monkeypatch.setattr(pricewatch, "run_pass", passes.append)
+
+    main([])
+    assert passes[0].state_dir == state_dir
+    assert (state_dir / "outbox").is_dir()
+    assert notify.dispatcher is None
+
+
 #
 #
 # def test_send_email():
@@ -0,0 +1,132 @@
+import json
+import threading
+
+import pytest
+
+from amazon_wishlist_pricewatch import notify, profiling, replay, settings, synthetic
+from amazon_wishlist_pricewatch.metrics import Metrics
+from amazon_wishlist_pricewatch.pricewatch import parse_args
+
+
+def busy(n):
+    return [str(i) * 10 for i in range(n)]
+
+
+class TestStageProfiler:
+    """Tests for profiling.StageProfiler."""
+
+    def test_stages(self, tmp_path):
+        profiler = profiling.StageProfiler(top=5)
+        metrics = Metrics(profiler)
+        profiler.start()
+        try:
+            with metrics.span("outer"):
+                kept = busy(1000)
+                with metrics.span("inner"):
+                    busy(2000)
+            # Run at the same time, so on threads of their own.
+            barrier = threading.Barrier(2)
+            threads = [
+                threading.Thread(target=self.run_stage, args=(metrics, barrier))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            profiler.stop()
+        assert kept
+
+        assert profiler.calls == {"outer": 1, "inner": 3}
+        assert metrics.stage_calls == profiler.calls
+        # A profile for each thread the stage ran on.
+        assert len(profiler.profiles["inner"]) == 3
+        assert any(
+            "test_profiling.py" in site for site in profiler.allocations["outer"]
+        )
+
+        written = profiler.write_report(tmp_path / "report")
+        assert sorted(path.name for path in written) == [
+            "inner.prof",
+            "inner.txt",
+            "outer.prof",
+            "outer.txt",
+            "summary.txt",
+        ]
+        outer = (tmp_path / "report" / "outer.txt").read_text()
+        assert "(busy)" in outer
+        assert "test_profiling.py" in outer.split("allocation sites")[1]
+        summary = (tmp_path / "report" / "summary.txt").read_text()
+        assert "inner: 3 call(s)" in summary
+
+    @staticmethod
+    def run_stage(metrics, barrier):
+        with metrics.span("inner"):
+            busy(100)
+            barrier.wait()
+
+    def test_not_tracing(self, tmp_path):
+        profiler = profiling.StageProfiler()
+        with profiler.stage("compare_prices"):
+            busy(10)
+        profiler.write_report(tmp_path)
+        assert "None traced." in (tmp_path / "compare_prices.txt").read_text()
+
+
+def test_profile_pass_replay(mock_config, block_notification_calls, tmp_path):
+    pages_dir = tmp_path / "pages"
+    pages_dir.mkdir()
+    for i, html in enumerate(replay.synthetic_pages(10, pages=2).values()):
+        (pages_dir / f"page{i}.html").write_text(html)
+    config = notify.get_config()
+    config["general"]["notification_mode"] = "1"
+    config["general"][
+        "wishlist_url"
+    ] = "https://www.amazon.co.uk/hz/wishlist/ls/PR0F1L3"
+    config["fetch"] = {"requests_per_second": 1000}
+    loaded = settings.parse(config)
+    notify.configure(loaded)
+    report_dir = tmp_path / "report"
+    # Saved at higher prices by a previous run, so each item is alerted on.
+    (report_dir / "state").mkdir(parents=True)
+    (report_dir / "state" / "wishlist_items.json").write_text(
+        json.dumps(
+            {
+                item.asin: dict(item._asdict(), price="999.99")
+                for item in synthetic.expected_items(10)
+            }
+        )
+    )
+
+    written = profiling.profile_pass(loaded, report_dir, pages_dir)
+    assert {
+        "request_page.txt",
+        "parse_page.txt",
+        "compare_prices.txt",
+        "send_notification.txt",
+        "save_wishlist_json.txt",
+    } <= {path.name for path in written}
+    saved = json.loads((report_dir / "state" / "wishlist_items.json").read_text())
+    assert len(saved) == 10
+    # Alerts are only saved to the outbox of the report.
+    assert list((report_dir / "outbox").glob("*.json"))
+
+    with pytest.raises(ValueError, match="No saved pages"):
+        profiling.profile_pass(loaded, report_dir, tmp_path / "state")
+
+
+def test_profile_dir_default():
+    args = parse_args(["--profile"])
+    # Not the installed package's directory, which may not be writable.
+    assert args.profile_dir == profiling.DEFAULT_REPORT_DIR
+    assert not args.profile_dir.is_absolute()
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [["--replay", "pages"], ["--profile", "--daemon"], ["--profile", "run-many", "x"]],
+)
+def test_profile_args_invalid(argv):
+    with pytest.raises(SystemExit):
+        parse_args(argv)
@@ -0,0 +1,135 @@
+import requests
+
+from amazon_wishlist_pricewatch import notify, replay, synthetic
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch, run_pass
+
+
+class TestReplayServer:
+    """Tests for replay.ReplayServer."""
+
+    def test_serves_pages(self):
+        pages = replay.synthetic_pages(20, pages=2)
+        with replay.ReplayServer(pages) as server:
+            first = requests.get(server.wishlist_url())
+            assert first.status_code == 200
+            assert first.text == synthetic.generate_wishlist(20, pages=2)[0].html
+            # Any wishlist is served the first page.
+            other = requests.get(f"{server.url}/hz/wishlist/ls/0TH3R")
+            assert other.content == first.content
+            unchanged = requests.get(
+                server.wishlist_url(), headers={"If-None-Match": first.headers["ETag"]}
+            )
+            assert unchanged.status_code == 304
+            assert requests.get(f"{server.url}/missing").status_code == 404
+        assert server.stats == {
+            "ok": 2,
+            "not_modified": 1,
+            "not_found": 1,
+            "error": 0,
+            "throttled": 0,
+        }
+
+    def test_errors_and_bursts(self):
+        pages = replay.synthetic_pages(5)
+        with replay.ReplayServer(
+            pages, burst_every=2, burst_length=1, retry_after=7
+        ) as server:
+            responses = [requests.get(server.wishlist_url()) for _ in range(6)]
+        assert [response.status_code for response in responses] == [
+            200,
+            200,
+            503,
+            200,
+            200,
+            503,
+        ]
+        assert responses[2].headers["Retry-After"] == "7"
+
+        with replay.ReplayServer(pages, error_rate=1) as server:
+            assert requests.get(server.wishlist_url()).status_code == 500
+        assert server.stats["error"] == 1
+
+    def test_recorded_pages(self, tmp_path):
+        for i, page in enumerate(synthetic.generate_wishlist(30, pages=3)):
+            (tmp_path / f"page{i}.html").write_text(page.html, encoding="utf-8")
+
+        pages = replay.recorded_pages(sorted(tmp_path.glob("*.html")))
+
+        expected = replay.synthetic_pages(30, pages=3)
+        assert list(pages)[0] == replay.RECORDED_WISHLIST_PATH
+        assert list(pages)[1:] == list(expected)[1:]
+        assert list(pages.values()) == list(expected.values())
+
+
+def test_run_pass_against_replay_server(
+    mock_config, block_notification_calls, tmp_path
+):
+    config = notify.get_config()
+    config["general"]["wishlist_url"] = "https://www.amazon.co.uk/hz/wishlist/ls/R3PL4Y"
+    config["general"]["page_cache"] = "0"
+    config["fetch"] = {"requests_per_second": 1000, "retry_seconds": 0}
+    pages = replay.synthetic_pages(60, pages=6)
+    with replay.ReplayServer(pages, burst_every=3, error_rate=0.1) as server:
+        config["fetch"]["base_url"] = server.url
+        pw = PriceWatch(config, tmp_path)
+        run_pass(pw)
+
+    assert len(pw.wishlist) == len(synthetic.expected_items(60))
+    assert pw.wishlist_domain == "www.amazon.co.uk"
+    assert server.stats["ok"] == 6
+    assert pw.metrics.counters["retries"] == server.stats["throttled"] + (
+        server.stats["error"]
+    )
+    assert pw.metrics.counters["throttled"] == server.stats["throttled"] > 0
+
+
+def test_run_pass_parse_processes(mock_config, block_notification_calls, tmp_path):
+    config = notify.get_config()
+    config["general"]["wishlist_url"] = "https://www.amazon.co.uk/hz/wishlist/ls/R3PL4Y"
+    config["general"]["page_cache"] = "0"
+    config["general"]["parse_processes"] = "2"
+    config["fetch"] = {"requests_per_second": 1000}
+    with replay.ReplayServer(replay.synthetic_pages(60, pages=6)) as server:
+        config["fetch"]["base_url"] = server.url
+        pw = PriceWatch(config, tmp_path)
+        run_pass(pw)
+
+    assert pw.fetch_engine.parse_concurrency == 2
+    assert pw._parse_pool is None
+    assert pw.metrics.counters["pages"] == 6
+    expected = synthetic.expected_items(60)
+    assert len(pw.wishlist) == len(expected)
+    # Items are parsed in worker processes but merged into the wishlist here.
+    for item in expected:
+        assert pw.wishlist.get_item(item.asin)["title"] == item.title
+
+
+def test_run_pass_stream_pages(mock_config, block_notification_calls, tmp_path):
+    config = notify.get_config()
+    config["general"]["wishlist_url"] = "https://www.amazon.co.uk/hz/wishlist/ls/R3PL4Y"
+    config["fetch"] = {"requests_per_second": 1000}
+    (tmp_path / "full").mkdir()
+    (tmp_path / "streamed").mkdir()
+    pages = replay.synthetic_pages(60, pages=6)
+    with replay.ReplayServer(pages) as server:
+        config["fetch"]["base_url"] = server.url
+        pw = PriceWatch(config, tmp_path / "full")
+        run_pass(pw)
+        config["fetch"]["stream_pages"] = "1"
+        streamed = PriceWatch(config, tmp_path / "streamed")
+        run_pass(streamed)
+
+    assert server.stats["ok"] == 12
+    assert streamed.metrics.counters["pages"] == 6
+    # The footer of each page but the last, without a "see more" link, is
+    # skipped.
+    assert streamed.metrics.counters["pages_cut_short"] == 5
+    assert streamed.metrics.counters["pages_cut_short_without_next"] == 0
+    assert (
+        streamed.metrics.counters["bytes_downloaded"]
+        < pw.metrics.counters["bytes_downloaded"] * 0.8
+    )
+    assert list(streamed.wishlist) == list(pw.wishlist)
+    assert streamed.page_cache.get_items(server.url + "/hz/wishlist/ls/R3PL4Y") == (
+        pw.page_cache.get_items(server.url + "/hz/wishlist/ls/R3PL4Y")
+    )
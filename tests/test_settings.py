@@ -0,0 +1,156 @@
+import json
+import os
+
+import pytest
+
+from amazon_wishlist_pricewatch import settings
+
+WISHLIST_URL = "https://www.amazon.co.uk/hz/wishlist/ls/F1RSTL1ST"
+
+
+def make_config(**general):
+    return {
+        "general": {"notification_mode": "1", "wishlist_url": WISHLIST_URL, **general},
+        "email": {
+            "smtp_server": "smtp.example.com",
+            "smtp_port": "465",
+            "sending_email": "from@example.com",
+            "sending_email_pass": "pass",
+            "receiving_emails": ["to@example.com"],
+        },
+    }
+
+
+def test_parse_defaults():
+    loaded = settings.parse(make_config())
+    assert loaded.general.channels == ("email",)
+    assert loaded.general.wishlist_urls == (WISHLIST_URL,)
+    assert loaded.general.user_agent == settings.DEFAULT_USER_AGENT
+    assert loaded.general.storage == "json"
+    assert loaded.general.page_cache and not loaded.general.compact_wishlist
+    assert loaded.general.price_stats
+    assert loaded.email.smtp_port == 465
+    assert loaded.email.smtp_security == "ssl"
+    assert loaded.telegram is None
+    assert loaded.fetch.base_url is None
+    assert loaded.notifications.max_message_sizes == {}
+    assert [rule.type for rule in loaded.alert_rules.rules] == ["new_low"]
+
+
+def test_parse_converts_values():
+    config = make_config(compact_wishlist="1", wishlist_urls=[WISHLIST_URL, "x"])
+    config["fetch"] = {"max_concurrency": "4", "requests_per_second": "2.5"}
+    config["notifications"] = {"max_message_sizes": {"telegram": "1000"}}
+    loaded = settings.parse(config)
+    assert loaded.general.compact_wishlist
+    assert loaded.general.wishlist_urls == (WISHLIST_URL, "x")
+    assert loaded.fetch.max_concurrency == 4
+    assert loaded.fetch.requests_per_second == 2.5
+    assert loaded.notifications.max_message_sizes == {"telegram": 1000}
+    assert loaded.raw is config
+
+
+@pytest.mark.parametrize(
+    "section, key, value, message",
+    [
+        ("general", "storage", "csv", "general.storage"),
+        ("general", "page_cache", "yes", "general.page_cache"),
+        ("general", "wishlist_urls", WISHLIST_URL, "general.wishlist_urls"),
+        ("email", "smtp_port", "YOUR-SMTP-SSL-PORT", "email.smtp_port"),
+        ("email", "smtp_security", "tls", "email.smtp_security"),
+        ("fetch", "max_concurrency", 0, "fetch.max_concurrency"),
+        ("fetch", "requests_per_second", 0, "fetch.requests_per_second"),
+        ("fetch", "requests_per_second", "-1", "fetch.requests_per_second"),
+        ("daemon", "interval_minutes", "hourly", "daemon.interval_minutes"),
+        ("alerts", "rules", [{"type": "lower"}], "alerts.rules"),
+    ],
+)
+def test_parse_invalid(section, key, value, message):
+    config = make_config()
+    config.setdefault(section, {})[key] = value
+    with pytest.raises(settings.ConfigError, match=message):
+        settings.parse(config)
+
+
+def test_parse_only_chosen_channels():
+    config = make_config()
+    del config["email"]["smtp_server"]
+    with pytest.raises(settings.ConfigError, match="email.smtp_server"):
+        settings.parse(config)
+
+    config["general"]["notification_mode"] = "2"
+    with pytest.raises(settings.ConfigError, match="telegram"):
+        settings.parse(config)
+    config["telegram"] = {"chat_id": 1234, "token": "t0k3n"}
+    loaded = settings.parse(config)
+    assert loaded.email is None
+    assert loaded.telegram == settings.TelegramSettings("1234", "t0k3n")
+
+
+def test_unfilled():
+    shipped = json.loads(settings.DEFAULT_CONFIG_PATH.read_text())
+    assert settings.unfilled(shipped)
+    # The placeholder values of the channels aren't validated.
+    with pytest.raises(settings.ConfigError, match="email.smtp_port"):
+        settings.parse(shipped)
+    assert settings.unfilled(make_config(wishlist_url="", wishlist_urls=[]))
+    assert not settings.unfilled(make_config())
+    assert not settings.unfilled(
+        make_config(wishlist_url="", wishlist_urls=[WISHLIST_URL])
+    )
+    assert not settings.unfilled(
+        make_config(wishlist_url="", send_test_notification="1")
+    )
+    # Left for parse to report.
+    assert not settings.unfilled({"general": []})
+    assert not settings.unfilled(make_config(wishlist_urls=WISHLIST_URL))
+
+
+class TestConfigFile:
+    """Tests for settings.ConfigFile."""
+
+    def write(self, path, config, mtime):
+        path.write_text(json.dumps(config))
+        os.utime(path, (mtime, mtime))
+
+    def test_reloads_only_when_changed(self, tmp_path):
+        path = tmp_path / "config.json"
+        self.write(path, make_config(), 1000)
+        config_file = settings.ConfigFile(path)
+        first = config_file.load()
+        assert config_file.load() is first
+        assert not config_file.changed()
+
+        self.write(path, make_config(storage="sqlite"), 2000)
+        assert config_file.changed()
+        second = config_file.load()
+        assert second is not first
+        assert second.general.storage == "sqlite"
+        assert config_file.settings is second
+
+    def test_keeps_last_settings_on_bad_edit(self, tmp_path, monkeypatch):
+        path = tmp_path / "config.json"
+        path.write_text("{")
+        with pytest.raises(json.JSONDecodeError):
+            settings.ConfigFile(path).load()
+
+        self.write(path, make_config(), 1000)
+        config_file = settings.ConfigFile(path)
+        first = config_file.load()
+        self.write(path, make_config(storage="csv"), 2000)
+        assert config_file.load() is first
+        path.write_text("{")
+        assert config_file.load() is first
+        # Not read again until it changes again.
+        assert not config_file.changed()
+        with monkeypatch.context() as patched:
+            patched.setattr(settings, "parse", None)
+            assert config_file.load() is first
+
+        self.write(path, make_config(storage="snapshot"), 3000)
+        assert config_file.load().general.storage == "snapshot"
+
+    def test_load_shared_per_path(self, tmp_path):
+        path = tmp_path / "config.json"
+        self.write(path, make_config(), 1000)
+        assert settings.load(path) is settings.load(str(path))
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+from amazon_wishlist_pricewatch import notify, replay, synthetic
+from amazon_wishlist_pricewatch.my_types import ParsedItem
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch, run_pass
+from amazon_wishlist_pricewatch.shared_cache import SharedWishlistCache, normalize_url
+
+WISHLIST_URL = "https://www.amazon.co.uk/hz/wishlist/ls/F1RSTL1ST"
+ITEMS = [
+    ParsedItem("Title", None, "7.0", "/dp/1/", "1"),
+    ParsedItem("Title 2", "by Author", "9.15", "/dp/2/", "2"),
+]
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://WWW.Amazon.co.uk/hz/wishlist/ls/F1RSTL1ST/") == (
+        WISHLIST_URL
+    )
+    assert normalize_url(WISHLIST_URL + "?ref_=wl_share#top") == WISHLIST_URL
+    assert normalize_url(WISHLIST_URL + "?sort=price&filter=all") == (
+        WISHLIST_URL + "?filter=all&sort=price"
+    )
+
+
+class TestSharedWishlistCache:
+    """Tests for shared_cache.SharedWishlistCache."""
+
+    def test_get_put(self, tmp_path):
+        cache = SharedWishlistCache(tmp_path, ttl_seconds=60)
+        assert cache.get(WISHLIST_URL) is None
+        cache.put(WISHLIST_URL + "?ref_=wl_share", ITEMS)
+
+        assert SharedWishlistCache(tmp_path).get(WISHLIST_URL) == ITEMS
+        assert cache.get(WISHLIST_URL + "?sort=price") is None
+        # Expired after the time to live.
+        assert SharedWishlistCache(tmp_path, ttl_seconds=-1).get(WISHLIST_URL) is None
+
+    def test_claim(self, tmp_path):
+        first = SharedWishlistCache(tmp_path)
+        second = SharedWishlistCache(tmp_path)
+        assert first.claim(WISHLIST_URL)
+        assert not second.claim(WISHLIST_URL)
+        # Only the holder can release a claim.
+        second.release(WISHLIST_URL)
+        assert not second.claim(WISHLIST_URL)
+        first.release(WISHLIST_URL)
+        assert second.claim(WISHLIST_URL)
+
+    def test_abandoned_claim_taken_over(self, tmp_path):
+        assert SharedWishlistCache(tmp_path).claim(WISHLIST_URL)
+        lock_path = next(tmp_path.glob("*.lock"))
+        old = time.time() - 3600
+        os.utime(lock_path, (old, old))
+        assert SharedWishlistCache(tmp_path, lock_timeout_seconds=60).claim(
+            WISHLIST_URL
+        )
+
+    def test_wait(self, tmp_path):
+        fetching = SharedWishlistCache(tmp_path)
+        waiting = SharedWishlistCache(tmp_path)
+        fetching.claim(WISHLIST_URL)
+
+        def share():
+            time.sleep(0.2)
+            fetching.put(WISHLIST_URL, ITEMS)
+            fetching.release(WISHLIST_URL)
+
+        thread = threading.Thread(target=share)
+        thread.start()
+        assert waiting.wait(WISHLIST_URL, poll_seconds=0.01) == ITEMS
+        thread.join()
+
+        # The claim isn't released in time.
+        fetching.claim(WISHLIST_URL + "/other")
+        assert waiting.wait(WISHLIST_URL + "/other", timeout=0.05) is None
+
+
+def test_run_pass_shares_wishlists(mock_config, block_notification_calls, tmp_path):
+    config = notify.get_config()
+    config["general"]["wishlist_url"] = "https://www.amazon.co.uk/hz/wishlist/ls/SH4R3D"
+    config["general"]["page_cache"] = "0"
+    config["fetch"] = {"requests_per_second": 1000}
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    with replay.ReplayServer(replay.synthetic_pages(30, pages=3)) as server:
+        config["fetch"]["base_url"] = server.url
+        first = PriceWatch(config, tmp_path / "first", tmp_path / "shared")
+        run_pass(first)
+        second = PriceWatch(config, tmp_path / "second", tmp_path / "shared")
+        run_pass(second)
+
+    assert server.stats["ok"] == 3
+    assert first.metrics.counters["pages"] == 3
+    assert second.metrics.counters["pages"] == 0
+    assert second.metrics.counters["shared_wishlists"] == 1
+    assert (
+        len(second.wishlist) == len(first.wishlist) == len(synthetic.expected_items(30))
+    )
+    assert not list((tmp_path / "shared").glob("*.lock"))
+
+
+def test_page_items_keyed_by_requested_url(
+    mock_config, wishlist_page_response, tmp_path
+):
+    pw = PriceWatch(shared_cache_dir=tmp_path / "shared")
+    # The last page of the wishlist, reached through a redirect.
+    redirect = type(wishlist_page_response)()
+    redirect.status_code = 301
+    redirect.url = WISHLIST_URL + "?ref_=shared#items"
+    wishlist_page_response.history = [redirect]
+    wishlist_page_response.url = WISHLIST_URL + "/redirected"
+    wishlist_page_response._content = wishlist_page_response.content.replace(
+        b"wl-see-more", b"wl-nothing-more"
+    )
+    pw.parse_page(wishlist_page_response)
+
+    items = pw.wishlist_items(WISHLIST_URL)
+    assert [item.asin for item in items] == ["B000000001", "B000000002", "B000000003"]
+    assert pw.wishlist_items(WISHLIST_URL + "/redirected") is None
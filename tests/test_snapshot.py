@@ -0,0 +1,185 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from amazon_wishlist_pricewatch import snapshot
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch, Wishlist
+
+TESTS_FOLDER = Path(__file__).parent.resolve()
+
+
+@pytest.fixture()
+def snapshot_man(tmp_path):
+    snapshot_man = snapshot.SnapshotManager(tmp_path / "wishlist_items.snapshot")
+    yield snapshot_man
+    snapshot_man.close()
+
+
+@pytest.fixture()
+def out_of_stock_items(example_wishlist_items):
+    example_wishlist_items["B00OUTOFSTK"] = {
+        "title": "Out of stock — £",
+        "byline": None,
+        "price": sys.maxsize,
+        "url": "/out/of/stock",
+        "asin": "B00OUTOFSTK",
+    }
+    return example_wishlist_items
+
+
+class TestSnapshot:
+    """Tests for snapshot.Snapshot."""
+
+    def test_round_trip(self, tmp_path, out_of_stock_items):
+        path = tmp_path / "items.snapshot"
+        snapshot.write_snapshot(
+            path, snapshot.encode_snapshot(out_of_stock_items.values())
+        )
+        snap = snapshot.Snapshot(path)
+
+        assert len(snap) == 3
+        assert list(snap) == sorted(out_of_stock_items)
+        assert snap.to_dict() == out_of_stock_items
+        assert dict(snap) == out_of_stock_items
+        snap.close()
+
+    def test_lookup(self, tmp_path, out_of_stock_items):
+        path = tmp_path / "items.snapshot"
+        snapshot.write_snapshot(
+            path, snapshot.encode_snapshot(out_of_stock_items.values())
+        )
+        snap = snapshot.Snapshot(path)
+
+        assert "2" in snap
+        assert "B00OUTOFST" not in snap
+        assert "Ä" not in snap
+        assert "X" * 20 not in snap
+        assert snap["2"] == out_of_stock_items["2"]
+        assert snap.get_item_price("B00OUTOFSTK") == sys.maxsize
+        assert snap.minor_price("2") == 1015
+        assert snap.minor_price("missing") is None
+        assert dict(snap.minor_prices()) == {
+            "1": 600,
+            "2": 1015,
+            "B00OUTOFSTK": sys.maxsize,
+        }
+        with pytest.raises(KeyError):
+            snap["missing"]
+        snap.close()
+
+    def test_empty(self, tmp_path):
+        path = tmp_path / "items.snapshot"
+        snapshot.write_snapshot(path, snapshot.encode_snapshot([]))
+        snap = snapshot.Snapshot(path)
+
+        assert snap.is_empty()
+        assert "1" not in snap
+        assert list(snap.minor_prices()) == []
+        snap.close()
+
+    def test_not_a_snapshot(self):
+        with pytest.raises(ValueError):
+            snapshot.Snapshot(Path(TESTS_FOLDER, "wishlist_items.json"))
+
+    def test_asin_too_long(self, example_wishlist_items):
+        example_wishlist_items["1"]["asin"] = "X" * (snapshot.ASIN_WIDTH + 1)
+        with pytest.raises(ValueError):
+            snapshot.encode_snapshot(example_wishlist_items.values())
+
+    def test_json_import_export(self, tmp_path):
+        snapshot.main(
+            [
+                "import",
+                str(Path(TESTS_FOLDER, "wishlist_items.json")),
+                str(tmp_path / "items.snapshot"),
+            ]
+        )
+        snapshot.main(
+            ["export", str(tmp_path / "items.snapshot"), str(tmp_path / "out.json")]
+        )
+
+        with open(Path(TESTS_FOLDER, "wishlist_items.json")) as f:
+            expected = json.load(f)
+        with open(tmp_path / "out.json") as f:
+            assert json.load(f) == expected
+
+
+class TestSnapshotManager:
+    """Tests for snapshot.SnapshotManager."""
+
+    def test_no_snapshot(self, snapshot_man):
+        assert snapshot_man.prev_wishlist == {}
+        assert snapshot_man.get_wishlist_dict() == {}
+        assert not snapshot_man.snapshot_path.exists()
+
+    def test_save(self, snapshot_man, example_wishlist_items):
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+
+        assert isinstance(snapshot_man.prev_wishlist, snapshot.Snapshot)
+        assert snapshot_man.get_wishlist_dict() == example_wishlist_items
+        reopened = snapshot.SnapshotManager(snapshot_man.snapshot_path)
+        assert reopened.get_wishlist_dict() == example_wishlist_items
+        reopened.close()
+
+    def test_unchanged_not_rewritten(self, snapshot_man, example_wishlist_items):
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        saved = snapshot_man.prev_wishlist
+        mtime = snapshot_man.snapshot_path.stat().st_mtime_ns
+
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        assert snapshot_man.prev_wishlist is saved
+        assert snapshot_man.snapshot_path.stat().st_mtime_ns == mtime
+
+        example_wishlist_items["1"]["price"] = "5.0"
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        assert snapshot_man.prev_wishlist is not saved
+        assert snapshot_man.prev_wishlist.get_item_price("1") == "5.0"
+
+    def test_unmapped_before_replaced(
+        self, snapshot_man, example_wishlist_items, monkeypatch
+    ):
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        saved = snapshot_man.prev_wishlist
+        write_snapshot = snapshot.write_snapshot
+
+        def unmapped_write_snapshot(path, data):
+            assert saved._mmap.closed
+            write_snapshot(path, data)
+
+        monkeypatch.setattr(snapshot, "write_snapshot", unmapped_write_snapshot)
+        example_wishlist_items["1"]["price"] = "5.0"
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        assert snapshot_man.prev_wishlist.get_item_price("1") == "5.0"
+
+    def test_get_lowest_prices(self, snapshot_man, example_wishlist_items):
+        assert snapshot_man.get_lowest_prices(["1"]) == ([], [], [])
+        assert snapshot_man.get_lowest_price("1") is None
+        snapshot_man.save_wishlist_json(Wishlist(example_wishlist_items))
+
+        assert snapshot_man.get_lowest_prices(["3", "2"]) == (["2"], [1015], ["1"])
+        assert snapshot_man.get_lowest_price("2") == "10.15"
+
+    def test_imports_json(self, tmp_path, example_wishlist_items):
+        with open(tmp_path / "wishlist_items.json", "w") as f:
+            json.dump(example_wishlist_items, f)
+
+        snapshot_man = snapshot.SnapshotManager(tmp_path / "wishlist_items.snapshot")
+        assert snapshot_man.snapshot_path.exists()
+        assert snapshot_man.get_wishlist_dict() == example_wishlist_items
+        snapshot_man.close()
+
+    def test_compare_prices(
+        self, snapshot_man, example_wishlist_items, mock_prev_wishlist, mock_config
+    ):
+        with open(Path(TESTS_FOLDER, "wishlist_items.json")) as f:
+            snapshot_man.save_wishlist_json(Wishlist(json.load(f)))
+        pw = PriceWatch()
+        pw.json_man = snapshot_man
+        pw.wishlist = Wishlist(example_wishlist_items)
+
+        cheaper_items = pw.compare_prices()
+        assert len(cheaper_items) == 1
+        assert cheaper_items[0]["price"] == "6.0"
+        assert pw.wishlist.get_item_price("2") == "9.15"
@@ -0,0 +1,119 @@
+import sys
+
+import pytest
+
+from amazon_wishlist_pricewatch.pricewatch import PriceWatch, Wishlist
+from amazon_wishlist_pricewatch.storage import SqliteManager
+
+
+@pytest.fixture()
+def sqlite_man(tmp_path):
+    sqlite_man = SqliteManager(tmp_path / "wishlist_items.sqlite3")
+    yield sqlite_man
+    sqlite_man.close()
+
+
+def count_changes(sqlite_man, func, *args):
+    """Return the number of rows written by ``func(*args)``."""
+    before = sqlite_man.connection.total_changes
+    func(*args)
+    return sqlite_man.connection.total_changes - before
+
+
+class TestSqliteManager:
+    """Tests for storage.SqliteManager."""
+
+    def test_empty_database(self, sqlite_man):
+        assert sqlite_man.get_wishlist_dict() == {}
+        assert sqlite_man.prev_wishlist == {}
+        assert sqlite_man.get_lowest_price("1") is None
+
+    def test_round_trip(self, sqlite_man, example_wishlist_items):
+        example_wishlist_items["3"] = {
+            "title": "Out of stock",
+            "byline": None,
+            "price": sys.maxsize,
+            "url": "/out/of/stock",
+            "asin": "3",
+        }
+        sqlite_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        assert sqlite_man.get_wishlist_dict() == example_wishlist_items
+        assert sqlite_man.get_lowest_price("3") == sys.maxsize
+
+        reopened = SqliteManager(sqlite_man.db_path)
+        assert reopened.prev_wishlist == example_wishlist_items
+        reopened.close()
+
+    def test_only_writes_changes(self, sqlite_man, wishlist_with_two_items):
+        sqlite_man.record_observations(wishlist_with_two_items)
+        assert (
+            count_changes(
+                sqlite_man, sqlite_man.save_wishlist_json, wishlist_with_two_items
+            )
+            == 4
+        )
+
+        # Nothing changed.
+        sqlite_man.record_observations(wishlist_with_two_items)
+        assert (
+            count_changes(
+                sqlite_man, sqlite_man.save_wishlist_json, wishlist_with_two_items
+            )
+            == 0
+        )
+
+        # One price changed: one item updated and one observation added.
+        wishlist_with_two_items.update_price("1", "6.5")
+        sqlite_man.record_observations(wishlist_with_two_items)
+        assert (
+            count_changes(
+                sqlite_man, sqlite_man.save_wishlist_json, wishlist_with_two_items
+            )
+            == 2
+        )
+        assert sqlite_man.get_lowest_price("1") == "6.5"
+        assert [price for _, price in sqlite_man.get_price_history("1")] == [
+            700,
+            650,
+        ]
+        assert [price for _, price in sqlite_man.get_price_history("2")] == [915]
+
+    def test_get_lowest_prices(self, sqlite_man, example_wishlist_items):
+        assert sqlite_man.get_lowest_prices(["1"]) == ([], [], [])
+        sqlite_man.save_wishlist_json(Wishlist(example_wishlist_items))
+
+        assert sqlite_man.get_lowest_prices(["3", "2"]) == (["2"], [1015], ["1"])
+        # Items removed from the wishlist aren't compared against.
+        wishlist = Wishlist()
+        wishlist.add_item(title="Test title 2", price="9.15", url="/p", asin="2")
+        sqlite_man.save_wishlist_json(wishlist)
+        assert sqlite_man.get_lowest_prices(["1", "2"]) == (["2"], [915], [])
+
+    def test_compare_prices(
+        self, sqlite_man, example_wishlist_items, mock_config, monkeypatch
+    ):
+        sqlite_man.save_wishlist_json(Wishlist(example_wishlist_items))
+        # Prices come from the one batched lookup, not a query per item.
+        monkeypatch.setattr(sqlite_man, "get_lowest_price", None)
+        pw = PriceWatch()
+        pw.json_man = sqlite_man
+        pw.wishlist = Wishlist()
+        pw.wishlist.add_item(title="Cheaper", price="5.0", url="/1", asin="1")
+        pw.wishlist.add_item(title="Dearer", price="11.0", url="/2", asin="2")
+
+        assert [item["asin"] for item in pw.compare_prices()] == ["1"]
+        # The lowest price is kept.
+        assert pw.wishlist.get_item_price("2") == "10.15"
+
+    def test_removed_items_kept_in_history(self, sqlite_man, wishlist_with_two_items):
+        sqlite_man.record_observations(wishlist_with_two_items)
+        sqlite_man.save_wishlist_json(wishlist_with_two_items)
+
+        wishlist = Wishlist()
+        wishlist.add_item(title="Test title 2", price="9.15", url="/p", asin="2")
+        sqlite_man.save_wishlist_json(wishlist)
+
+        assert list(sqlite_man.get_wishlist_dict()) == ["2"]
+        # The removed item's lowest price and history are still available.
+        assert sqlite_man.get_lowest_price("1") == "7.0"
+        assert len(sqlite_man.get_price_history("1")) == 1
@@ -0,0 +1,63 @@
+import sys
+
+import pytest
+import requests
+
+from amazon_wishlist_pricewatch import parsers, synthetic
+from amazon_wishlist_pricewatch.pricewatch import find_next_page_url
+
+
+class TestGenerateWishlist:
+    """Tests for synthetic.generate_wishlist."""
+
+    def test_parses_to_expected_items(self):
+        pages = synthetic.generate_wishlist(120, pages=4, seed=3, padding=1024)
+
+        parsed = []
+        failures = 0
+        for page in pages:
+            items, page_failures = parsers.parse_items(page.html)
+            parsed.extend(items)
+            failures += page_failures
+        expected = synthetic.expected_items(120, seed=3)
+        assert parsed == expected
+        assert failures == 120 - len(expected) > 0
+        assert any(item.price == sys.maxsize for item in expected)
+        assert any(not item.byline for item in expected)
+
+    @pytest.mark.parametrize("backend", parsers.PARSER_BACKENDS)
+    def test_backends_agree(self, backend):
+        if backend.endswith("lxml"):
+            pytest.importorskip("lxml")
+        for page in synthetic.generate_wishlist(40, pages=2, seed=5):
+            assert parsers.parse_items(page.html, backend) == parsers.parse_items(
+                page.html
+            )
+
+    def test_pages_linked_by_see_more(self):
+        pages = synthetic.generate_wishlist(
+            25, pages=3, base_url="http://127.0.0.1:8000"
+        )
+
+        for page in pages:
+            response = requests.Response()
+            response.url = page.url
+            response._content = page.html.encode("utf-8")
+            assert find_next_page_url(response) == page.next_url
+        assert [page.url for page in pages[1:]] == [
+            page.next_url for page in pages[:-1]
+        ]
+        assert pages[0].url.startswith("http://127.0.0.1:8000/hz/wishlist/ls/")
+        assert pages[-1].next_url is None
+
+    def test_same_seed_same_pages(self):
+        assert synthetic.generate_wishlist(10, seed=1) == synthetic.generate_wishlist(
+            10, seed=1
+        )
+        assert synthetic.generate_wishlist(10, seed=1) != synthetic.generate_wishlist(
+            10, seed=2
+        )
+
+    def test_invalid_pages(self):
+        with pytest.raises(ValueError):
+            synthetic.generate_wishlist(10, pages=0)
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from amazon_wishlist_pricewatch import replay, synthetic, tenants
+from amazon_wishlist_pricewatch.pricewatch import main
+
+
+@pytest.fixture(scope="module")
+def wishlist_server():
+    """Serve a synthetic wishlist on localhost, returning its first page URL."""
+    with replay.ReplayServer(replay.synthetic_pages(30, pages=2)) as server:
+        yield server.wishlist_url()
+
+
+def write_config(path, wishlist_url):
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "general": {
+                    "notification_mode": "",
+                    "wishlist_url": wishlist_url,
+                    "user_agent": "test_tenants",
+                    "send_test_notification": "0",
+                    "page_cache": "0",
+                },
+                "fetch": {"requests_per_second": "1000"},
+            },
+            f,
+        )
+
+
+run_tenant = tenants.run_tenant
+
+
+def crash_tenant(config_path, state_dir):
+    if config_path.stem == "crash":
+        os._exit(1)
+    return run_tenant(config_path, state_dir)
+
+
+class TestRunMany:
+    """Tests for tenants.run_many."""
+
+    def test_isolated_state(self, tmp_path, wishlist_server):
+        for tenant in ("alice", "bob"):
+            write_config(tmp_path / f"{tenant}.json", wishlist_server)
+
+        results = tenants.run_many(tmp_path, processes=2)
+
+        assert [result.tenant for result in results] == ["alice", "bob"]
+        expected = len(synthetic.expected_items(30))
+        for result in results:
+            assert result.ok and result.error is None
+            with open(tmp_path / "state" / result.tenant / "wishlist_items.json") as f:
+                assert len(json.load(f)) == expected
+        # The wishlist both watch is fetched by one and shared with the other.
+        assert sorted(result.counters["items_parsed"] for result in results) == [
+            0,
+            expected,
+        ]
+        assert sum(result.counters["shared_wishlists"] for result in results) == 1
+
+    def test_failures_isolated(self, tmp_path, wishlist_server, monkeypatch):
+        write_config(tmp_path / "good.json", wishlist_server)
+        write_config(tmp_path / "crash.json", wishlist_server)
+        write_config(tmp_path / "unfilled.json", "")
+        (tmp_path / "broken.json").write_text("{")
+        monkeypatch.setattr(tenants, "run_tenant", crash_tenant)
+
+        results = {
+            result.tenant: result
+            for result in tenants.run_many(tmp_path, tmp_path / "elsewhere")
+        }
+
+        assert results["good"].ok
+        assert (tmp_path / "elsewhere" / "good" / "wishlist_items.json").exists()
+        assert not results["crash"].ok
+        assert results["crash"].error == "Worker process crashed."
+        assert results["unfilled"].error.startswith("ValueError")
+        assert results["broken"].error.startswith("JSONDecodeError")
+        summary = tenants.summary(list(results.values()))
+        assert summary.startswith("4 tenants: 1 succeeded, 3 failed.")
+
+    def test_cli_exit_status(self, tmp_path, wishlist_server):
+        write_config(tmp_path / "good.json", wishlist_server)
+        main(["run-many", str(tmp_path), "--processes", "1"])
+
+        write_config(tmp_path / "unfilled.json", "")
+        with pytest.raises(SystemExit) as exc_info:
+            main(["run-many", str(tmp_path), "--processes", "1"])
+        assert exc_info.value.code == 1